@@ -0,0 +1,41 @@
+# benchmarks/bench_preprocess.py
+"""
+Show that preprocess_expression scales linearly with input length.
+
+Builds expressions that mix every rewrite (factorials, '^', implicit
+multiplication, pi/e, a trailing '=') and times them at growing sizes.
+The time per character should stay roughly flat.
+
+    python benchmarks/bench_preprocess.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from lemma_calc.preprocessor import preprocess_expression  # noqa: E402
+
+CHUNK = "3(2+1)! + 2pi^2 - (4)5! + sqrt(9)! * e + "
+
+
+def build_expression(length):
+    """Repeat CHUNK until the expression is about `length` characters."""
+    repeats = max(1, length // len(CHUNK))
+    return CHUNK * repeats + "1 ="
+
+
+def main():
+    print(f"{'chars':>10} {'seconds':>10} {'ns/char':>10}")
+    for length in (1_000, 10_000, 100_000, 1_000_000):
+        expr = build_expression(length)
+        runs = max(1, 200_000 // length)
+        seconds = min(
+            timeit.repeat(lambda: preprocess_expression(expr), number=runs, repeat=3)
+        ) / runs
+        print(f"{len(expr):>10} {seconds:>10.5f} {seconds / len(expr) * 1e9:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
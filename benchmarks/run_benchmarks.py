@@ -0,0 +1,433 @@
+# benchmarks/run_benchmarks.py
+"""
+Benchmark suite for the whole evaluation pipeline.
+
+Times each stage on its own (preprocess_expression, ast.parse, safe_eval
+and the compiled engine, format_result, load_history/save_history) and
+end to end (evaluate_expression, batch mode, the REPL statement loop)
+over synthetic workloads: short expressions, very long expressions, many
+variables, huge integers and large histories. Workloads are generated
+from a fixed seed, so runs are comparable across machines and commits.
+
+Results are written as JSON. With --compare, each benchmark is checked
+against a saved baseline and anything slower by more than --threshold
+is reported as a regression (exit status 1).
+
+    python benchmarks/run_benchmarks.py --output baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json
+    python benchmarks/run_benchmarks.py --filter history --quick
+"""
+
+import argparse
+import ast
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from lemma_calc import core  # noqa: E402
+from lemma_calc.batch import run_batch  # noqa: E402
+from lemma_calc.constants import VERSION  # noqa: E402
+from lemma_calc.core import (  # noqa: E402
+    compile_expression,
+    evaluate_expression,
+    format_result,
+    process_assignment,
+    safe_eval,
+)
+from lemma_calc.history import HistoryLog, load_history, save_history  # noqa: E402
+from lemma_calc.preprocessor import preprocess_expression  # noqa: E402
+
+SEED = 1234
+# Minimum wall time per timing repeat; loops are scaled up to reach it
+MIN_TIME = 0.2
+REPEAT = 5
+DEFAULT_THRESHOLD = 0.10
+
+# Terms in the "very long" expressions. Compiling and evaluating use
+# fewer: those stages recurse per operator, and about 500 chained terms
+# reach Python's default recursion limit.
+LONG_TERMS = 2000
+LONG_EVAL_TERMS = 400
+
+FUNCTIONS = ["sin", "cos", "sqrt", "log", "exp", "abs", "floor"]
+SHORT_TEMPLATES = [
+    "{a} + {b} * {c}",
+    "({a} + {b})^2 - {c}",
+    "sqrt({a}) + {b}!",
+    "2pi * {a} / {b}",
+    "{f}({a}) * {c} + e",
+    "3({a} + {b}) - {c} % 7",
+]
+
+
+def short_expressions(rng, count=200):
+    exprs = []
+    for _ in range(count):
+        template = rng.choice(SHORT_TEMPLATES)
+        exprs.append(
+            template.format(
+                a=rng.randint(1, 99),
+                b=rng.randint(1, 9),
+                c=rng.randint(1, 999),
+                f=rng.choice(FUNCTIONS),
+            )
+        )
+    return exprs
+
+
+def long_expression(rng, terms=LONG_TERMS):
+    # Terms read x and y so the optimizer cannot fold the whole thing
+    parts = []
+    for _ in range(terms):
+        parts.append(
+            rng.choice(
+                [
+                    f"{rng.randint(1, 99)}*{rng.choice(FUNCTIONS)}(x)",
+                    f"(x+{rng.randint(1, 9)})^2",
+                    f"{rng.randint(1, 9)}!y",
+                    f"{rng.randint(1, 999)}/(y+{rng.randint(1, 9)})",
+                    "2pi x",
+                ]
+            )
+        )
+    return " + ".join(parts)
+
+
+LONG_VARIABLES = {"x": 1.25, "y": 3}
+
+
+def many_variables(rng, count=10_000):
+    return {f"v{i}": rng.uniform(-100, 100) for i in range(count)}
+
+
+def variable_expressions(rng, names, count=200):
+    return [
+        " + ".join(f"{rng.randint(1, 9)}*{rng.choice(names)}" for _ in range(8))
+        for _ in range(count)
+    ]
+
+
+def history_entries(rng, count):
+    exprs = short_expressions(rng, 500)
+    return [
+        ["2024-01-01 00:00:00", exprs[i % len(exprs)], str(rng.randint(0, 10**9))]
+        for i in range(count)
+    ]
+
+
+# Each benchmark is a function taking the RNG and returning
+# (callable, operations per call); the callable is timed repeatedly.
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+@benchmark("preprocess.short")
+def bench_preprocess_short(rng):
+    exprs = short_expressions(rng)
+    return lambda: [preprocess_expression(e) for e in exprs], len(exprs)
+
+
+@benchmark("preprocess.long")
+def bench_preprocess_long(rng):
+    expr = long_expression(rng)
+    return lambda: preprocess_expression(expr), 1
+
+
+@benchmark("parse.short")
+def bench_parse_short(rng):
+    sources = [preprocess_expression(e) for e in short_expressions(rng)]
+    return lambda: [ast.parse(s, mode="eval") for s in sources], len(sources)
+
+
+@benchmark("parse.long")
+def bench_parse_long(rng):
+    source = preprocess_expression(long_expression(rng))
+    return lambda: ast.parse(source, mode="eval"), 1
+
+
+@benchmark("safe_eval.short")
+def bench_safe_eval_short(rng):
+    trees = [compile_expression(e).tree for e in short_expressions(rng)]
+    return lambda: [safe_eval(t, {}) for t in trees], len(trees)
+
+
+@benchmark("safe_eval.long")
+def bench_safe_eval_long(rng):
+    tree = compile_expression(long_expression(rng, LONG_EVAL_TERMS)).tree
+    return lambda: safe_eval(tree, LONG_VARIABLES), 1
+
+
+@benchmark("compiled.long")
+def bench_compiled_long(rng):
+    run = compile_expression(long_expression(rng, LONG_EVAL_TERMS)).run
+    return lambda: run(LONG_VARIABLES), 1
+
+
+@benchmark("safe_eval.many_variables")
+def bench_safe_eval_variables(rng):
+    variables = many_variables(rng)
+    exprs = variable_expressions(rng, list(variables))
+    trees = [compile_expression(e).tree for e in exprs]
+    return lambda: [safe_eval(t, variables) for t in trees], len(trees)
+
+
+@benchmark("compiled.short")
+def bench_compiled_short(rng):
+    runs = [compile_expression(e).run for e in short_expressions(rng)]
+    return lambda: [run({}) for run in runs], len(runs)
+
+
+@benchmark("compiled.many_variables")
+def bench_compiled_variables(rng):
+    variables = many_variables(rng)
+    exprs = variable_expressions(rng, list(variables))
+    runs = [compile_expression(e).run for e in exprs]
+    return lambda: [run(variables) for run in runs], len(runs)
+
+
+@benchmark("format_result.small")
+def bench_format_small(rng):
+    values = [rng.uniform(-1e6, 1e6) for _ in range(500)]
+    values += [rng.randint(-(10**12), 10**12) for _ in range(500)]
+    return lambda: [format_result(v) for v in values], len(values)
+
+
+@benchmark("format_result.huge_int")
+def bench_format_huge(rng):
+    # Just under Python's default int -> str digit limit
+    value = rng.getrandbits(14_000)
+    return lambda: format_result(value), 1
+
+
+@benchmark("evaluate.huge_int")
+def bench_evaluate_huge(rng):
+    exprs = ["2^n % 1000007", "factorial(m) % 997", "(7^m) * (3^m) % 11"]
+    variables = {"n": 100_000, "m": 3000}
+    return lambda: [evaluate_expression(e, variables) for e in exprs], len(exprs)
+
+
+@benchmark("evaluate.short")
+def bench_evaluate_short(rng):
+    exprs = short_expressions(rng)
+    return lambda: [evaluate_expression(e, {}) for e in exprs], len(exprs)
+
+
+@benchmark("compile.long")
+def bench_compile_long(rng):
+    expr = long_expression(rng, LONG_EVAL_TERMS)
+
+    def run():
+        core.clear_compile_cache()
+        compile_expression(expr)
+
+    return run, 1
+
+
+@benchmark("evaluate.uncached")
+def bench_evaluate_uncached(rng):
+    exprs = short_expressions(rng)
+
+    def run():
+        core.clear_compile_cache()
+        for e in exprs:
+            evaluate_expression(e, {})
+
+    return run, len(exprs)
+
+
+@benchmark("batch.throughput")
+def bench_batch(rng):
+    lines = ["x = 3", "y = x^2 + 1"] + short_expressions(rng, 2000)
+    lines += [f"x * {i} + y" for i in range(2000)]
+    text = "\n".join(lines) + "\n"
+
+    def run():
+        run_batch(io.StringIO(text), out=io.StringIO())
+
+    return run, len(lines)
+
+
+@benchmark("repl.statement_loop")
+def bench_repl(rng):
+    # The per-statement work of main.main() without the terminal:
+    # assignment handling, evaluation, formatting and the history append
+    statements = ["x = 3"] + short_expressions(rng, 500)
+    path = "repl-history.jsonl"
+
+    def run():
+        variables = {}
+        history = HistoryLog(path, legacy_path=None)
+        for expr in statements:
+            assignment_result = process_assignment(expr, variables)
+            if assignment_result is not None:
+                history.append(expr, assignment_result)
+            else:
+                formatted = format_result(evaluate_expression(expr, variables))
+                history.append(expr, formatted)
+        history.close()
+        os.remove(path)
+
+    return run, len(statements)
+
+
+@benchmark("history.save")
+def bench_history_save(rng):
+    entries = history_entries(rng, 100_000)
+    path = "saved-history.jsonl"
+    return lambda: save_history(entries, path), len(entries)
+
+
+@benchmark("history.load")
+def bench_history_load(rng):
+    entries = history_entries(rng, 100_000)
+    path = "loaded-history.jsonl"
+    save_history(entries, path)
+    return lambda: load_history(path=path), len(entries)
+
+
+@benchmark("history.load_tail")
+def bench_history_tail(rng):
+    entries = history_entries(rng, 100_000)
+    path = "tail-history.jsonl"
+    save_history(entries, path)
+    return lambda: load_history(limit=20, path=path), 20
+
+
+def time_benchmark(func, ops, repeat=REPEAT, min_time=MIN_TIME):
+    """Return the best seconds per operation over `repeat` timings."""
+    timer = timeit.Timer(func)
+    loops, elapsed = timer.autorange()
+    if elapsed < min_time:
+        loops = max(1, int(loops * min_time / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=repeat, number=loops)) / loops
+    return best / ops, loops
+
+
+def run_benchmarks(names, repeat=REPEAT, min_time=MIN_TIME):
+    results = {}
+    # The history benchmarks write their logs to the working directory:
+    # run in a temporary one, removed with everything in it afterwards
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="lemma-bench-") as directory:
+        os.chdir(directory)
+        try:
+            for name in names:
+                rng = random.Random(f"{SEED}:{name}")
+                func, ops = BENCHMARKS[name](rng)
+                seconds, loops = time_benchmark(func, ops, repeat, min_time)
+                results[name] = {
+                    "seconds_per_op": seconds,
+                    "ops_per_second": 1 / seconds if seconds else None,
+                    "ops": ops,
+                    "loops": loops,
+                    "repeat": repeat,
+                }
+                print(
+                    f"{name:<28} {seconds * 1e6:>12.2f} µs/op "
+                    f"{1 / seconds:>14,.0f} ops/s",
+                    file=sys.stderr,
+                )
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare `results` against a baseline run. Returns a list of
+    (name, baseline seconds, current seconds, ratio) for benchmarks
+    slower than the baseline by more than `threshold`.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<28} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, current in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            print(f"{name:<28} {'-':>12} {current['seconds_per_op'] * 1e6:>10.2f}µs")
+            continue
+        ratio = current["seconds_per_op"] / before["seconds_per_op"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(
+                (name, before["seconds_per_op"], current["seconds_per_op"], ratio)
+            )
+        print(
+            f"{name:<28} {before['seconds_per_op'] * 1e6:>10.2f}µs "
+            f"{current['seconds_per_op'] * 1e6:>10.2f}µs {ratio - 1:>+8.1%}{flag}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LemmaCalc benchmark suite")
+    parser.add_argument("--output", "-o", help="Write results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Baseline JSON file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Slowdown ratio counted as a regression (default: {DEFAULT_THRESHOLD})",
+    )
+    parser.add_argument("--filter", "-k", help="Only run benchmarks containing this")
+    parser.add_argument(
+        "--quick", action="store_true", help="Fewer, shorter repeats (noisier)"
+    )
+    parser.add_argument("--list", action="store_true", help="List benchmark names")
+    args = parser.parse_args(argv)
+
+    names = [n for n in BENCHMARKS if not args.filter or args.filter in n]
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    repeat, min_time = (2, 0.05) if args.quick else (REPEAT, MIN_TIME)
+    report = {
+        "meta": {
+            "lemmacalc_version": VERSION,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seed": SEED,
+        },
+        "results": run_benchmarks(names, repeat, min_time),
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    elif not args.compare:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+            return 1
+        print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1 +1,10 @@
-from .main import main
+import importlib
+
+
+def __getattr__(name):
+    # Import the REPL lazily so headless use doesn't load prompt_toolkit
+    if name == "main":
+        main = importlib.import_module(".main", __name__).main
+        globals()["main"] = main
+        return main
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
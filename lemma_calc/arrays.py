@@ -0,0 +1,356 @@
+# lemma_calc/arrays.py
+
+import ast
+import re
+import sys
+from importlib.util import find_spec
+from .constants import allowed_names, allowed_operators
+from .guards import guarded_mul, guarded_pow
+
+# NumPy is optional, and imported when the first array is built (see
+# load_numpy): it takes longer to import than the whole calculator
+_NUMPY_INSTALLED = find_spec("numpy") is not None
+numpy_loaded = False
+
+# np.ndarray once NumPy is loaded: no value can be an array before that.
+# Looked up on every arithmetic operation, so bound once
+_ndarray = ()
+
+# Vectors with more elements are shown with their middle elided
+ARRAY_DISPLAY_LIMIT = 1000
+
+# Integer results whose float64 estimate reaches this may not fit in
+# int64 (the margin covers the estimate's rounding)
+_INT64_LIMIT = 2.0**63 - 2**14
+
+# allowed_names entries with a direct NumPy ufunc equivalent
+ufunc_names = {
+    "abs": "absolute",
+    "sin": "sin",
+    "cos": "cos",
+    "tan": "tan",
+    "asin": "arcsin",
+    "acos": "arccos",
+    "atan": "arctan",
+    "degrees": "degrees",
+    "radians": "radians",
+    "log10": "log10",
+    "sqrt": "sqrt",
+    "exp": "exp",
+    "floor": "floor",
+    "ceil": "ceil",
+}
+
+_NO_NUMPY = "Vector error: vectors and matrices need NumPy (pip install numpy)."
+
+
+def load_numpy():
+    """Import NumPy on first use and return it (None if it isn't installed)."""
+    global np, numpy_loaded, _ndarray
+    if not numpy_loaded:
+        try:
+            import numpy
+        except ImportError:  # Vector literals then raise
+            numpy = None
+        np = numpy
+        if numpy is not None:
+            _ndarray = numpy.ndarray
+        numpy_loaded = True
+    return np
+
+
+def __getattr__(name):
+    # `arrays.np` is NumPy, loaded on first use
+    if name == "np":
+        return load_numpy()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def is_array(value):
+    """Whether `value` is a vector or matrix (a NumPy array)."""
+    return isinstance(value, _ndarray)
+
+
+def _scalar(value):
+    """Python number for 0-d results (sums, dot products), else the array."""
+    if np.ndim(value) == 0:
+        return value.item() if hasattr(value, "item") else value
+    return value
+
+
+def _asarray(value):
+    if load_numpy() is None:
+        raise ValueError(_NO_NUMPY)
+    return np.asarray(value)
+
+
+def _operand(value):
+    """Python integers past int64 become floats, as they do in literals."""
+    if type(value) is int and not -(2**63) <= value < 2**63:
+        return float(value)
+    return value
+
+
+def _is_integer(left, right):
+    return np.result_type(left, right).kind in "biu"
+
+
+def make_array(items):
+    """
+    Build the array for a literal such as [1, 2, 3] or [[1, 2], [3, 4]].
+
+    - Elements are packed into one contiguous int64 or float64 buffer
+      (integers too large for int64 make it float64).
+    - The array is read-only, so a literal compiled once can be returned
+      by every evaluation, and assigning it to a variable shares it
+      rather than copying it.
+    """
+    if load_numpy() is None:
+        raise ValueError(_NO_NUMPY)
+    try:
+        array = np.array(items)
+    except ValueError:
+        raise ValueError("Vector error: rows must all have the same length.")
+    if array.dtype.kind not in "biuf":
+        try:
+            array = array.astype(np.float64)
+        except (OverflowError, TypeError, ValueError):
+            raise ValueError("Vector error: elements must be numbers.")
+    array.flags.writeable = False
+    return array
+
+
+def format_array(array):
+    """
+    One line, nested like the literal: [[1, 2], [3, 4.5]]. Batch output,
+    the history and the server all expect a result to fit on one line.
+    """
+
+    def number(value):
+        if value.is_integer() and abs(value) < 1e16:
+            return str(int(value))
+        return repr(float(value))
+
+    text = np.array2string(
+        array,
+        max_line_width=sys.maxsize,
+        separator=", ",
+        threshold=ARRAY_DISPLAY_LIMIT,
+        formatter={"bool": str, "int": str, "float_kind": number},
+    )
+    return re.sub(r"\n\s*", " ", text)
+
+
+def _integer_safe(ufunc, left, right):
+    """
+    ufunc(left, right) for arrays. Integer results that would wrap
+    around in int64 are computed in float64 instead, like literals with
+    integers too large for int64.
+    """
+    left = _operand(left)
+    right = _operand(right)
+    if not _is_integer(left, right):
+        return ufunc(left, right)
+    estimate = ufunc(left, right, dtype=np.float64)
+    if np.all(np.abs(estimate) < _INT64_LIMIT):
+        return ufunc(left, right)
+    return estimate
+
+
+def _product_safe(func, left, right):
+    """
+    Matrix or dot product `func` of arrays; integer products whose sums
+    could pass int64 are computed in float64 instead.
+    """
+    if not _is_integer(left, right):
+        return func(left, right)
+    left_floats = left.astype(np.float64)
+    right_floats = right.astype(np.float64)
+    bound = func(np.abs(left_floats), np.abs(right_floats))
+    if np.all(bound < _INT64_LIMIT):
+        return func(left, right)
+    return func(left_floats, right_floats)
+
+
+def add(left, right):
+    """'+', without int64 wraparound for arrays."""
+    if isinstance(left, _ndarray) or isinstance(right, _ndarray):
+        return _integer_safe(np.add, left, right)
+    return left + right
+
+
+def subtract(left, right):
+    """'-', without int64 wraparound for arrays."""
+    if isinstance(left, _ndarray) or isinstance(right, _ndarray):
+        return _integer_safe(np.subtract, left, right)
+    return left - right
+
+
+def multiply(left, right):
+    """guarded_mul for numbers, a product without int64 wraparound for arrays."""
+    if isinstance(left, _ndarray) or isinstance(right, _ndarray):
+        return _integer_safe(np.multiply, left, right)
+    return guarded_mul(left, right)
+
+
+def array_power(left, right):
+    """
+    Power for arrays. Integer arrays go through float_power so negative
+    exponents and large results don't wrap around like int64 would.
+    """
+    left = np.asarray(_operand(left))
+    right = np.asarray(_operand(right))
+    if left.dtype.kind in "iu" and right.dtype.kind in "iu":
+        result = np.float_power(left, right)
+        if np.all(right >= 0) and np.all(np.abs(result) < 2**53):
+            return result.astype(np.int64)
+        return result
+    return np.power(left, right)
+
+
+def power(base, exponent):
+    """guarded_pow for numbers, an element-wise power for arrays."""
+    if isinstance(base, _ndarray) or isinstance(exponent, _ndarray):
+        return array_power(base, exponent)
+    return guarded_pow(base, exponent)
+
+
+def _checked_division(ufunc, left, right):
+    """
+    ufunc(left, right) for arrays; a zero divisor anywhere raises
+    ZeroDivisionError like dividing a number does, instead of filling
+    the result with inf, nan or 0.
+    """
+    left = _operand(left)
+    right = _operand(right)
+    if np.any(np.asarray(right) == 0):
+        raise ZeroDivisionError("division by zero")
+    with np.errstate(all="raise"):
+        try:
+            return ufunc(left, right)
+        except FloatingPointError as fpe:
+            raise ValueError(f"Math error: {fpe}")
+
+
+def divide(left, right):
+    """True division, raising ZeroDivisionError for arrays too."""
+    if isinstance(left, _ndarray) or isinstance(right, _ndarray):
+        return _checked_division(np.true_divide, left, right)
+    return left / right
+
+
+def mod(left, right):
+    """'%', raising ZeroDivisionError for arrays too."""
+    if isinstance(left, _ndarray) or isinstance(right, _ndarray):
+        return _checked_division(np.mod, left, right)
+    return left % right
+
+
+def _math_function(func, ufunc):
+    """
+    Apply math function `func` to numbers and `ufunc` (a NumPy function
+    name, or a function) element by element to arrays, failing like
+    `func` does for values outside its domain.
+    """
+
+    def apply(value, *args):
+        if not isinstance(value, _ndarray):
+            return func(value, *args)
+        vector = getattr(np, ufunc) if isinstance(ufunc, str) else ufunc
+        with np.errstate(all="raise"):
+            try:
+                return vector(value, *args)
+            except FloatingPointError as fpe:
+                if "overflow" in str(fpe):
+                    raise OverflowError("math range error")
+                raise ValueError("math domain error")
+
+    apply.__name__ = apply.__qualname__ = func.__name__
+    apply.__doc__ = func.__doc__
+    return apply
+
+
+def _log(x, base=None):
+    if base is None:
+        return np.log(x)
+    return np.log(x) / np.log(base)
+
+
+def matmul(left, right):
+    """The '@' operator: matrix product, or dot product of two vectors."""
+    left = _asarray(left)
+    right = _asarray(right)
+    if left.ndim == 0 or right.ndim == 0:
+        raise ValueError("Vector error: '@' needs vectors or matrices.")
+    try:
+        return _scalar(_product_safe(np.matmul, left, right))
+    except ValueError:
+        raise ValueError(
+            f"Vector error: shapes {left.shape} and {right.shape} "
+            f"don't match for '@'."
+        )
+
+
+def _linalg(func, matrix):
+    matrix = _asarray(matrix)
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError("Vector error: needs a square matrix.")
+    try:
+        return func(matrix)
+    except np.linalg.LinAlgError as e:
+        if "singular" in str(e).lower():
+            raise ValueError("Math error: the matrix is singular.")
+        raise ValueError(f"Math error: {e}")
+
+
+def dot(left, right):
+    """Dot product of two vectors (the matrix product for matrices)."""
+    left = _asarray(left)
+    right = _asarray(right)
+    try:
+        return _scalar(_product_safe(np.dot, left, right))
+    except ValueError:
+        raise ValueError(
+            f"Vector error: shapes {left.shape} and {right.shape} "
+            f"don't match for dot()."
+        )
+
+
+def det(matrix):
+    """Determinant, an integer for integer matrices."""
+    value = float(_linalg(np.linalg.det, matrix))
+    if np.asarray(matrix).dtype.kind in "biu" and abs(value) < 2**53:
+        # The LU factorization rounds; an integer matrix has an integer
+        # determinant
+        return int(round(value))
+    return value
+
+
+def inv(matrix):
+    """Inverse of a square matrix."""
+    return _linalg(np.linalg.inv, matrix)
+
+
+allowed_names.update(
+    {
+        "dot": dot,
+        "det": det,
+        "inv": inv,
+    }
+)
+allowed_operators[ast.MatMult] = matmul
+if _NUMPY_INSTALLED:
+    allowed_operators.update(
+        {
+            ast.Add: add,
+            ast.Sub: subtract,
+            ast.Mult: multiply,
+            ast.Div: divide,
+            ast.Mod: mod,
+            ast.Pow: power,
+        }
+    )
+    for name, ufunc in ufunc_names.items():
+        if name != "abs":  # abs() already takes arrays
+            allowed_names[name] = _math_function(allowed_names[name], ufunc)
+    allowed_names["log"] = _math_function(allowed_names["log"], _log)
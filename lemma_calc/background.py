@@ -0,0 +1,140 @@
+# lemma_calc/background.py
+
+import queue
+import threading
+import time
+from . import core
+from .guards import cancellable
+
+_STOP = object()
+
+
+class Job:
+    """One line of REPL input, queued or running on its own thread."""
+
+    __slots__ = ("text", "func", "args", "started", "cancelled")
+
+    def __init__(self, text, func, args):
+        self.text = text
+        self.func = func
+        self.args = args
+        self.started = None
+        # Set by BackgroundEvaluator.cancel(); the job's own, so a late
+        # cancellation never reaches the next job
+        self.cancelled = threading.Event()
+
+    def run(self):
+        try:
+            with cancellable(self.cancelled):
+                self.func(*self.args)
+        except KeyboardInterrupt:
+            print(f"Cancelled: {self.text}")
+        except Exception as e:
+            print(f"Unexpected error: {e}")
+
+
+class BackgroundEvaluator:
+    """
+    Runs REPL input in the background, one job at a time in the order
+    submitted, so the prompt stays responsive: the user can keep typing
+    (new input queues behind the running job) and cancel with Ctrl-C.
+
+    Jobs run on a dispatcher thread. cancel() stops the running job and
+    drops the queued ones. Cancellation is cooperative: it sets the
+    job's event, and the evaluation raises KeyboardInterrupt at its next
+    guards.check_cancelled() (between integrand samples, root-finding
+    steps, table rows and user function calls), never in the middle of
+    updating the variables, the spreadsheet graph or the history. A
+    single long call into C (factorial of a huge number) finishes first;
+    with a sandbox (--sandbox) its worker process is killed instead,
+    which stops any evaluation at once.
+
+    A cancelled job prints "Cancelled: <input>"; other output of the
+    jobs is printed as it happens (the REPL patches stdout so it appears
+    above the prompt).
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._changed = threading.Condition()
+        self._running = None
+        # Jobs submitted and not finished or dropped yet
+        self._pending = 0
+        self._thread = threading.Thread(
+            target=self._loop, name="lemma-dispatcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, text, func, *args):
+        """Queue `func(*args)` for the input line `text`; return the Job."""
+        job = Job(text, func, args)
+        with self._changed:
+            self._pending += 1
+        self._queue.put(job)
+        return job
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+            with self._changed:
+                if not job.cancelled.is_set():
+                    job.started = time.perf_counter()
+                    self._running = job
+            if job.started is not None:
+                job.run()
+            with self._changed:
+                self._running = None
+                self._pending -= 1
+                self._changed.notify_all()
+
+    def busy(self):
+        """Whether a job is running or queued."""
+        return self._pending > 0
+
+    def status(self):
+        """
+        One line describing the running job, its elapsed time and the
+        number of queued jobs, or "" when idle.
+        """
+        job = self._running
+        if job is None:
+            return ""
+        elapsed = time.perf_counter() - job.started
+        text = job.text if len(job.text) <= 40 else job.text[:37] + "..."
+        state = "stopping" if job.cancelled.is_set() else "evaluating"
+        queued = self._pending - 1
+        more = f" (+{queued} queued)" if queued > 0 else ""
+        return f" {state} {text}  {elapsed:.1f}s{more}  [Ctrl-C cancels]"
+
+    def cancel(self):
+        """
+        Stop the running job and drop the queued ones. Returns the input
+        line of the job stopped, or None if none was running.
+        """
+        with self._changed:
+            # Queued jobs are skipped when their turn comes
+            with self._queue.mutex:
+                for job in self._queue.queue:
+                    if job is not _STOP:
+                        job.cancelled.set()
+            job = self._running
+            if job is None or job.cancelled.is_set():
+                return None
+            job.cancelled.set()
+            sandbox = core.sandbox()
+            if sandbox is not None:
+                sandbox.cancel()
+        return job.text
+
+    def wait(self, timeout=None):
+        """Wait until every submitted job is done; False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=1.0):
+        """Cancel what is left and stop (waiting up to `timeout` seconds)."""
+        self.cancel()
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
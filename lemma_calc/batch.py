@@ -0,0 +1,127 @@
+# lemma_calc/batch.py
+
+import json
+import math
+import sys
+from .arrays import is_array
+from .core import (
+    evaluate_expression,
+    format_result,
+    process_assignment,
+    remember_result,
+    split_assignment,
+)
+
+BATCH_FORMATS = ("text", "jsonl")
+
+
+def split_statements(line):
+    """Split one input line into its ';'-separated statements."""
+    return [expr.strip() for expr in line.split(";") if expr.strip()]
+
+
+def _json_value(value):
+    """
+    Numbers JSON can represent exactly; inf/nan become null, vectors and
+    matrices (nested) lists.
+    """
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if is_array(value):
+        value = value.tolist()
+    if isinstance(value, list):
+        return [_json_value(item) for item in value]
+    return value
+
+
+def dump_record(record):
+    try:
+        return json.dumps(record)
+    except ValueError:
+        # Integer too large for str(); the formatted result is still there
+        record["value"] = None
+        return json.dumps(record)
+
+
+def evaluate_statement(
+    expr, variables, assign=process_assignment, evaluate=evaluate_expression
+):
+    """
+    Evaluate one statement (assignment or expression) against `variables`.
+    The value is bound to `ans` and `_` for the next statement.
+    `assign(expr, variables)` and `evaluate(expr, variables)` do the work
+    (calculator.Calculator passes its own).
+
+    Returns:
+        dict: {"expr", "result"} for assignments, {"expr", "result",
+        "value"} for expressions or {"expr", "error"} on failure.
+    """
+    record = {"expr": expr}
+    try:
+        assignment_result = assign(expr, variables)
+        if assignment_result is not None:
+            record["result"] = assignment_result
+            assignment = split_assignment(expr)
+            if assignment is not None:  # else it defined a function
+                remember_result(variables, variables[assignment[0]])
+        else:
+            result = evaluate(expr, variables)
+            record["result"] = format_result(result)
+            record["value"] = _json_value(result)
+            remember_result(variables, result)
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+def run_batch(stream, out=None, fmt="text", variables=None, graph=None):
+    """
+    Evaluate every statement in `stream` and write one result per line.
+
+    Args:
+        stream: Iterable of input lines (file, sys.stdin, list of str).
+        out: Writable text stream (default: sys.stdout).
+        fmt (str): "text" writes the formatted result (or "Error: ...");
+            "jsonl" writes one JSON object per statement.
+        variables (dict): Variables to start from, updated in place
+            (default: a new empty dict).
+        graph (DependencyGraph): Spreadsheet formulas of `variables`
+            (a restored session's), kept up to date by assignments;
+            None when spreadsheet mode is off.
+
+    Variables assigned earlier in the stream are visible to later
+    statements. Output is flushed after each input line so the calculator
+    can sit in the middle of a shell pipeline.
+
+    Returns:
+        int: The number of statements that failed.
+    """
+    if fmt not in BATCH_FORMATS:
+        raise ValueError(f"Unknown batch format '{fmt}'")
+    if out is None:
+        out = sys.stdout
+
+    if variables is None:
+        variables = {}
+    assign = process_assignment
+    if graph is not None:
+
+        def assign(expr, variables):
+            return process_assignment(expr, variables, graph)
+
+    errors = 0
+    write = out.write
+    for line in stream:
+        for expr in split_statements(line):
+            record = evaluate_statement(expr, variables, assign)
+            if "error" in record:
+                errors += 1
+
+            if fmt == "jsonl":
+                write(dump_record(record) + "\n")
+            elif "error" in record:
+                write(f"Error: {record['error']}\n")
+            else:
+                write(record["result"] + "\n")
+        out.flush()
+    return errors
@@ -0,0 +1,155 @@
+# lemma_calc/bignum.py
+
+import decimal
+
+# Display modes for integers longer than BIG_INT_DIGITS:
+# - "sci":   scientific notation plus the digit count
+# - "trunc": first and last digits plus the digit count
+# - "full":  every digit (converted in subquadratic time)
+BIGNUM_MODES = ("sci", "trunc", "full")
+
+# Integers with more digits than this get the compact display
+BIG_INT_DIGITS = 100
+# Significant digits shown in "sci" mode and at each end in "trunc" mode
+SHOWN_DIGITS = 20
+
+# Exact conversion: below this many bits Decimal(int) is fast enough
+_BITLIM = 128
+# Bits kept when bounding a huge integer for its leading digits
+_TOP_BITS = 256
+
+
+def _exact_context():
+    context = decimal.Context(
+        prec=decimal.MAX_PREC,
+        Emax=decimal.MAX_EMAX,
+        Emin=decimal.MIN_EMIN,
+    )
+    context.traps[decimal.Inexact] = True
+    return context
+
+
+def int_to_decimal(n):
+    """
+    Convert an int to an exact decimal.Decimal in subquadratic time.
+
+    Splits n into high and low halves at a power of two and recombines
+    them as hi * 2**w + lo in decimal arithmetic, whose big-number
+    multiplication is subquadratic. str() of the result is then linear,
+    and not subject to the int -> str digit limit.
+    """
+    D = decimal.Decimal
+    powers = {}
+
+    def power_of_two(w):
+        result = powers.get(w)
+        if result is None:
+            if w <= _BITLIM:
+                result = D(2) ** w
+            elif w - 1 in powers:
+                result = powers[w - 1] * 2
+            else:
+                half = w >> 1
+                result = power_of_two(half) * power_of_two(w - half)
+            powers[w] = result
+        return result
+
+    def convert(n, w):
+        if w <= _BITLIM:
+            return D(n)
+        half = w >> 1
+        hi = n >> half
+        lo = n - (hi << half)
+        return convert(lo, half) + convert(hi, w - half) * power_of_two(half)
+
+    with decimal.localcontext(_exact_context()):
+        if n < 0:
+            return -convert(-n, (-n).bit_length())
+        return convert(n, n.bit_length())
+
+
+def int_to_str(n):
+    """Exact decimal digits of n (with a leading '-' if negative)."""
+    if n.bit_length() <= _BITLIM * 8:
+        return str(n)
+    return str(int_to_decimal(n))
+
+
+def _bounds(n, prec):
+    """
+    Decimal lower and upper bounds on a positive n, each correct to
+    `prec` significant digits, computed from the top bits of n only.
+    """
+    shift = max(0, n.bit_length() - _TOP_BITS)
+    top = n >> shift
+    context = decimal.Context(prec=prec, Emax=decimal.MAX_EMAX)
+    # power() is not guaranteed to round in the requested direction, so
+    # widen both bounds by a few units in the last place
+    margin = decimal.Decimal(1).scaleb(3 - prec)
+    context.rounding = decimal.ROUND_FLOOR
+    low = context.multiply(decimal.Decimal(top), context.power(2, shift))
+    low = context.multiply(low, 1 - margin)
+    context.rounding = decimal.ROUND_CEILING
+    high = context.multiply(decimal.Decimal(top + 1), context.power(2, shift))
+    high = context.multiply(high, 1 + margin)
+    return low, high
+
+
+def leading_digits(n, count):
+    """
+    Return (digits, digit_count) for a positive int: the first `count`
+    decimal digits as a string and the total number of digits. Only the
+    top bits of n are used unless that cannot decide the answer.
+    """
+    low, high = _bounds(n, count + 10)
+    low_digits = low.as_tuple().digits
+    high_digits = high.as_tuple().digits
+    if (
+        low.adjusted() == high.adjusted()
+        and low_digits[:count] == high_digits[:count]
+    ):
+        return "".join(map(str, low_digits[:count])), low.adjusted() + 1
+    # n sits on a rounding boundary (e.g. an exact power of ten)
+    digits = int_to_str(n)
+    return digits[:count], len(digits)
+
+
+def digit_count(n):
+    """Number of decimal digits of abs(n)."""
+    n = abs(n)
+    if n.bit_length() <= 64:
+        return len(str(n))
+    return leading_digits(n, 1)[1]
+
+
+def is_big(n):
+    # 3.33 bits per digit: cheap pre-check before counting digits
+    return n.bit_length() > BIG_INT_DIGITS * 3.3 and digit_count(n) > BIG_INT_DIGITS
+
+
+def group_thousands(digits):
+    """Insert thousands separators into a string of digits."""
+    head = len(digits) % 3 or 3
+    groups = [digits[:head]]
+    groups.extend(digits[i : i + 3] for i in range(head, len(digits), 3))
+    return ",".join(groups)
+
+
+def format_big_int(n, mode="sci"):
+    """
+    Render an integer for display in one of BIGNUM_MODES. Integers up to
+    BIG_INT_DIGITS digits are always shown in full with separators.
+    """
+    if mode not in BIGNUM_MODES:
+        raise ValueError(f"Unknown display mode '{mode}'")
+    sign = "-" if n < 0 else ""
+    if mode == "full" or not is_big(n):
+        digits = int_to_str(abs(n))
+        return sign + group_thousands(digits)
+
+    head, count = leading_digits(abs(n), SHOWN_DIGITS)
+    if mode == "sci":
+        mantissa = f"{head[0]}.{head[1:].rstrip('0') or '0'}"
+        return f"{sign}{mantissa}e+{count - 1} ({count:,} digits)"
+    tail = str(abs(n) % 10**SHOWN_DIGITS).zfill(SHOWN_DIGITS)
+    return f"{sign}{head}…{tail} ({count:,} digits)"
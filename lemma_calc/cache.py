@@ -0,0 +1,75 @@
+# lemma_calc/cache.py
+
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    A small bounded least-recently-used cache.
+
+    Keeps hit/miss/eviction counters so callers can report how well
+    the cache is doing (see `info()`). Safe to share between threads:
+    every operation holds the cache's lock.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            data = self._data
+            data[key] = value
+            data.move_to_end(key)
+            if self.maxsize is not None:
+                while len(data) > self.maxsize:
+                    data.popitem(last=False)
+                    self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Remove `key` and return its value (`default` if absent)."""
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def info(self):
+        """Return the cache counters as a plain dict."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
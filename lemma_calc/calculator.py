@@ -0,0 +1,139 @@
+# lemma_calc/calculator.py
+
+import threading
+from . import core
+from .batch import evaluate_statement
+from .cache import LRUCache
+from .completion import CompletionIndex
+from .constants import COMPILE_CACHE_SIZE
+from .core import (
+    compile_expression,
+    evaluate_cached,
+    format_result,
+    run_compiled,
+    shadowed_constants,
+    split_assignment,
+    split_definition,
+)
+from .userfuncs import FunctionTable, builtins
+
+# Expressions compiled for a calculator once it defines functions (the
+# others share one cache of expressions compiled against the built-ins)
+SESSION_CACHE_SIZE = 256
+
+_shared_cache = LRUCache(COMPILE_CACHE_SIZE)
+
+# The function table of calculators that have defined none
+_no_functions = FunctionTable()
+
+
+class Calculator:
+    """
+    An independent calculator session, for hosting many in one process.
+
+    - Owns its variables, its user functions (a FunctionTable created by
+      the first definition), its compiled expressions and an optional
+      `history` sink: any object with append(expr, result), such as a
+      history.HistoryLog, receiving every statement that succeeds.
+    - Shares nothing mutable with the REPL's globals (core.variables,
+      the user functions in allowed_names, the prompt's completer).
+    - Evaluates through the process-wide sandbox and result cache when
+      they are set (core.set_sandbox, core.set_result_cache), like
+      core.evaluate_expression, so a server's sessions get their limits.
+    - Safe to use from a thread pool: statements on one calculator run
+      one at a time under its lock, different calculators concurrently.
+    - Small: calculators without user functions share one compile cache,
+      and the completion index is only built if complete() is called.
+    """
+
+    __slots__ = ("variables", "history", "_table", "_compiled", "_index", "_lock")
+
+    def __init__(self, variables=None, history=None):
+        self.variables = {} if variables is None else variables
+        self.history = history
+        self._table = None
+        self._compiled = _shared_cache
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def functions(self):
+        """The user functions defined so far, by name."""
+        return {} if self._table is None else dict(self._table.defined)
+
+    def evaluate(self, expr):
+        """Evaluate an expression and return its value (see core)."""
+        with self._lock:
+            return self._evaluate(expr, self.variables)
+
+    def execute(self, statement):
+        """
+        Run one statement (assignment, definition or expression), binding
+        `ans` and `_` like batch mode.
+
+        Returns:
+            dict: The record batch.evaluate_statement() returns.
+        """
+        with self._lock:
+            record = evaluate_statement(
+                statement, self.variables, self._assign, self._evaluate
+            )
+            if self._index is not None:
+                self._index.note_expression(statement)
+        if self.history is not None and "error" not in record:
+            self.history.append(statement, record["result"])
+        return record
+
+    def complete(self, prefix, limit=None):
+        """Completions of `prefix` for this session: [(word, kind), ...]."""
+        with self._lock:
+            if self._index is None:
+                self._index = CompletionIndex()
+                for name in self.variables:
+                    self._index.note_variable(name)
+                for name in self.functions:
+                    self._index.note_function(name)
+            return self._index.complete(prefix, limit)
+
+    def _evaluate(self, expr, variables):
+        if core.result_cache() is not None:
+            table = _no_functions if self._table is None else self._table
+            return evaluate_cached(expr, variables, self._run, table)
+        return self._run(expr, variables)
+
+    def _run(self, expr, variables):
+        sandbox = core.sandbox()
+        if sandbox is not None:
+            table = _no_functions if self._table is None else self._table
+            return sandbox.evaluate(expr, variables, table)
+        functions = builtins if self._table is None else self._table.functions
+        compiled = compile_expression(
+            expr, shadowed_constants(variables), functions, self._compiled
+        )
+        return run_compiled(compiled, variables)
+
+    def _assign(self, expr, variables):
+        definition = split_definition(expr)
+        if definition:
+            if self._table is None:
+                self._table = FunctionTable(on_change=self._clear_compiled)
+            function = self._table.define(*definition, variables)
+            if self._index is not None:
+                self._index.note_function(function.name)
+            return repr(function)
+        assignment = split_assignment(expr)
+        if assignment is None:
+            return None
+        name, rhs = assignment
+        value = self._evaluate(rhs, variables)
+        variables[name] = value
+        if self._index is not None:
+            self._index.note_variable(name)
+        return f"{name} = {format_result(value)}"
+
+    def _clear_compiled(self):
+        # Called under the lock, by the table after every definition
+        if self._compiled is _shared_cache:
+            self._compiled = LRUCache(SESSION_CACHE_SIZE)
+        else:
+            self._compiled.clear()
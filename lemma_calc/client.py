@@ -0,0 +1,122 @@
+# lemma_calc/client.py
+
+import argparse
+import http.client
+import json
+import socket
+import sys
+from .server import DEFAULT_ADDRESS
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class CalcClient:
+    """
+    Minimal client for the LemmaCalc server, for local testing.
+
+    Reuses one keep-alive connection for all requests. With
+    `session=True` a server-side session is created on first use so
+    variables persist across calls.
+
+    Example:
+        client = CalcClient("127.0.0.1:8765", session=True)
+        client.eval("x = 3")
+        client.eval("x^2")["value"]        # 9
+        client.batch(["x + 1", "1/0"])     # {"errors": 1, "results": [...]}
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, session=False, timeout=60.0):
+        if address.startswith("unix:"):
+            self._conn = _UnixHTTPConnection(address[len("unix:") :], timeout)
+        else:
+            host, _, port = address.rpartition(":")
+            self._conn = http.client.HTTPConnection(
+                host or "127.0.0.1", int(port), timeout=timeout
+            )
+        self.session = None
+        self._want_session = session
+
+    def request(self, method, path, payload=None):
+        """Send one request and return (status, decoded JSON body)."""
+        body = json.dumps(payload) if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body else {}
+        self._conn.request(method, path, body=body, headers=headers)
+        response = self._conn.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+
+    def _call(self, path, payload):
+        if self._want_session and self.session is None:
+            self.session = self.new_session()
+        if self.session is not None:
+            payload["session"] = self.session
+        status, result = self.request("POST", path, payload)
+        if status != 200:
+            raise RuntimeError(f"Server error {status}: {result.get('error')}")
+        return result
+
+    def eval(self, expr):
+        """Evaluate one statement; returns the result record."""
+        return self._call("/eval", {"expr": expr})
+
+    def batch(self, exprs):
+        """Evaluate many statements in one request."""
+        return self._call("/batch", {"exprs": list(exprs)})
+
+    def new_session(self):
+        status, result = self.request("POST", "/sessions")
+        if status != 201:
+            raise RuntimeError(f"Server error {status}: {result.get('error')}")
+        return result["session"]
+
+    def close(self):
+        if self.session is not None:
+            try:
+                self.request("DELETE", f"/sessions/{self.session}")
+            except (OSError, http.client.HTTPException):
+                pass
+            self.session = None
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    """
+    Send expressions from the command line (or stdin, one per line) to
+    a running server as one batch and print the results like --batch.
+    """
+    parser = argparse.ArgumentParser(description="LemmaCalc server client")
+    parser.add_argument("exprs", nargs="*", help="Expressions to evaluate")
+    parser.add_argument(
+        "--address",
+        default=DEFAULT_ADDRESS,
+        help=f"host:port or unix:/path of the server (default: {DEFAULT_ADDRESS})",
+    )
+    args = parser.parse_args(argv)
+
+    exprs = args.exprs or [line.strip() for line in sys.stdin if line.strip()]
+    with CalcClient(args.address) as client:
+        response = client.batch(exprs)
+    for record in response["results"]:
+        if "error" in record:
+            print(f"Error: {record['error']}")
+        else:
+            print(record["result"])
+    return 1 if response["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
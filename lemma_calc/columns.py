@@ -0,0 +1,484 @@
+# lemma_calc/columns.py
+
+import math
+import mmap
+import os
+import re
+import tempfile
+import weakref
+from array import array
+from .arrays import is_array, load_numpy
+from .compiler import SpecialForm, free_names
+from .constants import allowed_names, special_forms
+
+# Rows an aggregate evaluates at a time when it streams over columns
+STREAM_CHUNK_ROWS = 1 << 16
+
+# Values percentile() sorts in memory; beyond that it selects the ones
+# it needs by counting over the data in a few more passes
+PERCENTILE_MEMORY_VALUES = 1 << 22
+
+# Raw binary files holding one little-endian column, by extension
+RAW_DTYPES = {".f64": "<f8", ".f32": "<f4", ".i64": "<i8", ".i32": "<i4"}
+
+# load <file> [col N] as <name>
+_LOAD_PATTERN = re.compile(
+    r"^\s*load\s+(?P<path>.+?)(?:\s+col(?:umn)?\s+(?P<column>\d+))?"
+    r"\s+as\s+(?P<name>[A-Za-z_][A-Za-z0-9_]*)\s*$",
+    re.IGNORECASE,
+)
+
+# Variables key under which an aggregate streaming over rows passes the
+# full variables to the aggregates nested in its argument
+_OUTER = "$outer"
+
+# Text values are parsed into the column file this many at a time
+_PARSE_BATCH = 1 << 16
+
+
+def _numpy():
+    """
+    NumPy, imported by the first load or aggregate (None if it isn't
+    installed, and then they raise); the helpers they call use `np`.
+    """
+    global np
+    np = load_numpy()
+    return np
+
+
+def is_column(value):
+    """Whether `value` is a column loaded from a file (memory-mapped)."""
+    return is_array(value) and isinstance(value, _numpy().memmap)
+
+
+class ColumnReference:
+    """
+    Where a column's values are in its file (see column_reference), so
+    another process, such as a sandbox worker, maps the column again
+    instead of being sent all of its data.
+    """
+
+    __slots__ = ("path", "offset", "dtype", "shape", "strides")
+
+    def __init__(self, path, offset, dtype, shape, strides):
+        self.path = path
+        self.offset = offset
+        self.dtype = dtype
+        self.shape = shape
+        self.strides = strides
+
+    def open(self):
+        """Memory-map the column, read-only."""
+        _numpy()
+        itemsize = np.dtype(self.dtype).itemsize
+        # Elements from the first value to the last one
+        span = 1 + sum(
+            (n - 1) * stride // itemsize for n, stride in zip(self.shape, self.strides)
+        )
+        values = np.memmap(
+            self.path, dtype=self.dtype, mode="r", offset=self.offset, shape=(span,)
+        )
+        return np.lib.stride_tricks.as_strided(
+            values, self.shape, self.strides, subok=True, writeable=False
+        )
+
+
+def column_reference(value):
+    """
+    The ColumnReference of a column (see is_column), or None if its
+    layout can't be described that way.
+    """
+    root = value
+    while isinstance(root.base, np.memmap):
+        root = root.base
+    if root.filename is None or value.size == 0:
+        return None
+    if any(stride <= 0 or stride % value.itemsize for stride in value.strides):
+        return None
+    # root.offset is where the mapped array starts in the file
+    offset = root.offset + value.ctypes.data - root.ctypes.data
+    return ColumnReference(
+        root.filename, offset, value.dtype.str, value.shape, value.strides
+    )
+
+
+def load_column(path, column=1):
+    """
+    Memory-map column `column` (counting from 1) of a data file.
+
+    - .npy files (1-D, or 2-D with one column per field) and raw binary
+      files (.f64, .f32, .i64, .i32: a single little-endian column) are
+      mapped as they are.
+    - Other files are read as CSV or whitespace-separated text: the
+      column is parsed in one pass over the memory-mapped file into a
+      temporary file of float64s, which is mapped in turn and deleted
+      with the column. A first line that is not numeric is taken as a
+      header.
+
+    Nothing is read into Python lists, so the memory used does not grow
+    with the size of the file: the operating system pages the data in
+    and out as the aggregates stream over it.
+
+    Returns:
+        numpy.memmap: The column, read-only.
+    """
+    if _numpy() is None:
+        raise ValueError("Load error: loading data files needs NumPy.")
+    if column < 1:
+        raise ValueError("Load error: columns are numbered from 1.")
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension == ".npy":
+            return _load_npy(path, column)
+        if extension in RAW_DTYPES:
+            return _load_raw(path, RAW_DTYPES[extension], column)
+        return _load_text(path, column)
+    except OSError as e:
+        raise ValueError(f"Load error: {e.strerror or e} ({path}).")
+
+
+def _load_npy(path, column):
+    try:
+        values = np.load(path, mmap_mode="r")
+    except ValueError as e:
+        raise ValueError(f"Load error: {e}")
+    if not isinstance(values, np.memmap) or values.dtype.kind not in "biuf":
+        raise ValueError(f"Load error: {path} does not hold an array of numbers.")
+    if values.ndim == 2 and column <= values.shape[1]:
+        return values[:, column - 1]
+    if values.ndim == 1 and column == 1:
+        return values
+    if values.ndim > 2:
+        raise ValueError(f"Load error: {path} has {values.ndim} dimensions.")
+    raise ValueError(f"Load error: {path} has no column {column}.")
+
+
+def _load_raw(path, dtype, column):
+    if column != 1:
+        raise ValueError(f"Load error: {path} holds a single column.")
+    if os.path.getsize(path) == 0:
+        raise ValueError(f"Load error: {path} is empty.")
+    try:
+        return np.memmap(path, dtype=dtype, mode="r")
+    except ValueError as e:
+        raise ValueError(f"Load error: {e}")
+
+
+def _delimiter(line):
+    for delimiter in (b"\t", b";", b","):
+        if delimiter in line:
+            return delimiter
+    return None  # whitespace
+
+
+def _load_text(path, column):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Load error: {path} is empty.")
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # Named, so that a sandbox worker can map it too (see ColumnReference)
+    out = tempfile.NamedTemporaryFile(prefix="lemma-", suffix=".f64", delete=False)
+    try:
+        with data, out:
+            count = _parse_column(data, column - 1, out, path)
+        if count == 0:
+            raise ValueError(f"Load error: no numbers in column {column} of {path}.")
+        values = np.memmap(out.name, dtype=np.float64, mode="r", shape=(count,))
+    except BaseException:
+        _remove(out.name)
+        raise
+    weakref.finalize(values, _remove, out.name)
+    return values
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:  # Windows can't delete a file that is still mapped
+        pass
+
+
+def _parse_column(data, index, out, path):
+    """Write field `index` of each line to `out` as float64s; return the count."""
+    delimiter = None
+    first = True
+    values = array("d")
+    count = 0
+    for number, line in enumerate(iter(data.readline, b""), 1):
+        if not line.strip():
+            continue
+        if first:
+            delimiter = _delimiter(line)
+        fields = line.split(delimiter)
+        if index >= len(fields):
+            raise ValueError(
+                f"Load error: line {number} of {path} has no column {index + 1}."
+            )
+        try:
+            values.append(float(fields[index]))
+        except ValueError:
+            if not first:
+                field = fields[index].strip().decode("utf-8", "replace")
+                raise ValueError(
+                    f"Load error: line {number} of {path}: '{field}' is not a number."
+                )
+            # A header
+        first = False
+        if len(values) == _PARSE_BATCH:
+            values.tofile(out)
+            count += len(values)
+            values = array("d")
+    values.tofile(out)
+    return count + len(values)
+
+
+def parse_load_command(text):
+    """
+    Parse `load <file> [col N] as <name>`.
+
+    Returns:
+        tuple: (path, column, name)
+    """
+    match = _LOAD_PATTERN.match(text)
+    if match is None:
+        raise ValueError("Usage: load <file> [col N] as <name>")
+    path = match.group("path").strip().strip("'\"")
+    column = int(match.group("column") or 1)
+    name = match.group("name")
+    if name in allowed_names or name in special_forms:
+        raise ValueError(f"Load error: '{name}' is the name of a function.")
+    return path, column, name
+
+
+def run_load_command(text, variables):
+    """
+    Run a load command, binding the column in `variables`.
+
+    Returns:
+        str: The name of the variable bound.
+    """
+    path, column, name = parse_load_command(text)
+    variables[name] = load_column(path, column)
+    return name
+
+
+def _floats(value):
+    return np.asarray(value, dtype=np.float64).ravel()
+
+
+def _stream(run, names, env):
+    """
+    Yield the values of `run` over successive blocks of rows: the loaded
+    columns among `names` (and arrays as long as them) are passed
+    STREAM_CHUNK_ROWS rows at a time, so evaluating sum(p*q) never holds
+    more than a block of p*q in memory.
+
+    Without columns, or if the value is not one number per row (dot(p, q),
+    mean(p)), the argument is evaluated once over everything instead.
+    """
+    columns = [(name, env[name]) for name in names if is_column(env.get(name))]
+    if columns:
+        length = len(columns[0][1])
+        for name, values in columns:
+            if values.ndim != 1 or len(values) != length:
+                raise ValueError(
+                    f"Columns {columns[0][0]} and {name} have different lengths."
+                )
+        columns += [
+            (name, env[name])
+            for name in names
+            if not is_column(env.get(name))
+            and np.ndim(env.get(name)) == 1
+            and len(env[name]) == length
+        ]
+    if not columns or length <= STREAM_CHUNK_ROWS:
+        yield run(env)
+        return
+    local = dict(env)
+    # Aggregates nested in the argument see every row, not the block
+    local[_OUTER] = (env, {})
+    for start in range(0, length, STREAM_CHUNK_ROWS):
+        stop = min(start + STREAM_CHUNK_ROWS, length)
+        for name, values in columns:
+            local[name] = values[start:stop]
+        value = run(local)
+        if start == 0 and np.shape(value) != (stop,):
+            yield run(env)
+            return
+        yield value
+
+
+def _aggregate(name, compute, params=()):
+    """
+    The build function of the special form `name`(values, *params),
+    aggregating its first argument as evaluated by _stream:
+    `compute(stream, *params)` gets a function starting a new pass over
+    the values, and the values of the other arguments.
+    """
+    usage = f"{name}() takes {len(params) + 1} argument(s): "
+    usage += f"{name}({', '.join(('values',) + params)})"
+
+    def build(args, compile, functions):
+        if len(args) != len(params) + 1:
+            raise ValueError(usage)
+        values = compile(args[0])
+        names = sorted(free_names(args[0]))
+        rest = [compile(arg) for arg in args[1:]]
+
+        def aggregate(env):
+            if _numpy() is None:
+                raise ValueError(f"{name}() needs NumPy.")
+            return compute(
+                lambda: _stream(values, names, env), *[arg(env) for arg in rest]
+            )
+
+        def run(env):
+            outer = env.get(_OUTER)
+            if outer is None:
+                return aggregate(env)
+            # Nested in an aggregate streaming over rows: aggregate them
+            # all, once per pass
+            env, done = outer
+            if run not in done:
+                done[run] = aggregate(env)
+            return done[run]
+
+        return run
+
+    return build
+
+
+def _block_sum(value):
+    """
+    Sum of one block as a Python number. Integers are summed exactly, as
+    their high and low 32 bits, instead of wrapping around in int64.
+    """
+    value = np.asarray(value)
+    if value.dtype.kind not in "iu":
+        return np.sum(value).item()
+    high = int(np.sum(value >> 32, dtype=np.int64))
+    low = int(np.sum(value & 0xFFFFFFFF, dtype=np.int64))
+    return (high << 32) + low
+
+
+def _sum(stream):
+    total = 0
+    for value in stream():
+        # Python numbers: integer totals don't overflow between blocks
+        total += _block_sum(value)
+    return total
+
+
+def _moments(stream):
+    """Count, mean and sum of squared deviations, combined block by block."""
+    count, mean, squares = 0, 0.0, 0.0
+    for value in stream():
+        block = _floats(value)
+        if block.size == 0:
+            continue
+        block_mean = block.mean()
+        block_squares = np.square(block - block_mean).sum()
+        total = count + block.size
+        delta = block_mean - mean
+        mean += delta * block.size / total
+        squares += block_squares + delta * delta * count * block.size / total
+        count = total
+    return count, float(mean), float(squares)
+
+
+def _mean(stream):
+    count, mean, _ = _moments(stream)
+    if count == 0:
+        raise ValueError("mean() of no values.")
+    return mean
+
+
+def _stdev(stream):
+    count, _, squares = _moments(stream)
+    if count < 2:
+        raise ValueError("stdev() needs at least 2 values.")
+    return math.sqrt(squares / (count - 1))
+
+
+def _sort_keys(block):
+    """uint64 keys that order like the float64 values of `block`."""
+    bits = block.view(np.int64)
+    keys = bits ^ ((bits >> 63) & 0x7FFF_FFFF_FFFF_FFFF)
+    return keys.view(np.uint64) ^ np.uint64(1 << 63)
+
+
+def _key_value(key):
+    bits = (np.array([key], dtype=np.uint64) ^ np.uint64(1 << 63)).view(np.int64)
+    bits ^= (bits >> 63) & 0x7FFF_FFFF_FFFF_FFFF
+    return float(bits.view(np.float64)[0])
+
+
+def _select(stream, rank):
+    """
+    The value of rank `rank` (from 0, ascending) by radix selection on
+    the values' sort keys, 16 bits per pass: four passes, whatever the
+    number of values, with a 65,536-entry count table.
+    """
+    prefix = 0
+    for shift in (48, 32, 16, 0):
+        counts = np.zeros(1 << 16, dtype=np.int64)
+        for value in stream():
+            keys = _sort_keys(_floats(value))
+            if shift < 48:
+                keys = keys[keys >> np.uint64(shift + 16) == np.uint64(prefix)]
+            digits = (keys >> np.uint64(shift)) & np.uint64(0xFFFF)
+            counts += np.bincount(digits.astype(np.intp), minlength=1 << 16)
+        below = np.cumsum(counts)
+        digit = int(np.searchsorted(below, rank, side="right"))
+        if digit:
+            rank -= int(below[digit - 1])
+        prefix = (prefix << 16) | digit
+    return _key_value(prefix)
+
+
+def _next_value(stream, value, rank):
+    """The value of rank `rank` + 1, given `value` of rank `rank`."""
+    at_most, above = 0, math.inf
+    for block in stream():
+        block = _floats(block)
+        at_most += int(np.count_nonzero(block <= value))
+        larger = block[block > value]
+        if larger.size:
+            above = min(above, float(larger.min()))
+    return value if at_most > rank + 1 else above
+
+
+def _percentile(stream, q):
+    if not 0 <= q <= 100:
+        raise ValueError("percentile() takes q between 0 and 100.")
+    count = 0
+    kept = []
+    for value in stream():
+        block = _floats(value)
+        if np.isnan(block).any():
+            raise ValueError("percentile() of NaN values.")
+        count += block.size
+        if kept is not None:
+            if count <= PERCENTILE_MEMORY_VALUES:
+                kept.append(block)
+            else:
+                kept = None
+    if count == 0:
+        raise ValueError("percentile() of no values.")
+    if kept is not None:
+        return float(np.percentile(np.concatenate(kept), q))
+    # Too many to sort: find the two values around the position
+    position = q / 100 * (count - 1)
+    rank = int(position)
+    fraction = position - rank
+    low = _select(stream, rank)
+    if fraction == 0:
+        return low
+    high = _next_value(stream, low, rank)
+    return low + (high - low) * fraction
+
+
+special_forms["sum"] = SpecialForm(_aggregate("sum", _sum))
+special_forms["mean"] = SpecialForm(_aggregate("mean", _mean))
+special_forms["stdev"] = SpecialForm(_aggregate("stdev", _stdev))
+special_forms["percentile"] = SpecialForm(_aggregate("percentile", _percentile, ("q",)))
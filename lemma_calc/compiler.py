@@ -0,0 +1,419 @@
+# lemma_calc/compiler.py
+
+import ast
+import threading
+from .arrays import make_array
+from .constants import allowed_names, allowed_operators, math_constants, special_forms
+
+
+def check_factorial(args):
+    """Argument checks `safe_eval` applies before calling factorial()."""
+    if len(args) != 1:
+        raise ValueError("factorial() takes exactly one argument")
+    arg_val = args[0]
+    if not (isinstance(arg_val, int) and arg_val >= 0):
+        raise ValueError("factorial() only defined for non-negative integers")
+
+
+# Per-function argument checks run before the call
+call_checks = {"factorial": check_factorial}
+
+
+class CompiledExpression:
+    """
+    A parsed expression together with its compiled evaluator.
+
+    `tree` is the parsed AST (used by the tree-walking engine), `run(env)`
+    evaluates the closure tree built from its optimized form, kept in
+    `optimized` if there is one, and `names` is the set of variable names
+    the expression reads. `functions` is the function table it was
+    compiled against (None: allowed_names).
+    """
+
+    __slots__ = ("source", "tree", "run", "names", "optimized", "functions")
+
+    def __init__(self, source, tree, run, optimized=None, functions=None):
+        self.source = source
+        self.tree = tree
+        self.run = run
+        self.names = free_names(tree, functions)
+        self.optimized = optimized
+        self.functions = functions
+
+
+class SpecialForm:
+    """
+    A built-in that receives its arguments unevaluated, such as
+    integrate(expr, x, a, b), where `x` names a variable that is only
+    bound inside `expr`.
+
+    `build(args, compile, functions)` gets the argument nodes, a function
+    that compiles a node into run(env) and the function table the call
+    is compiled against, and returns run(env) for the whole call; it
+    raises ValueError for malformed arguments. `bound` is the
+    index of the argument naming the bound variable, `scoped` the
+    indices of the arguments in which that variable is bound.
+    """
+
+    __slots__ = ("build", "bound", "scoped")
+
+    def __init__(self, build, bound=None, scoped=()):
+        self.build = build
+        self.bound = bound
+        self.scoped = frozenset(scoped)
+
+    def bound_name(self, args):
+        """The variable bound by a call with these arguments, or None."""
+        if self.bound is None or self.bound >= len(args):
+            return None
+        arg = args[self.bound]
+        return arg.id if isinstance(arg, ast.Name) else None
+
+
+def free_names(tree, functions=None):
+    """
+    Return the variable names an expression reads: every ast.Name, plus
+    called names that are not functions (a call on a variable is an
+    implicit multiplication). Variables bound by a special form are not
+    free inside its scoped arguments.
+    """
+    if functions is None:
+        functions = allowed_names
+    names = set()
+    stack = [(tree, frozenset())]
+    while stack:
+        node, bound = stack.pop()
+        if isinstance(node, ast.Name):
+            if node.id not in bound:
+                names.add(node.id)
+            continue
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            form = special_forms.get(node.func.id)
+            if form is not None:
+                name = form.bound_name(node.args)
+                inner = bound if name is None else bound | {name}
+                for i, arg in enumerate(node.args):
+                    if i != form.bound:
+                        stack.append((arg, inner if i in form.scoped else bound))
+                continue
+            if node.func.id in functions:
+                stack.extend((arg, bound) for arg in node.args)
+                stack.extend((kw.value, bound) for kw in node.keywords)
+                continue
+        stack.extend((child, bound) for child in ast.iter_child_nodes(node))
+    return frozenset(names)
+
+
+def compile_tree(tree, functions=None, operators=None, checks=None, bindings=None):
+    """
+    Turn a parsed expression into a tree of nested closures.
+
+    The AST is validated against the function and operator tables once,
+    here, so evaluating the result does no type dispatch. Nodes that
+    `safe_eval` would reject become closures raising the same error at
+    the same point of the evaluation, so both engines behave alike.
+
+    `bindings` maps the names of shared subexpressions (see optimizer)
+    to their trees. Each is evaluated at most once per call, when first
+    needed, so errors still surface where they did in the original tree.
+    Their values are kept apart from the variables, which are not copied.
+
+    Returns a function taking the variables dict.
+    """
+    if functions is None:
+        functions = allowed_names
+    if operators is None:
+        operators = allowed_operators
+    if checks is None:
+        checks = call_checks
+    compiler = _Compiler(functions, operators, checks, bindings)
+    run = compiler.compile(tree)
+    if not bindings:
+        return run
+
+    frame = compiler.frame
+
+    def run_with_bindings(env):
+        # Shared values are memoized in a dict per call and thread; a
+        # recursive call (through a user function) gets its own
+        outer = frame.values
+        frame.values = {}
+        try:
+            return run(env)
+        finally:
+            frame.values = outer
+
+    return run_with_bindings
+
+
+def _literal(node):
+    """The numbers of a vector or matrix literal made of numbers only, or None."""
+    values = []
+    for item in node.elts:
+        if isinstance(item, ast.List):
+            value = _literal(item)
+            if value is None:
+                return None
+        elif isinstance(item, ast.Constant) and type(item.value) in (int, float):
+            value = item.value
+        elif (
+            isinstance(item, ast.UnaryOp)
+            and isinstance(item.op, ast.USub)
+            and isinstance(item.operand, ast.Constant)
+            and type(item.operand.value) in (int, float)
+        ):
+            value = -item.operand.value
+        else:
+            return None
+        values.append(value)
+    return values
+
+
+def _raiser(exc_type, message):
+    def run(env):
+        raise exc_type(message)
+
+    return run
+
+
+class _Frame(threading.local):
+    values = None
+
+
+class _Compiler:
+
+    def __init__(self, functions, operators, checks, bindings=None):
+        self.functions = functions
+        self.operators = operators
+        self.checks = checks
+        self.bindings = bindings or {}
+        self._shared = {}
+        # Holds the shared values of the current call (see compile_tree)
+        self.frame = _Frame()
+
+    def compile(self, node):
+        method = getattr(self, "_compile_" + type(node).__name__, None)
+        if method is None:
+            return _raiser(ValueError, f"Unsupported expression: {type(node)}")
+        return method(node)
+
+    def _compile_Expression(self, node):
+        return self.compile(node.body)
+
+    def _compile_Constant(self, node):
+        value = node.value
+        if not isinstance(value, (int, float)):
+            return _raiser(ValueError, f"Invalid constant {value}")
+
+        def run(env):
+            return value
+
+        return run
+
+    def _compile_BinOp(self, node):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        op_type = type(node.op)
+        op = self.operators.get(op_type)
+
+        if op is None:
+            message = f"Operator {op_type} not allowed"
+
+            def run(env):
+                left(env)
+                right(env)
+                raise ValueError(message)
+
+            return run
+
+        def run(env):
+            return op(left(env), right(env))
+
+        return run
+
+    def _compile_UnaryOp(self, node):
+        operand = self.compile(node.operand)
+        op_type = type(node.op)
+        op = self.operators.get(op_type)
+
+        if op is None:
+            message = f"Unary operator {op_type} not allowed"
+
+            def run(env):
+                operand(env)
+                raise ValueError(message)
+
+            return run
+
+        def run(env):
+            return op(operand(env))
+
+        return run
+
+    def _compile_List(self, node):
+        literal = _literal(node)
+        if literal is not None:
+            # Built once: the array is read-only, so every call can share it
+            try:
+                array = make_array(literal)
+            except ValueError as e:
+                return _raiser(ValueError, str(e))
+
+            def run(env):
+                return array
+
+            return run
+
+        items = [self.compile(item) for item in node.elts]
+
+        def run(env):
+            return make_array([item(env) for item in items])
+
+        return run
+
+    def _compile_Compare(self, node):
+        left = self.compile(node.left)
+        comparators = [self.compile(c) for c in node.comparators]
+        ops = [self.operators.get(type(op)) for op in node.ops]
+
+        if None in ops:
+            op_type = type(node.ops[ops.index(None)])
+            message = f"Operator {op_type} not allowed"
+
+            def run(env):
+                left(env)
+                for comparator in comparators:
+                    comparator(env)
+                raise ValueError(message)
+
+            return run
+
+        if len(ops) == 1:
+            (op,) = ops
+            (right,) = comparators
+
+            def run(env):
+                return op(left(env), right(env))
+
+            return run
+
+        pairs = list(zip(ops, comparators))
+
+        def run(env):
+            # Chained like Python: a < b < c is a < b and b < c
+            value = left(env)
+            for op, comparator in pairs:
+                right = comparator(env)
+                if not op(value, right):
+                    return False
+                value = right
+            return True
+
+        return run
+
+    def _compile_Call(self, node):
+        if not isinstance(node.func, ast.Name):
+            return _raiser(ValueError, "Invalid function call")
+
+        func_name = node.func.id
+        if func_name in special_forms:
+            return self._compile_special_form(node, special_forms[func_name])
+        if func_name not in self.functions:
+            return self._compile_unknown_call(node, func_name)
+
+        func = self.functions[func_name]
+        args = [self.compile(arg) for arg in node.args]
+        check = self.checks.get(func_name)
+
+        if node.keywords:
+
+            def run(env):
+                for arg in args:
+                    arg(env)
+                raise ValueError("Keyword arguments not allowed")
+
+            return run
+
+        if check is not None:
+
+            def run(env):
+                values = [arg(env) for arg in args]
+                check(values)
+                return func(*values)
+
+            return run
+
+        if len(args) == 1:
+            (arg,) = args
+
+            def run(env):
+                return func(arg(env))
+
+            return run
+
+        def run(env):
+            return func(*[arg(env) for arg in args])
+
+        return run
+
+    def _compile_special_form(self, node, form):
+        if node.keywords:
+            return _raiser(ValueError, "Keyword arguments not allowed")
+        try:
+            return form.build(node.args, self.compile, self.functions)
+        except ValueError as e:
+            return _raiser(ValueError, str(e))
+
+    def _compile_unknown_call(self, node, func_name):
+        message = f"Function {func_name} unknown or not allowed"
+        if len(node.args) != 1 or node.keywords:
+            return _raiser(ValueError, message)
+
+        arg = self.compile(node.args[0])
+
+        def run(env):
+            # Implicit multiplication with a variable, e.g. x(2+1)
+            if func_name in env:
+                return env[func_name] * arg(env)
+            raise ValueError(message)
+
+        return run
+
+    def _compile_Name(self, node):
+        var_name = node.id
+        message = f"Unknown variable or identifier {var_name}"
+
+        if var_name in self.bindings:
+            shared = self._shared.get(var_name)
+            if shared is None:
+                shared = self._shared[var_name] = self.compile(self.bindings[var_name])
+
+            frame = self.frame
+
+            def run(env):
+                values = frame.values
+                try:
+                    return values[var_name]
+                except KeyError:
+                    value = values[var_name] = shared(env)
+                    return value
+
+            return run
+
+        if var_name in math_constants:
+            constant = math_constants[var_name]
+
+            def run(env):
+                if var_name in env:
+                    return env[var_name]
+                return constant
+
+            return run
+
+        def run(env):
+            try:
+                return env[var_name]
+            except KeyError:
+                raise ValueError(message) from None
+
+        return run
@@ -0,0 +1,243 @@
+# lemma_calc/completion.py
+
+import heapq
+from . import core  # imported for its side effect: registers integrate() etc.
+from .constants import allowed_names, math_constants, special_forms
+from .preprocessor import KEYWORD_NAMES, NAME, tokenize
+
+# Suggestions kept (and offered) per prefix
+TOP_K = 12
+# Statements after which an earlier use of a name counts half as much
+HALF_LIFE = 200
+# Kinds of completions, shown next to each suggestion; a word that is
+# several kinds is shown as the first of them
+KINDS = ("variable", "function", "constant", "command", "history")
+# Past statements load_history() replays; an older use would weigh less
+# than 2**-20 of a new one
+HISTORY_SEED_ENTRIES = 20 * HALF_LIFE
+# REPL commands offered for completion
+COMMANDS = (
+    "bignum",
+    "cache",
+    "clear",
+    "explain",
+    "full",
+    "history",
+    "load",
+    "man",
+    "save",
+    "session",
+    "spreadsheet",
+    "stats",
+    "table",
+    "tldr",
+)
+
+# Keep 2**exponent well inside the float range by rescaling past this
+_MAX_EXPONENT = 512
+
+
+class _Node:
+    __slots__ = ("children", "top", "words")
+
+    def __init__(self):
+        self.children = None
+        # Best words under this prefix, highest score first
+        self.top = []
+        # Words ending here (several if they differ only in case)
+        self.words = None
+
+
+class PrefixTrie:
+    """
+    A case-insensitive prefix trie of scored words.
+
+    Every node keeps the `top_k` highest-scoring words below it, kept up
+    to date as scores change, so looking up a prefix costs O(len(prefix))
+    however many words there are. Raising a word's score touches only
+    the nodes on its path. Lowering or removing one is the slow path:
+    the affected nodes are refilled from their subtrees.
+    """
+
+    def __init__(self, top_k=TOP_K):
+        self.top_k = top_k
+        self.root = _Node()
+        self.scores = {}
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __contains__(self, word):
+        return word in self.scores
+
+    def _path(self, word, create=False):
+        node = self.root
+        path = []
+        for ch in word.lower():
+            children = node.children
+            if children is None:
+                if not create:
+                    return path
+                children = node.children = {}
+            child = children.get(ch)
+            if child is None:
+                if not create:
+                    return path
+                child = children[ch] = _Node()
+            node = child
+            path.append(node)
+        return path
+
+    def set_score(self, word, score):
+        """Add `word` or change its score."""
+        old = self.scores.get(word)
+        if old is not None and score < old:
+            self.remove(word)
+        self.scores[word] = score
+        path = self._path(word, create=True)
+        node = path[-1] if path else self.root
+        if node.words is None:
+            node.words = []
+        if word not in node.words:
+            node.words.append(word)
+        for node in path:
+            self._promote(node.top, word, score)
+
+    def _promote(self, top, word, score):
+        scores = self.scores
+        if word in top:
+            top.remove(word)
+        elif len(top) >= self.top_k and score <= scores[top[-1]]:
+            return
+        i = len(top)
+        while i > 0 and scores[top[i - 1]] < score:
+            i -= 1
+        top.insert(i, word)
+        del top[self.top_k :]
+
+    def remove(self, word):
+        """Forget `word`; a no-op if it is not in the trie."""
+        if self.scores.pop(word, None) is None:
+            return
+        path = self._path(word)
+        path[-1].words.remove(word)
+        for node in path:
+            if word in node.top:
+                node.top = heapq.nlargest(
+                    self.top_k, self._subtree_words(node), key=self.scores.__getitem__
+                )
+
+    def _subtree_words(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.words:
+                yield from node.words
+            if node.children:
+                stack.extend(node.children.values())
+
+    def scale(self, factor):
+        """Multiply every score by a positive factor (the ranking is kept)."""
+        for word in self.scores:
+            self.scores[word] *= factor
+
+    def complete(self, prefix, limit=None):
+        """The best words starting with `prefix`, highest score first."""
+        if not prefix:
+            return []
+        path = self._path(prefix)
+        if len(path) < len(prefix):
+            return []
+        top = path[-1].top
+        return top[:limit] if limit is not None else list(top)
+
+
+class CompletionIndex:
+    """
+    The words the REPL completes: functions, constants and commands,
+    the user's variables, and names from past expressions.
+
+    Words are ranked by how often and how recently they were used: a use
+    during the n-th statement adds 2**(n / HALF_LIFE) to the word's
+    score, so each use weighs twice as much as one HALF_LIFE statements
+    earlier. Built-ins start with a score below any use.
+    """
+
+    def __init__(self, top_k=TOP_K):
+        self.trie = PrefixTrie(top_k)
+        self.kinds = {}
+        # Statements seen so far, and the one scores are relative to
+        self.clock = 0
+        self._base = 0
+        keywords = {parsed: name for name, parsed in KEYWORD_NAMES.items()}
+        for name in list(allowed_names) + list(special_forms):
+            self.add(keywords.get(name, name), "function")
+        for name in math_constants:
+            self.add(name, "constant")
+        for name in COMMANDS:
+            self.add(name, "command")
+
+    def __len__(self):
+        return len(self.trie)
+
+    def _weight(self):
+        exponent = (self.clock - self._base) / HALF_LIFE
+        if exponent > _MAX_EXPONENT:
+            self.trie.scale(2.0**-exponent)
+            self._base = self.clock
+            exponent = 0
+        return 2.0**exponent
+
+    def _set_kind(self, word, kind):
+        current = self.kinds.get(word)
+        if current is None or KINDS.index(kind) < KINDS.index(current):
+            self.kinds[word] = kind
+
+    def add(self, word, kind, score=0.0):
+        """Offer `word` for completion without counting it as a use."""
+        self._set_kind(word, kind)
+        if word not in self.trie:
+            self.trie.set_score(word, score)
+
+    def use(self, word, kind="history"):
+        """Count a use of `word` in the current statement."""
+        self._set_kind(word, kind)
+        self.trie.set_score(word, self.trie.scores.get(word, 0.0) + self._weight())
+
+    def note_expression(self, expr):
+        """Count the names used by one evaluated statement."""
+        self.clock += 1
+        for name in {text for kind, text in tokenize(expr) if kind == NAME}:
+            self.use(name)
+
+    def note_variable(self, name):
+        """Count an assignment to `name`."""
+        self.use(name, "variable")
+
+    def note_function(self, name):
+        """Count the definition of a user function `name`."""
+        self.use(name, "function")
+
+    def load_history(self, index):
+        """
+        Seed the scores with the names used in the last
+        HISTORY_SEED_ENTRIES entries of a history_index.HistoryIndex's
+        log, as if those statements had just been replayed (entry n
+        counts as statement n). Names are taken from the statements as
+        typed, not from the index, whose terms are lowercased.
+        """
+        count = len(index)
+        self.clock = self._base = count
+        entries = index.log.tail(min(count, HISTORY_SEED_ENTRIES))
+        scores = {}
+        for n, (_, expr, _) in enumerate(entries, count - len(entries) + 1):
+            weight = 2.0 ** ((n - count) / HALF_LIFE)
+            for name in {text for kind, text in tokenize(expr) if kind == NAME}:
+                scores[name] = scores.get(name, 0.0) + weight
+        for name, score in scores.items():
+            self._set_kind(name, "history")
+            self.trie.set_score(name, self.trie.scores.get(name, 0.0) + score)
+
+    def complete(self, prefix, limit=None):
+        """Return [(word, kind), ...] for a prefix, best first."""
+        return [(word, self.kinds[word]) for word in self.trie.complete(prefix, limit)]
@@ -4,15 +4,22 @@
 import math
 import operator
 import ast
+from .guards import guarded_factorial, guarded_mul, guarded_pow
 
 
 HISTORY_FILE = "history.json"
 VERSION = "0.4"
 
+# Maximum number of compiled expressions kept in memory
+COMPILE_CACHE_SIZE = 1024
+
+# Constants substituted by the preprocessor unless shadowed by a variable
+math_constants = {"pi": math.pi, "e": math.e}
+
 
 # Allowed math functions accessible to the user
 allowed_names = {
-    "factorial": math.factorial,
+    "factorial": guarded_factorial,
     "abs": abs,
     "round": round,
     "sin": math.sin,
@@ -32,14 +39,32 @@ allowed_names = {
 }
 
 
-# Allowed operators for safe evaluation
+# Built-ins that take their arguments unevaluated (integrate, ...),
+# name -> compiler.SpecialForm; registered by the modules defining them
+special_forms = {}
+
+
+# Functions defined in the session (f(x) = ...), name -> userfuncs.UserFunction;
+# each is also in allowed_names, which is how expressions call them
+user_functions = {}
+
+
+# Allowed operators for safe evaluation (arrays adds '@' and array-aware
+# versions of the arithmetic operators, and makes the math functions
+# apply element by element)
 allowed_operators = {
     ast.Add: operator.add,
     ast.Sub: operator.sub,
-    ast.Mult: operator.mul,
+    ast.Mult: guarded_mul,
     ast.Div: operator.truediv,
     ast.Mod: operator.mod,
-    ast.Pow: operator.pow,
+    ast.Pow: guarded_pow,
     ast.USub: operator.neg,
     ast.UAdd: operator.pos,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
 }
@@ -2,62 +2,196 @@
 
 import re
 import ast
-import math
-import re
-from .constants import allowed_names, allowed_operators
+import difflib
+import sys
+import time
+from . import arrays, columns, quadrature, stats, symbolic, userfuncs  # built-ins
+from .arrays import format_array, is_array, make_array
+from .bignum import BIGNUM_MODES, format_big_int
+from .cache import LRUCache
+from .compiler import CompiledExpression, free_names
+from .optimizer import optimize, unparse
+from .preprocessor import preprocess_expression
+from .result_cache import RESULT_CACHE_MIN_SECONDS, result_key
+from .constants import (
+    allowed_names,
+    allowed_operators,
+    math_constants,
+    special_forms,
+    COMPILE_CACHE_SIZE,
+)
 
 # Dictionary to store user variables
 variables = {}
 
+# Parsed expressions keyed on their raw source text
+_compiled_cache = LRUCache(COMPILE_CACHE_SIZE)
+
+# Result-cache keys (see _result_entry) keyed like _compiled_cache, so
+# looking a result up doesn't parse the expression again
+_result_keys = LRUCache(COMPILE_CACHE_SIZE)
+
+# Evaluation engine: "closure" (compiled, default) or "walker" (safe_eval)
+EVAL_ENGINES = ("closure", "walker")
+eval_engine = "closure"
+
+
+# How integers with more than bignum.BIG_INT_DIGITS digits are displayed
+bignum_mode = "sci"
+
+
+# Optional sandbox.SandboxWorker that evaluates in a separate process
+_sandbox = None
+
+# Optional result_cache.ResultCache for results of variable-free expressions
+_result_cache = None
+
+# Names the REPL and batch mode bind to the previous result
+ANSWER_NAMES = ("ans", "_")
+
+
+def set_sandbox(worker):
+    """Route evaluate_expression through `worker` (None to evaluate here)."""
+    global _sandbox
+    _sandbox = worker
+
 
-def preprocess_expression(expr):
+def set_result_cache(cache):
+    """Look up and store variable-free results in `cache` (None to stop)."""
+    global _result_cache
+    _result_cache = cache
+
+
+def sandbox():
+    """The SandboxWorker in use, or None."""
+    return _sandbox
+
+
+def result_cache():
+    """The ResultCache in use, or None."""
+    return _result_cache
+
+
+def set_bignum_mode(mode):
+    """Select how format_result shows huge integers (see bignum)."""
+    global bignum_mode
+    if mode not in BIGNUM_MODES:
+        raise ValueError(
+            f"Unknown display mode '{mode}'. Choose one of: {', '.join(BIGNUM_MODES)}"
+        )
+    bignum_mode = mode
+
+
+def set_engine(name):
+    """Select the evaluation engine used by evaluate_expression."""
+    global eval_engine
+    if name not in EVAL_ENGINES:
+        raise ValueError(
+            f"Unknown engine '{name}'. Choose one of: {', '.join(EVAL_ENGINES)}"
+        )
+    eval_engine = name
+
+
+def compile_expression(expr, shadowed=(), functions=None, cache=None):
     """
-    Prepare the input expression:
-    - Remove spaces
-    - Remove trailing '=' if present
-    - Replace '^' with '**'
-    - Replace 'pi' and 'e' only when they appear as whole words
-    - Parse factorials and implicit multiplication
+    Preprocess, parse and compile an expression, reusing the cached
+    CompiledExpression when the same source has been seen before.
+
+    Variables are left as names in the tree and looked up when the tree
+    is evaluated, so one cache entry serves every set of variable values.
+    `shadowed` lists the math constants the user has redefined.
+    `functions` (default allowed_names) is the function table calls are
+    compiled against, and `cache` the LRUCache holding the expressions
+    compiled against it (default: the module's).
     """
-    expr = expr.replace(" ", "")
-    if expr.endswith("="):
-        expr = expr[:-1]
-    expr = expr.replace("^", "**")
+    if cache is None:
+        cache = _compiled_cache
+    key = (expr, shadowed)
+    compiled = cache.get(key)
+    if compiled is None:
+        tree = parse_expression(expr, shadowed)
+        # Deeply nested input fails here like it does when evaluated
+        optimized, run = _translate_errors(_compile_tree, tree, functions)
+        compiled = CompiledExpression(expr, tree, run, optimized, functions)
+        cache.put(key, compiled)
+    return compiled
+
+
+def _compile_tree(tree, functions):
+    optimized = stats.stage("optimize", optimize, tree, functions)
+    return optimized, stats.stage("compile", optimized.compile, functions)
 
-    # Replace constants only when they appear as whole words
-    expr = re.sub(r"\bpi\b", f"({math.pi})", expr)
-    expr = re.sub(r"\be\b", f"({math.e})", expr)
 
-    expr = parse_factorials(expr)
-    expr = insert_implicit_multiplication(expr)
-    return expr
+def parse_expression(expr, shadowed=()):
+    """Preprocess and parse an expression into an ast.Expression."""
+    source = stats.stage("preprocess", preprocess_expression, expr, shadowed)
+    try:
+        return stats.stage("parse", ast.parse, source, "<unknown>", "eval")
+    except SyntaxError:
+        raise ValueError(
+            "Syntax error: please check your expression for invalid syntax."
+        )
 
 
-def insert_implicit_multiplication(expr):
+def explain_expression(expr, variables):
     """
-    Insert explicit multiplication operator '*' for cases like:
-    3(4+2), (2+3)4, or 5!(22)
+    Describe how an expression is evaluated: the preprocessed form that
+    is parsed, and the optimized form the compiled engine runs, with
+    constants folded and repeated subexpressions named $1, $2, ...
     """
-    expr = re.sub(r"(\d+|\))\s*\(", r"\1*(", expr)
-    expr = re.sub(r"\)\s*(\d+|factorial)", r")*\1", expr)
-    return expr
+    compiled = compile_expression(expr, shadowed_constants(variables))
+    return (
+        f"Parsed:    {unparse(compiled.tree)}\n"
+        f"Optimized: {compiled.optimized}"
+    )
 
 
-def parse_factorials(expr):
+def compile_cache_info():
+    """Return hit/miss/eviction counters of the compiled-expression cache."""
+    return _compiled_cache.info()
+
+
+def clear_compile_cache():
+    """Forget all compiled expressions and reset the cache counters."""
+    _compiled_cache.clear()
+
+
+def compile_cache_keys():
+    """The (source, shadowed) keys of the compiled expressions, oldest first."""
+    return _compiled_cache.keys()
+
+
+def warm_compile_cache(keys, seconds):
     """
-    Convert all occurrences of n! or (expr)! into factorial(expr)
-    so the safe_eval can handle them as function calls.
+    Compile (source, shadowed) keys as listed by compile_cache_keys(),
+    the most recent first, until `seconds` have passed. Sources that no
+    longer compile are skipped. Returns how many were compiled.
     """
-    pattern = re.compile(r"(\([^()]+\)|\d+)!")
-
-    while True:
-        match = pattern.search(expr)
-        if not match:
+    deadline = time.perf_counter() + seconds
+    compiled = []
+    for key in reversed(keys):
+        if time.perf_counter() > deadline:
             break
-        inner = match.group(1)
-        replacement = f"factorial({inner})"
-        expr = expr[: match.start()] + replacement + expr[match.end() :]
-    return expr
+        try:
+            compiled.append((key, compile_expression(*key)))
+        except ValueError:
+            pass
+    # Leave the most recent ones the most recently used, as they were
+    for key, value in reversed(compiled):
+        _compiled_cache.put(key, value)
+    return len(compiled)
+
+
+def load_lazy(variables, names):
+    """
+    Load the values among `names` that a restored session (see
+    snapshot.LazyVariables) has left in its file, and return them as a
+    dict. Needed before copying the variables; plain dicts return {}.
+    """
+    if type(variables) is dict:
+        return {}
+    load = getattr(variables, "load", None)
+    return load(names) if load is not None else {}
 
 
 def evaluate_expression(expr, variables):
@@ -66,28 +200,99 @@ def evaluate_expression(expr, variables):
     Enhanced error handling for user-friendly messages.
 
     Steps:
-    - Replace variables in expr with their values from the variables dict.
-    - Preprocess expression (handle factorial, ^, implicit mult, etc.).
-    - Parse and safely evaluate the expression AST.
+    - With a result cache, look up expressions without variables by the
+      hash of their parsed form, and store their results if computing
+      them took a while.
+    - Preprocess and compile the expression (cached per source string).
+    - Safely evaluate it, resolving names from the variables dict, with
+      either the compiled closures or the safe_eval tree walker.
+    - In sandbox mode, the last two steps happen in the worker process.
     """
-    # Replace variable names in the expression with their values
-    for var_name, var_value in variables.items():
-        # Replace whole word occurrences of var_name with its value as string
-        # Use word boundaries so 'x' doesn't replace parts of other words
-        expr = re.sub(rf"\b{re.escape(var_name)}\b", str(var_value), expr)
+    if _result_cache is not None:
+        return evaluate_cached(expr, variables, _evaluate, userfuncs.table)
+    return _evaluate(expr, variables)
 
-    expr = preprocess_expression(expr)
 
-    try:
-        tree = ast.parse(expr, mode="eval")
-    except SyntaxError:
-        raise ValueError(
-            "Syntax error: please check your expression for invalid syntax."
+def evaluate_cached(expr, variables, evaluate, table):
+    """
+    Look `expr` up in the result cache (see set_result_cache), or get it
+    from evaluate(expr, variables) and store it if that took a while.
+    Expressions that read variables or call a user function of `table`
+    (a userfuncs.FunctionTable) are always evaluated.
+    """
+    shadowed = shadowed_constants(variables)
+    entry = _result_keys.get((expr, shadowed))
+    if entry is None:
+        entry = _result_entry(parse_expression(expr, shadowed))
+        _result_keys.put((expr, shadowed), entry)
+    key, called = entry
+    if key is None or not table.defined.keys().isdisjoint(called):
+        return evaluate(expr, variables)
+    value = _result_cache.get(key)
+    if value is None:
+        start = time.perf_counter()
+        value = evaluate(expr, variables)
+        if time.perf_counter() - start >= RESULT_CACHE_MIN_SECONDS:
+            _result_cache.put(key, value)
+    return value
+
+
+def _result_entry(tree):
+    """
+    (result key, names of the functions called) for a parsed expression;
+    the key is None when it reads variables, as its result can change.
+    """
+    called = frozenset(
+        node.func.id
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+    )
+    return (None if free_names(tree) else result_key(tree)), called
+
+
+def _evaluate(expr, variables):
+    if _sandbox is not None:
+        return _sandbox.evaluate(expr, variables)
+    compiled = compile_expression(expr, shadowed_constants(variables))
+    return run_compiled(compiled, variables)
+
+
+def run_compiled(compiled, variables):
+    """Evaluate a CompiledExpression with the selected engine."""
+    if stats.enabled:
+        return stats.timed("evaluate", _run_compiled, compiled, variables)
+    return _run_compiled(compiled, variables)
+
+
+def _run_compiled(compiled, variables):
+    # Special forms evaluate in a copy of the variables
+    load_lazy(variables, compiled.names)
+    # The variables may hold arrays of a NumPy the caller imported
+    if not arrays.numpy_loaded and "numpy" in sys.modules:
+        arrays.load_numpy()
+    if eval_engine == "walker":
+        return evaluate_compiled(
+            lambda env: safe_eval(compiled.tree, env, compiled.functions), variables
         )
+    return evaluate_compiled(compiled.run, variables)
+
+
+def shadowed_constants(variables):
+    """Names of the math constants redefined in `variables`."""
+    return tuple(name for name in math_constants if name in variables)
+
+
+def evaluate_compiled(run, variables):
+    """
+    Call a compiled evaluator `run(variables)` and turn any failure
+    into a ValueError with a user-friendly message.
+    """
+    return _translate_errors(run, variables)
+
 
+def _translate_errors(func, *args):
     try:
-        result = safe_eval(tree)
-        return result
+        return func(*args)
     except ZeroDivisionError:
         raise ValueError("Math error: division by zero is undefined.")
     except ValueError as ve:
@@ -96,7 +301,7 @@ def evaluate_expression(expr, variables):
         if "Function" in msg and "unknown or not allowed" in msg:
             unknown_func = msg.split()[1]
             suggestions = difflib.get_close_matches(
-                unknown_func, allowed_names.keys(), n=3, cutoff=0.6
+                unknown_func, [*allowed_names, *special_forms], n=3, cutoff=0.6
             )
             suggestion_text = (
                 f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
@@ -111,32 +316,102 @@ def evaluate_expression(expr, variables):
         raise ValueError(f"Invalid expression: {e}")
 
 
-def process_assignment(expr, variables):
+def process_assignment(expr, variables, graph=None):
     """
     Detect assignment expressions of the form: var = expression
     If assignment found, evaluate the right-hand side expression,
-    store result in variables dictionary, and return None (no print).
-    If no assignment, return None.
+    store result in variables dictionary, and return a summary line.
+    Definitions of the form f(x, y) = expression define a user function
+    (see userfuncs) instead. If neither, return None.
+
+    With a reactive.DependencyGraph (spreadsheet mode) the expression is
+    kept and every variable derived from `var` is recomputed.
     """
+    if stats.enabled:
+        return stats.timed("assignment", _process_assignment, expr, variables, graph)
+    return _process_assignment(expr, variables, graph)
+
+
+def split_assignment(expr):
+    """Return (variable, expression) if `expr` is an assignment, else None."""
     # Match variable = expression, variable must be valid Python identifier
-    match = re.match(r"^\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*(.+)$", expr)
+    # ('x == 1' is a comparison)
+    match = re.match(r"^\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*=(?!=)\s*(.+)$", expr)
     if match:
-        var_name = match.group(1)
-        rhs_expr = match.group(2)
-        result = evaluate_expression(rhs_expr, variables)
-        variables[var_name] = result
-        return f"{var_name} = {format_result(result)}"
+        return match.group(1), match.group(2)
+    return None
+
+
+def split_definition(expr):
+    """
+    Return (name, [parameters], expression) if `expr` defines a function,
+    like f(x, y) = x^2 + y, else None.
+    """
+    match = re.match(
+        r"^\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\(\s*([a-zA-Z_][a-zA-Z0-9_]*"
+        r"(?:\s*,\s*[a-zA-Z_][a-zA-Z0-9_]*)*)\s*\)\s*=(?!=)\s*(.+)$",
+        expr,
+    )
+    if match:
+        params = [param.strip() for param in match.group(2).split(",")]
+        return match.group(1), params, match.group(3)
+    return None
+
+
+def remember_result(variables, value):
+    """Bind `ans` and `_` to the latest result."""
+    for name in ANSWER_NAMES:
+        variables[name] = value
+
+
+def _process_assignment(expr, variables, graph):
+    definition = split_definition(expr)
+    if definition:
+        return repr(userfuncs.define_function(*definition, variables))
+    assignment = split_assignment(expr)
+    if assignment:
+        var_name, rhs_expr = assignment
+        if graph is None:
+            result = evaluate_expression(rhs_expr, variables)
+            variables[var_name] = result
+            return f"{var_name} = {format_result(result)}"
+        result, updated, failed = graph.define(var_name, rhs_expr, variables)
+        return f"{var_name} = {format_result(result)}" + _summarize_updates(
+            updated, failed
+        )
     else:
         return None
 
 
-def safe_eval(node):
+def _summarize_updates(updated, failed, shown=5):
+    """Describe the variables a spreadsheet-mode assignment recomputed."""
+    text = ""
+    if updated:
+        names = ", ".join(updated[:shown])
+        if len(updated) > shown:
+            names += f" and {len(updated) - shown} more"
+        text += f" (updated: {names})"
+    for name, error in list(failed.items())[:shown]:
+        text += f"\n  {name}: {error}"
+    if len(failed) > shown:
+        text += f"\n  ... {len(failed) - shown} more variables failed"
+    return text
+
+
+def safe_eval(node, env=None, functions=None):
     """
     Recursively evaluate the parsed AST nodes in a safe manner,
     allowing only predefined operators and functions.
+    Names are resolved from `env` (defaults to the module's variables),
+    calls from `functions` (defaults to allowed_names).
     """
+    if env is None:
+        env = variables
+    if functions is None:
+        functions = allowed_names
+
     if isinstance(node, ast.Expression):
-        return safe_eval(node.body)
+        return safe_eval(node.body, env, functions)
 
     if isinstance(node, ast.Constant):
         if isinstance(node.value, (int, float)):
@@ -145,8 +420,8 @@ def safe_eval(node):
             raise ValueError(f"Invalid constant {node.value}")
 
     elif isinstance(node, ast.BinOp):
-        left = safe_eval(node.left)
-        right = safe_eval(node.right)
+        left = safe_eval(node.left, env, functions)
+        right = safe_eval(node.right, env, functions)
         op_type = type(node.op)
         if op_type in allowed_operators:
             return allowed_operators[op_type](left, right)
@@ -154,20 +429,45 @@ def safe_eval(node):
             raise ValueError(f"Operator {op_type} not allowed")
 
     elif isinstance(node, ast.UnaryOp):
-        operand = safe_eval(node.operand)
+        operand = safe_eval(node.operand, env, functions)
         op_type = type(node.op)
         if op_type in allowed_operators:
             return allowed_operators[op_type](operand)
         else:
             raise ValueError(f"Unary operator {op_type} not allowed")
 
+    elif isinstance(node, ast.Compare):
+        left = safe_eval(node.left, env, functions)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = safe_eval(comparator, env, functions)
+            op_type = type(op)
+            if op_type not in allowed_operators:
+                raise ValueError(f"Operator {op_type} not allowed")
+            if not allowed_operators[op_type](left, right):
+                return False
+            left = right
+        return True
+
     elif isinstance(node, ast.Call):
         if isinstance(node.func, ast.Name):
             func_name = node.func.id
-            if func_name not in allowed_names:
+            if func_name in special_forms:
+                if node.keywords:
+                    raise ValueError("Keyword arguments not allowed")
+                form = special_forms[func_name]
+                run = form.build(
+                    node.args,
+                    lambda arg: lambda env: safe_eval(arg, env, functions),
+                    functions,
+                )
+                return run(env)
+            if func_name not in functions:
+                if func_name in env and len(node.args) == 1 and not node.keywords:
+                    # Implicit multiplication with a variable, e.g. x(2+1)
+                    return env[func_name] * safe_eval(node.args[0], env, functions)
                 raise ValueError(f"Function {func_name} unknown or not allowed")
-            func = allowed_names[func_name]
-            args = [safe_eval(arg) for arg in node.args]
+            func = functions[func_name]
+            args = [safe_eval(arg, env, functions) for arg in node.args]
             if node.keywords:
                 raise ValueError("Keyword arguments not allowed")
 
@@ -185,13 +485,16 @@ def safe_eval(node):
         else:
             raise ValueError("Invalid function call")
 
+    elif isinstance(node, ast.List):
+        return make_array([safe_eval(item, env, functions) for item in node.elts])
+
     elif isinstance(node, ast.Name):
         var_name = node.id
-        if var_name in variables:
-            return variables[var_name]
-        elif var_name in ["pi", "e"]:
+        if var_name in env:
+            return env[var_name]
+        elif var_name in math_constants:
             # Return math constants if used directly (just in case)
-            return {"pi": math.pi, "e": math.e}[var_name]
+            return math_constants[var_name]
         else:
             raise ValueError(f"Unknown variable or identifier {var_name}")
 
@@ -199,16 +502,31 @@ def safe_eval(node):
         raise ValueError(f"Unsupported expression: {type(node)}")
 
 
-def format_result(result):
+def format_result(result, mode=None):
     """
     Format the result for output:
     - Integers are formatted with commas
-    - Floats with integer value are converted to int and formatted
+    - Integers over bignum.BIG_INT_DIGITS digits are shown compactly
+      (scientific or head...tail with a digit count) unless `mode`, or
+      the session's bignum_mode, is "full"
+    - Floats with integer value (below 1e100) are converted to int
     - Other floats formatted with commas
+    - Vectors and matrices as [1, 2.5, 3] (see arrays.format_array)
     """
-    if isinstance(result, float) and result.is_integer():
+    if stats.enabled:
+        return stats.timed("format", _format_result, result, mode)
+    return _format_result(result, mode)
+
+
+def _format_result(result, mode):
+    # Huge integral floats keep float notation (1e+300) rather than
+    # showing the binary rounding error in their decimal expansion
+    if isinstance(result, float) and result.is_integer() and abs(result) < 1e100:
         result = int(result)
     if isinstance(result, int):
+        if result.bit_length() > 256:
+            return format_big_int(result, mode or bignum_mode)
         return f"{result:,}"
-    else:
-        return f"{result:,}"
+    if is_array(result):
+        return format_array(result)
+    return f"{result:,}"
@@ -1,17 +1,34 @@
 import os
 import sys
 import argparse
-import pydoc
+from . import stats, userfuncs
+from .bignum import BIGNUM_MODES
+from .core import (
+    EVAL_ENGINES,
+    set_bignum_mode,
+    set_engine,
+    set_result_cache,
+    set_sandbox,
+)
+from .result_cache import RESULT_CACHE_FILE, ResultCache
+from .batch import BATCH_FORMATS, run_batch
+from .sandbox import SandboxWorker, SANDBOX_TIMEOUT, SANDBOX_MEMORY_MB
+from .snapshot import load_snapshot, save_snapshot, session_path
 
 HISTORY_FILE = "history.json"
 VERSION = "0.5"
 
+# Session restored at startup and saved on exit (--session NAME)
+session_name = None
+
 
 def show_doc(filename):
     """
     Displays documentation from the docs/ directory using a pager.
     Works regardless of where the script is run from.
     """
+    import pydoc  # Only for --man and --tldr: it slows down startup
+
     base_dir = os.path.dirname(os.path.abspath(__file__))
     docs_path = os.path.join(base_dir, "..", "docs", filename)
     try:
@@ -31,7 +48,100 @@ def handle_command_line_args():
     parser.add_argument(
         "--version", action="store_true", help="Show the program version"
     )
+    parser.add_argument(
+        "--batch",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="Evaluate expressions from FILE (or stdin) without the REPL",
+    )
+    parser.add_argument(
+        "--format",
+        choices=BATCH_FORMATS,
+        default="text",
+        help="Output format for --batch (default: text)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=EVAL_ENGINES,
+        default="closure",
+        help="Expression evaluation engine (default: closure)",
+    )
+    parser.add_argument(
+        "--bignum",
+        choices=BIGNUM_MODES,
+        default="sci",
+        help="How integers over 100 digits are shown: scientific, truncated "
+        "head...tail, or every digit (default: sci)",
+    )
+    parser.add_argument(
+        "--sandbox",
+        action="store_true",
+        help="Evaluate in a worker process that is killed on runaway input",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=SANDBOX_TIMEOUT,
+        help="Sandbox time limit per evaluation in seconds "
+        f"(default: {SANDBOX_TIMEOUT:g})",
+    )
+    parser.add_argument(
+        "--memory",
+        type=int,
+        default=SANDBOX_MEMORY_MB,
+        help=f"Sandbox memory limit in MB (default: {SANDBOX_MEMORY_MB})",
+    )
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=RESULT_CACHE_FILE,
+        metavar="FILE",
+        help="Keep results of variable-free expressions in an SQLite file "
+        f"across sessions (default: {RESULT_CACHE_FILE})",
+    )
+    parser.add_argument(
+        "--memo",
+        type=int,
+        default=userfuncs.MEMO_SIZE,
+        metavar="SIZE",
+        help="Results memoized per user function, 0 to turn memoization off "
+        f"(default: {userfuncs.MEMO_SIZE})",
+    )
+    parser.add_argument(
+        "--session",
+        metavar="NAME",
+        help="Restore the saved session NAME at startup (if it exists) and "
+        "save it on exit",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Time each evaluation stage and count function calls "
+        "(see the 'stats' command; batch mode prints a report to stderr)",
+    )
+    parser.add_argument(
+        "--serve",
+        nargs="?",
+        const="127.0.0.1:8765",
+        metavar="ADDRESS",
+        help="Run the JSON evaluation server on host:port or unix:/path "
+        "(default: 127.0.0.1:8765)",
+    )
     args = parser.parse_args()
+    global session_name
+    session_name = args.session
+    set_engine(args.engine)
+    set_bignum_mode(args.bignum)
+    if args.memo < 0:
+        parser.error("--memo cannot be negative")
+    userfuncs.set_memo_size(args.memo)
+    if args.sandbox:
+        set_sandbox(SandboxWorker(args.timeout, args.memory))
+    if args.cache is not None:
+        set_result_cache(ResultCache(args.cache))
+    if args.profile:
+        stats.enable()
 
     if args.man:
         show_doc("man.txt")
@@ -42,3 +152,49 @@ def handle_command_line_args():
     elif args.version:
         print(f"LemmaCalc™ version {VERSION}")
         sys.exit(0)
+    elif args.serve is not None:
+        from .server import serve
+
+        serve(args.serve)
+        sys.exit(0)
+    elif args.batch is not None or not sys.stdin.isatty():
+        # Piped input runs headless: no banner, no prompt, no TTY handling
+        status = run_batch_file(args.batch or "-", args.format, args.session)
+        if args.profile:
+            print(stats.report(), file=sys.stderr)
+        sys.exit(status)
+
+
+def run_batch_file(path, fmt, session=None):
+    """
+    Run batch mode on a file path ('-' for stdin); return an exit status.
+    With a `session` name, start from that saved session (its variables
+    and spreadsheet formulas) and save both back to it at the end.
+    """
+    variables = {}
+    graph = None
+    if session is not None:
+        try:
+            session_file = session_path(session)
+            if os.path.exists(session_file):
+                snapshot = load_snapshot(session_file)
+                variables, graph = snapshot.variables, snapshot.graph
+        except (OSError, ValueError) as e:
+            print(f"Cannot load session '{session}': {e}", file=sys.stderr)
+            return 2
+    if path == "-":
+        errors = run_batch(sys.stdin, fmt=fmt, variables=variables, graph=graph)
+    else:
+        try:
+            with open(path, "r") as f:
+                errors = run_batch(f, fmt=fmt, variables=variables, graph=graph)
+        except OSError as e:
+            print(f"Cannot read '{path}': {e}", file=sys.stderr)
+            return 2
+    if session is not None:
+        try:
+            save_snapshot(session_file, variables, graph)
+        except OSError as e:
+            print(f"Cannot save session '{session}': {e}", file=sys.stderr)
+            return 2
+    return 1 if errors else 0
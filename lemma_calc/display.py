@@ -52,13 +52,34 @@ def print_instructions():
     - Use parentheses to group expressions, e.g. (2 + 3) * 4.
     - Factorials can be used by appending '!' to integers or expressions, e.g. 5! or (2+3)!.
     - '^' can be used as shorthand for exponentiation, e.g. 2^3 = 8.
-    - Implicit multiplication is supported: 3(2+1), (2+3)4, or 5!(22).
+    - Implicit multiplication is supported: 3(2+1), (2+3)4, 2pi, 3sin(2) or 5!(22).
     - Supports functions: sin, cos, tan, asin, acos, atan, log, log10, sqrt,
       exp, floor, ceil, abs, round, factorial, degrees, radians.
+    - Integrate numerically with integrate(expr, x, a, b), e.g. integrate(x^2, x, 0, 1).
+    - Solve equations with solve(x^2 = 2, x) or root(cos(x) - x, x, 1).
+    - Define functions with f(x) = x^2 + 3x; recurse with if(cond, a, b) and
+      comparisons, e.g. fib(n) = if(n < 2, n, fib(n-1) + fib(n-2)).
     - Constants: pi, e
     - End expressions with '=' if desired (optional).
-    - {B}Type 'history'{R} to view past results.
+    - {B}Type 'history'{R} to view past results ('history page N', 'history last N',
+      'history search <term>').
+    - {B}Type 'explain <expr>'{R} to see the optimized form that gets evaluated.
+    - {B}Type 'table <expr> for x in a..b step h'{R} to sample an expression
+      over a range (add '> file.csv' to write CSV).
+    - Huge integers are shown compactly; {B}type 'full'{R} for every digit of the last
+      result, or 'bignum trunc' / 'bignum sci' to change the compact style.
+    - {B}Type 'stats on'{R} to time each evaluation stage, then 'stats' to see it.
+    - {B}Type 'spreadsheet on'{R} to keep formulas so variables update when their
+      inputs change ('spreadsheet off' to stop).
     - {B}Type 'clear'{R} to clear the screen.
     - {B}Type 'q'{R} to quit.
     """
     print(instructions)
+
+
+def print_history_entries(rows):
+    """Print numbered history rows as produced by HistoryIndex."""
+    for i, (ts, expr, res) in rows:
+        print(
+            f"{Colors.BOLD}{i}.{Colors.RESET} [{Colors.DIM}{ts}{Colors.RESET}] {expr} = {Colors.GREEN}{res}{Colors.RESET}"
+        )
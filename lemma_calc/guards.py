@@ -0,0 +1,97 @@
+# lemma_calc/guards.py
+
+import contextlib
+import math
+import operator
+import threading
+
+# Largest integer result (in bits) an operation may produce; ~1.2M digits
+MAX_RESULT_BITS = 4_000_000
+
+_LOG2_10 = math.log2(10)
+
+# The cancellation event of the evaluation running on each thread
+_cancel = threading.local()
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _reject(what, bits):
+    digits = int(bits / _LOG2_10) + 1
+    limit = int(MAX_RESULT_BITS / _LOG2_10)
+    raise ValueError(
+        f"Resource error: {what} would have about {digits:,} digits "
+        f"(limit {limit:,})."
+    )
+
+
+def estimate_pow_bits(base, exponent):
+    """Upper bound on the bit length of base ** exponent for integers."""
+    if exponent <= 0 or base in (0, 1, -1):
+        return 1
+    return base.bit_length() * exponent
+
+
+def estimate_factorial_bits(n):
+    """Bit length of n! from the log-gamma function (no big-int work)."""
+    if n < 2:
+        return 1
+    if n > 10**12:
+        return math.inf  # lgamma would overflow converting n to float
+    return math.lgamma(n + 1) / math.log(2)
+
+
+def guarded_pow(base, exponent):
+    """operator.pow that refuses integer results over MAX_RESULT_BITS."""
+    if _is_int(base) and _is_int(exponent):
+        bits = estimate_pow_bits(base, exponent)
+        if bits > MAX_RESULT_BITS:
+            _reject("this power", bits)
+    return operator.pow(base, exponent)
+
+
+def guarded_mul(left, right):
+    """operator.mul that refuses integer products over MAX_RESULT_BITS."""
+    if _is_int(left) and _is_int(right):
+        bits = left.bit_length() + right.bit_length()
+        if bits > MAX_RESULT_BITS:
+            _reject("product", bits)
+    return operator.mul(left, right)
+
+
+def guarded_factorial(n):
+    """math.factorial that refuses results over MAX_RESULT_BITS."""
+    if _is_int(n):
+        bits = estimate_factorial_bits(n)
+        if bits > MAX_RESULT_BITS:
+            _reject("this factorial", bits)
+    return math.factorial(n)
+
+
+@contextlib.contextmanager
+def cancellable(event):
+    """
+    Run the body as an evaluation that can be cancelled by setting the
+    threading.Event `event`: check_cancelled() on this thread then
+    raises KeyboardInterrupt.
+    """
+    previous = getattr(_cancel, "event", None)
+    _cancel.event = event
+    try:
+        yield
+    finally:
+        _cancel.event = previous
+
+
+def check_cancelled():
+    """
+    Raise KeyboardInterrupt if the evaluation on this thread has been
+    cancelled (see cancellable). Loops that may run long (integrands,
+    root finding, table rows, user function calls) call it at each
+    step, so a cancellation takes effect only at these points.
+    """
+    event = getattr(_cancel, "event", None)
+    if event is not None and event.is_set():
+        raise KeyboardInterrupt
@@ -1,33 +1,279 @@
 # lemma_calc/history.py
 import json
+import os
+import threading
+from collections import deque
 from datetime import datetime
 
+# Legacy whole-file history (migrated once to HISTORY_LOG)
 HISTORY_FILE = "history.json"
+# Append-only log: one JSON array [timestamp, expression, result] per line
+HISTORY_LOG = "history.jsonl"
 
+# fsync the log every N appended records (0 = leave flushing to the OS)
+FSYNC_EVERY = 1
+# Compaction keeps at most this many of the most recent entries
+HISTORY_MAX_ENTRIES = 100_000
 
-def load_history():
+_TAIL_BLOCK = 64 * 1024
+
+
+def _timestamp():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _upgrade(entry):
+    """Upgrade old entries missing a timestamp."""
+    if len(entry) == 2:
+        return [_timestamp(), entry[0], entry[1]]
+    return list(entry)
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _parse_line(line):
+    """Decode one log line; torn or corrupted lines yield None."""
     try:
-        with open(HISTORY_FILE, "r") as f:
+        entry = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(entry, list) or len(entry) not in (2, 3):
+        return None
+    return _upgrade(entry)
+
+
+class HistoryLog:
+    """
+    Append-only, crash-safe history stored as JSON lines.
+
+    Every evaluation appends one record and flushes it, and the file is
+    fsynced every `fsync_every` records, so a crash loses at most that
+    many entries. A torn last line is skipped when reading. Reading is
+    lazy: `tail(n)` only reads the end of the file.
+    """
+
+    def __init__(
+        self, path=HISTORY_LOG, fsync_every=FSYNC_EVERY, legacy_path=HISTORY_FILE
+    ):
+        self.path = path
+        self.fsync_every = fsync_every
+        self._lock = threading.Lock()
+        self._file = None
+        self._pending = 0
+        if legacy_path:
+            migrate_legacy_history(legacy_path, path)
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+            if self._file.tell() > 0 and not _ends_with_newline(self.path):
+                # Terminate a line torn by a crash before appending
+                self._file.write("\n")
+        return self._file
+
+    def append(self, expr, result, ts=None):
+        """Append one entry and return it as [timestamp, expr, result]."""
+        entry = [ts or _timestamp(), expr, result]
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            f = self._open()
+            f.write(line)
+            f.flush()
+            self._pending += 1
+            if self.fsync_every and self._pending >= self.fsync_every:
+                os.fsync(f.fileno())
+                self._pending = 0
+        return entry
+
+    def sync(self):
+        """Flush and fsync any records not yet on disk."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+                self._pending = 0
+
+    def __iter__(self):
+        """Stream all entries from the start of the log."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = _parse_line(line)
+                    if entry is not None:
+                        yield entry
+        except FileNotFoundError:
+            return
+
+    def iter_from(self, offset=0):
+        """
+        Stream (start, end, entry) for every complete line from byte
+        `offset` on; `entry` is None for corrupted lines. Stops before a
+        last line that is still being written.
+        """
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                entry = _parse_line(raw.decode("utf-8", errors="replace"))
+                yield offset, offset + len(raw), entry
+                offset += len(raw)
+
+    def read_at(self, offset):
+        """Return the entry whose line starts at byte `offset`."""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return _parse_line(f.readline().decode("utf-8", errors="replace"))
+
+    def tail(self, n):
+        """Return the last `n` entries, reading only the end of the file."""
+        if n <= 0:
+            return []
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                pos = f.tell()
+                data = b""
+                while pos > 0 and data.count(b"\n") <= n:
+                    step = min(_TAIL_BLOCK, pos)
+                    pos -= step
+                    f.seek(pos)
+                    data = f.read(step) + data
+        except FileNotFoundError:
+            return []
+        lines = data.decode("utf-8", errors="replace").splitlines()
+        if pos > 0:
+            lines = lines[1:]  # first line may be cut in half
+        entries = [e for e in map(_parse_line, lines) if e is not None]
+        return entries[-n:]
+
+    def compact(self, max_entries=HISTORY_MAX_ENTRIES):
+        """
+        Rewrite the log without torn lines, keeping the newest
+        `max_entries` entries. Records appended while compacting are
+        carried over, so this is safe to run next to append().
+        Returns True if the file was rewritten.
+        """
+        try:
+            snapshot = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return False
+
+        entries = deque(maxlen=max_entries)
+        dropped = 0
+        offset = 0
+        with open(self.path, "rb") as f:
+            for raw in f:
+                if offset + len(raw) > snapshot or not raw.endswith(b"\n"):
+                    break  # still being written; carried over below
+                offset += len(raw)
+                entry = _parse_line(raw.decode("utf-8", errors="replace"))
+                if entry is None:
+                    dropped += 1
+                    continue
+                if len(entries) == entries.maxlen:
+                    dropped += 1
+                entries.append(entry)
+        if not dropped:
+            return False
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as tmp:
+            for entry in entries:
+                line = json.dumps(entry, ensure_ascii=False) + "\n"
+                tmp.write(line.encode("utf-8"))
+            with self._lock:
+                if self._file is not None:
+                    self._file.flush()
+                # Carry over anything appended since the snapshot
+                with open(self.path, "rb") as f:
+                    f.seek(offset)
+                    tmp.write(f.read())
+                tmp.flush()
+                os.fsync(tmp.fileno())
+                os.replace(tmp_path, self.path)
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+        return True
+
+    def compact_in_background(self, max_entries=HISTORY_MAX_ENTRIES):
+        """Run compact() on a daemon thread and return the thread."""
+
+        def run():
+            try:
+                self.compact(max_entries)
+            except Exception as e:
+                print(f"History compaction failed: {e}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+def migrate_legacy_history(legacy_path=HISTORY_FILE, log_path=HISTORY_LOG):
+    """
+    One-time migration of the legacy whole-file JSON history into the
+    append-only log. The legacy file is renamed to `<name>.bak` after.
+    Returns the number of migrated entries.
+    """
+    if not os.path.exists(legacy_path) or os.path.exists(log_path):
+        return 0
+    try:
+        with open(legacy_path, "r") as f:
             data = json.load(f)
-            # Upgrade old entries missing a timestamp
-            upgraded = []
-            for entry in data:
-                if len(entry) == 2:
-                    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    upgraded.append([ts, entry[0], entry[1]])
-                else:
-                    upgraded.append(entry)
-            return upgraded
-    except FileNotFoundError:
-        return []
     except json.JSONDecodeError:
         print("Warning: Corrupted history file. Starting with empty history.")
-        return []
+        data = []
+    tmp_path = log_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for entry in data:
+            f.write(json.dumps(_upgrade(entry), ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, log_path)
+    os.replace(legacy_path, legacy_path + ".bak")
+    return len(data)
+
+
+def load_history(limit=None, path=HISTORY_LOG):
+    """
+    Load history entries from the log; only the last `limit` entries
+    are read when a limit is given. The legacy history file is only
+    migrated for the default log.
+    """
+    log = HistoryLog(path, legacy_path=HISTORY_FILE if path == HISTORY_LOG else None)
+    if limit is not None:
+        return log.tail(limit)
+    return list(log)
 
 
-def save_history(history):
+def save_history(history, path=HISTORY_LOG):
+    """Replace the whole log with `history` (a list of entries)."""
     try:
-        with open(HISTORY_FILE, "w") as f:
-            json.dump(history, f, indent=2)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in history:
+                f.write(json.dumps(list(entry), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
     except Exception as e:
         print(f"Failed to save history: {e}")
@@ -0,0 +1,173 @@
+# lemma_calc/history_index.py
+
+import json
+import os
+import re
+from array import array
+
+INDEX_VERSION = 1
+# Entries shown per page by the `history` command
+PAGE_SIZE = 20
+
+_TERM_PATTERN = re.compile(r"[a-z_][a-z0-9_]*|[0-9][0-9.,]*")
+
+
+def index_terms(text):
+    """
+    Split an expression or result into lowercase search terms.
+    Thousands separators are dropped so '1,234' matches '1234'.
+    """
+    terms = _TERM_PATTERN.findall(text.lower())
+    return {term.replace(",", "").rstrip(".") for term in terms}
+
+
+class HistoryIndex:
+    """
+    Inverted index over a HistoryLog's expressions and results.
+
+    Entries are numbered from 1 in log order. The index keeps the byte
+    offset of every entry (for paging without reading the whole log) and
+    a posting list of entry numbers per term. It is brought up to date
+    incrementally from where it last stopped, and persisted next to the
+    log as a header line plus one appended segment per save, so neither
+    a restart nor a save touches entries indexed earlier. If the log was
+    rewritten (compaction) the index is rebuilt.
+    """
+
+    def __init__(self, log, path=None):
+        self.log = log
+        self.path = path or log.path + ".idx"
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        self.offsets = array("Q")
+        self.postings = {}
+        self.inode = None
+        self.size = 0
+        # Entries indexed since the last save, written as the next segment
+        self._saved_count = 0
+        self._segments = 0
+        self._rewrite = True
+
+    def _log_stat(self):
+        try:
+            st = os.stat(self.log.path)
+        except FileNotFoundError:
+            return None, 0
+        return st.st_ino, st.st_size
+
+    def _load(self):
+        self._loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if header.get("version") != INDEX_VERSION:
+                    return
+                for line in f:
+                    segment = json.loads(line)
+                    self.offsets.extend(segment["offsets"])
+                    for term, numbers in segment["postings"].items():
+                        self.postings.setdefault(term, []).extend(numbers)
+                    self.size = segment["size"]
+                    self._segments += 1
+        except (FileNotFoundError, ValueError, KeyError):
+            self._reset()
+            return
+        self.inode = header["inode"]
+        self._saved_count = len(self.offsets)
+        # Fold many small segments back into one on the next save
+        self._rewrite = self._segments > 32
+
+    def update(self):
+        """Index any entries appended to the log since the last update."""
+        if not self._loaded:
+            self._load()
+        inode, size = self._log_stat()
+        if inode != self.inode or size < self.size:
+            # Log was replaced or truncated: start over
+            self._reset()
+            self.inode = inode
+        if size == self.size:
+            return
+        for start, end, entry in self.log.iter_from(self.size):
+            if entry is not None:
+                self.offsets.append(start)
+                number = len(self.offsets)
+                for term in index_terms(f"{entry[1]} {entry[2]}"):
+                    self.postings.setdefault(term, []).append(number)
+            self.size = end
+
+    def _segment(self, first):
+        """Offsets and postings of entries numbered `first` and above."""
+        postings = {}
+        for term, numbers in self.postings.items():
+            if numbers[-1] >= first:
+                i = len(numbers)
+                while i > 0 and numbers[i - 1] >= first:
+                    i -= 1
+                postings[term] = numbers[i:]
+        return {
+            "size": self.size,
+            "offsets": self.offsets[first - 1 :].tolist(),
+            "postings": postings,
+        }
+
+    def save(self):
+        """Persist entries indexed since the last save."""
+        if not self._loaded:
+            return
+        if self._rewrite:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                header = {"version": INDEX_VERSION, "inode": self.inode}
+                f.write(json.dumps(header) + "\n")
+                f.write(json.dumps(self._segment(1), separators=(",", ":")) + "\n")
+            os.replace(tmp_path, self.path)
+            self._rewrite = False
+        elif len(self.offsets) > self._saved_count:
+            segment = self._segment(self._saved_count + 1)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(segment, separators=(",", ":")) + "\n")
+        self._saved_count = len(self.offsets)
+
+    def __len__(self):
+        self.update()
+        return len(self.offsets)
+
+    def entries(self, numbers):
+        """Return [(number, entry), ...] for the given entry numbers."""
+        self.update()
+        rows = []
+        for number in numbers:
+            if 1 <= number <= len(self.offsets):
+                rows.append((number, self.log.read_at(self.offsets[number - 1])))
+        return rows
+
+    def page(self, page, page_size=PAGE_SIZE):
+        """Return the rows of a 1-based page in log order."""
+        start = (page - 1) * page_size + 1
+        return self.entries(range(start, start + page_size))
+
+    def last(self, n):
+        """Return the rows of the last `n` entries."""
+        count = len(self)
+        return self.entries(range(max(1, count - n + 1), count + 1))
+
+    def search(self, query, limit=None):
+        """
+        Return entry numbers containing every term of `query`, newest
+        first. Terms match whole tokens of the expression or result.
+        """
+        self.update()
+        terms = index_terms(query)
+        if not terms:
+            return []
+        lists = sorted((self.postings.get(term, []) for term in terms), key=len)
+        matches = set(lists[0])
+        for postings in lists[1:]:
+            matches.intersection_update(postings)
+            if not matches:
+                break
+        numbers = sorted(matches, reverse=True)
+        return numbers[:limit] if limit is not None else numbers
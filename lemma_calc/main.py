@@ -1,14 +1,33 @@
 # lemma_calc.main.py
 
+import os
 import threading
-from prompt_toolkit import prompt
+import time
+from prompt_toolkit import PromptSession
+from prompt_toolkit.patch_stdout import patch_stdout
+from prompt_toolkit.styles import Style
+from .background import BackgroundEvaluator
+from .columns import run_load_command
 from .display import Colors
-from .prompt_utils import completer, wait_for_keypress_or_timeout
+from .prompt_utils import completer, completions, wait_for_keypress_or_timeout
 from .display import print_banner, print_instructions, clear_screen
-from .core import evaluate_expression, format_result, process_assignment
-from .history import load_history, save_history
+from .display import print_history_entries
+from .core import evaluate_expression, explain_expression, format_result
+from .core import process_assignment, remember_result, split_assignment
+from .core import split_definition
+from .history import HistoryLog
+from .history_index import HistoryIndex, PAGE_SIZE
+from .reactive import DependencyGraph
+from .snapshot import load_snapshot, save_snapshot, session_path
+from .table import run_table_command
+from . import core, core_utils, quadrature, stats
+from .bignum import BIGNUM_MODES
 from .core_utils import handle_command_line_args, show_doc
-from datetime import datetime
+
+# Seconds between redraws of the toolbar showing the running job
+TOOLBAR_REFRESH = 0.25
+
+_TOOLBAR_STYLE = Style.from_dict({"bottom-toolbar": "noreverse #888888"})
 
 
 def main():
@@ -17,81 +36,355 @@ def main():
     wait_for_keypress_or_timeout(5, skip_event)
     print_banner(skip_event)
     print_instructions()
-    variables = {}
-    history = load_history()
+    history = HistoryLog()
+    history.compact_in_background()
+    history_index = HistoryIndex(history)
+    completions.load_history(history_index)
+    state = ReplState(history, history_index)
+    session = core_utils.session_name
+    if session is not None and os.path.exists(session_path(session)):
+        state.variables, state.graph = load_session(
+            session, state.variables, state.graph
+        )
+
+    # Input is handled in the background so the prompt stays live: the
+    # toolbar shows the running job and Ctrl-C cancels it
+    evaluator = BackgroundEvaluator()
+    prompt_session = PromptSession(
+        completer=completer,
+        bottom_toolbar=evaluator.status,
+        refresh_interval=TOOLBAR_REFRESH,
+        style=_TOOLBAR_STYLE,
+    )
+    with patch_stdout(raw=True):
+        while True:
+            try:
+                user_input = prompt_session.prompt(
+                    "\nEnter calculation (or 'q' to quit): "
+                ).strip()
+            except KeyboardInterrupt:
+                if evaluator.cancel() is None:
+                    print("Nothing to cancel (q or Ctrl-D quits).")
+                continue
+            except EOFError:
+                print("\nGoodbye!")
+                break
+            except Exception as e:
+                print(f"{Colors.BOLD}{Colors.RED}Unexpected error:{Colors.RESET} {e}")
+                continue
+
+            if user_input.lower() == "q":
+                print("Goodbye!")
+                break
+
+            if user_input.lower() == "clear":
+                clear_screen()
+                print_banner(skip_event=None)
+                print_instructions()
+                continue
+
+            if user_input.lower() == "man":
+                show_doc("man.txt")
+                continue
+
+            if user_input.lower() == "tldr":
+                show_doc("tldr.txt")
+                continue
+
+            if user_input == "":
+                continue
+
+            evaluator.submit(user_input, handle_input, user_input, state)
+
+        evaluator.close()
+    if session is not None:
+        save_session(session, state.variables, state.graph)
+    history.close()
+    history_index.save()
 
-    while True:
+
+class ReplState:
+    """
+    The session the REPL's input handlers work on: variables, the
+    spreadsheet-mode DependencyGraph (None when off), the last expression
+    result (for `full`) and the history.
+    """
+
+    def __init__(self, history, history_index):
+        self.variables = {}
+        self.graph = None
+        self.last_result = None
+        self.history = history
+        self.history_index = history_index
+
+
+def handle_input(user_input, state):
+    """Run one line of REPL input (commands or ';'-separated statements)."""
+    if user_input.lower().split(" ", 1)[0] == "history":
+        show_history(user_input.split()[1:], state.history_index)
+        return
+
+    if user_input.lower().split(" ", 1)[0] == "explain":
+        expr = user_input[len("explain") :].strip()
+        if not expr:
+            print("Usage: explain <expression>")
+            return
         try:
-            user_input = prompt(
-                "\nEnter calculation (or 'q' to quit): ", completer=completer
-            ).strip()
-        except (EOFError, KeyboardInterrupt):
-            print("\nGoodbye!")
-            break
+            print(explain_expression(expr, state.variables))
         except Exception as e:
-            print(f"{Colors.BOLD}{Colors.RED}Unexpected error:{Colors.RESET} {e}")
-            continue
-
-        if user_input.lower() == "q":
-            print("Goodbye!")
-            break
-
-        if user_input.lower() == "clear":
-            clear_screen()
-            print_banner(skip_event=None)
-            print_instructions()
-            continue
-
-        if user_input.lower() == "history":
-            if not history:
-                print("No history yet.")
+            print(f"{Colors.BOLD}{Colors.RED}Error:{Colors.RESET} {e}")
+        return
+
+    if user_input.lower().split(" ", 1)[0] == "table":
+        try:
+            rows = run_table_command(user_input, state.variables)
+            print(f"{Colors.DIM}{rows:,} rows{Colors.RESET}")
+        except KeyboardInterrupt:
+            print("\nTable stopped.")
+        except Exception as e:
+            print(f"{Colors.BOLD}{Colors.RED}Error:{Colors.RESET} {e}")
+        return
+
+    if user_input.lower().split(" ", 1)[0] == "bignum":
+        mode = user_input.lower().split()[1:]
+        if not mode:
+            print(f"Big integers are shown in '{core.bignum_mode}' mode.")
+        elif mode[0] in BIGNUM_MODES:
+            core.set_bignum_mode(mode[0])
+            print(f"Big integers are now shown in '{mode[0]}' mode.")
+        else:
+            print(f"Usage: bignum [{' | '.join(BIGNUM_MODES)}]")
+        return
+
+    if user_input.lower().split(" ", 1)[0] == "full":
+        expr = user_input[len("full") :].strip()
+        try:
+            if expr:
+                value = evaluate_expression(expr, state.variables)
             else:
-                print("History:")
-                for i, (ts, expr, res) in enumerate(history, 1):
-                    print(
-                        f"{Colors.BOLD}{i}.{Colors.RESET} [{Colors.DIM}{ts}{Colors.RESET}] {expr} = {Colors.GREEN}{res}{Colors.RESET}"
-                    )
-            continue
+                value = state.last_result
+            if value is None:
+                print("No result yet.")
+            else:
+                print(f"Result: {format_result(value, 'full')}")
+        except Exception as e:
+            print(f"{Colors.BOLD}{Colors.RED}Error:{Colors.RESET} {e}")
+        return
+
+    if user_input.lower().split(" ", 1)[0] == "cache":
+        show_cache(user_input.lower().split()[1:])
+        return
 
-        if user_input.lower() == "man":
-            show_doc("man.txt")
-            continue
+    words = user_input.lower().split()
+    if len(words) >= 2 and words[0] in ("save", "load") and words[1] == "session":
+        if len(words) != 3:
+            print(f"Usage: {words[0]} session <name>")
+        elif words[0] == "save":
+            save_session(user_input.split()[2], state.variables, state.graph)
+        else:
+            state.variables, state.graph = load_session(
+                user_input.split()[2], state.variables, state.graph
+            )
+        return
 
-        if user_input.lower() == "tldr":
-            show_doc("tldr.txt")
-            continue
+    if words and words[0] == "load":
+        try:
+            name = run_load_command(user_input, state.variables)
+            completions.note_variable(name)
+            print(f"{name} = {len(state.variables[name]):,} values (memory-mapped)")
+        except Exception as e:
+            print(f"{Colors.BOLD}{Colors.RED}Error:{Colors.RESET} {e}")
+        return
 
-        if user_input == "":
-            continue
+    if user_input.lower().split(" ", 1)[0] == "stats":
+        show_stats(user_input.lower().split()[1:])
+        return
 
-        # Split input by semicolons for multi-expression support
-        expressions = [expr.strip() for expr in user_input.split(";") if expr.strip()]
+    if user_input.lower() in ("spreadsheet on", "spreadsheet off"):
+        if user_input.lower().endswith("on"):
+            state.graph = state.graph or DependencyGraph()
+            print("Spreadsheet mode on: derived variables now update.")
+        else:
+            state.graph = None
+            print("Spreadsheet mode off.")
+        return
 
-        for expr in expressions:
-            try:
-                # Evaluate expression or handle assignment
-                result = None
-                assignment_result = process_assignment(expr, variables)
-                if assignment_result is not None:
-                    print(assignment_result)
-                    history.append(
-                        (
-                            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            expr,
-                            assignment_result,
-                        )
-                    )
+    # Split input by semicolons for multi-expression support
+    expressions = [expr.strip() for expr in user_input.split(";") if expr.strip()]
+
+    for expr in expressions:
+        quadrature.take_reports()  # drop those left by a failed evaluation
+        try:
+            # Evaluate expression or handle assignment
+            result = None
+            assignment_result = process_assignment(
+                expr, state.variables, state.graph
+            )
+            if assignment_result is not None:
+                print(assignment_result)
+                show_integration_report()
+                state.history.append(expr, assignment_result)
+                assignment = split_assignment(expr)
+                if assignment is None:
+                    completions.note_function(split_definition(expr)[0])
                 else:
-                    result = evaluate_expression(expr, variables)
-                    formatted = format_result(result)
-                    print(f"Result: {formatted}")
-                    history.append(
-                        (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), expr, formatted)
-                    )
-            except Exception as e:
-                print(f"{Colors.BOLD}{Colors.RED}Error:{Colors.RESET} {e}")
+                    completions.note_variable(assignment[0])
+                    remember_result(state.variables, state.variables[assignment[0]])
+            else:
+                result = evaluate_expression(expr, state.variables)
+                state.last_result = result
+                remember_result(state.variables, result)
+                formatted = format_result(result)
+                print(f"Result: {formatted}")
+                show_integration_report()
+                if core.bignum_mode == "full":
+                    # Keep the history compact whatever is displayed
+                    formatted = format_result(result, "sci")
+                state.history.append(expr, formatted)
+            completions.note_expression(expr)
+        except Exception as e:
+            print(f"{Colors.BOLD}{Colors.RED}Error:{Colors.RESET} {e}")
+
+
+def save_session(name, variables, graph):
+    """Write the variables and formulas to the session file `name`."""
+    try:
+        saved, skipped = save_snapshot(session_path(name), variables, graph)
+    except (OSError, ValueError) as e:
+        print(f"{Colors.BOLD}{Colors.RED}Error:{Colors.RESET} {e}")
+        return
+    note = f" ({skipped:,} of other types skipped)" if skipped else ""
+    print(f"Saved session '{name}': {saved:,} variables{note}.")
+
+
+def load_session(name, variables, graph):
+    """
+    Restore the session file `name`, returning the new (variables,
+    graph); on failure the current ones are returned unchanged. A
+    session with formulas turns spreadsheet mode on.
+    """
+    start = time.perf_counter()
+    try:
+        snapshot = load_snapshot(session_path(name))
+    except FileNotFoundError:
+        print(f"{Colors.BOLD}{Colors.RED}Error:{Colors.RESET} no session '{name}'.")
+        return variables, graph
+    except (OSError, ValueError) as e:
+        print(f"{Colors.BOLD}{Colors.RED}Error:{Colors.RESET} {e}")
+        return variables, graph
+    elapsed = (time.perf_counter() - start) * 1000
+    count = len(snapshot.variables) + len(snapshot.variables.pending)
+    if snapshot.graph is not None:
+        graph = snapshot.graph
+    elif graph is not None:
+        graph = DependencyGraph()
+    print(f"Loaded session '{name}': {count:,} variables in {elapsed:.1f} ms.")
+    return snapshot.variables, graph
+
+
+def show_integration_report():
+    """Print the error estimate and cost of the integrals just computed."""
+    reports = quadrature.take_reports()
+    if not reports:
+        return
+    # Nested integrals finish before the one enclosing them
+    outer = reports[-1]
+    print(
+        f"{Colors.DIM}integral ± {outer.error:.2g} (estimated), "
+        f"{outer.evaluations:,} evaluations{Colors.RESET}"
+    )
+
+
+def show_cache(args):
+    """
+    Handle the cache command:
+    - cache        → size and hit counts of the persistent result cache
+    - cache clear  → delete every stored result
+    """
+    cache = core.result_cache()
+    if cache is None:
+        print("The result cache is off (start with --cache to use it).")
+    elif args == ["clear"]:
+        cache.clear()
+        print("Result cache cleared.")
+    elif not args:
+        info = cache.info()
+        print(
+            f"{info['entries']:,} results, {info['bytes'] / 2**20:.1f} of "
+            f"{info['max_bytes'] / 2**20:.0f} MB in {cache.path}; this session "
+            f"{info['hits']:,} hits, {info['misses']:,} misses"
+        )
+    else:
+        print("Usage: cache [clear]")
+
+
+def show_stats(args):
+    """
+    Handle the stats command:
+    - stats          → per-stage timings, function call counts, cache info
+    - stats on|off   → start/stop collecting
+    - stats reset    → forget what was collected
+    """
+    command = args[0] if args else "show"
+    if command == "on":
+        stats.enable()
+        print("Statistics on: timing each evaluation stage.")
+    elif command == "off":
+        stats.disable()
+        print("Statistics off.")
+    elif command == "reset":
+        stats.reset()
+        print("Statistics reset.")
+    elif command == "show":
+        print(stats.report())
+    else:
+        print("Usage: stats [on | off | reset]")
+
+
+def show_history(args, index):
+    """
+    Handle the history command:
+    - history               → most recent page
+    - history page N        → page N (oldest entries first)
+    - history last N        → the last N entries
+    - history search TERM   → newest entries containing all terms
+    """
+    count = len(index)
+    if count == 0:
+        print("No history yet.")
+        return
 
-    save_history(history)
+    pages = (count + PAGE_SIZE - 1) // PAGE_SIZE
+    command = args[0].lower() if args else "page"
+    try:
+        if command == "search" and len(args) > 1:
+            matches = index.search(" ".join(args[1:]))
+            if not matches:
+                print("No matching history entries.")
+                return
+            print(f"{len(matches)} match(es), newest first:")
+            print_history_entries(index.entries(matches[:PAGE_SIZE]))
+            return
+        if command == "last":
+            n = int(args[1]) if len(args) > 1 else PAGE_SIZE
+            if n >= 1:
+                print_history_entries(index.last(n))
+                return
+        if command == "page":
+            page = int(args[1]) if len(args) > 1 else pages
+            if not 1 <= page <= pages:
+                print(f"Page out of range: choose 1-{pages}.")
+                return
+            print(f"History (page {page}/{pages}):")
+            print_history_entries(index.page(page))
+            if pages > 1:
+                print(
+                    f"{Colors.DIM}Use 'history page N' to see other pages.{Colors.RESET}"
+                )
+            return
+    except ValueError:
+        pass
+    print("Usage: history [page N | last N | search TERM]")
 
 
 if __name__ == "__main__":
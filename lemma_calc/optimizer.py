@@ -0,0 +1,287 @@
+# lemma_calc/optimizer.py
+
+import ast
+import copy
+from collections import Counter
+from .bignum import format_big_int, is_big
+from .compiler import call_checks, compile_tree
+from .constants import allowed_names, allowed_operators, special_forms, user_functions
+
+# Prefix of the names given to shared subexpressions; '$' cannot appear
+# in a parsed identifier, so these never collide with user variables
+SUBEXPRESSION_PREFIX = "$"
+
+
+class OptimizedExpression:
+    """
+    The result of `optimize`: a rewritten expression tree plus the shared
+    subexpressions it refers to.
+
+    `tree` is an ast.Expression in which repeated subexpressions are
+    replaced by names like `$1`, and `bindings` lists (name, node) pairs
+    in dependency order (a binding only refers to earlier ones).
+    """
+
+    __slots__ = ("tree", "bindings")
+
+    def __init__(self, tree, bindings):
+        self.tree = tree
+        self.bindings = bindings
+
+    def compile(self, functions=None, operators=None, checks=None):
+        """Compile to a closure evaluator, see compiler.compile_tree."""
+        return compile_tree(
+            self.tree, functions, operators, checks, bindings=dict(self.bindings)
+        )
+
+    def __str__(self):
+        lines = [unparse(self.tree)]
+        for name, node in self.bindings:
+            lines.append(f"  where {name} = {unparse(node)}")
+        return "\n".join(lines)
+
+
+class _BigIntNames(ast.NodeTransformer):
+    """Replace huge integer constants by a name spelling them compactly."""
+
+    def visit_Constant(self, node):
+        value = node.value
+        if type(value) is int and is_big(value):
+            return ast.Name(id=f"<{format_big_int(value, 'trunc')}>", ctx=ast.Load())
+        return node
+
+
+def unparse(tree):
+    """
+    ast.unparse for display. Integers past the big-int display threshold,
+    typically folded constants like 2^100000, are shown abbreviated:
+    unparsing them in full is slow and fails past Python's int-to-str
+    digit limit.
+    """
+    return ast.unparse(_BigIntNames().visit(copy.deepcopy(tree)))
+
+
+def optimize(tree, functions=None, operators=None, checks=None):
+    """
+    Optimize a parsed expression for repeated evaluation.
+
+    - Constant folding: subtrees made only of numbers, allowed operators
+      and built-in functions are evaluated once, here (user functions
+      may be redefined, so calls to them are not folded). A subtree whose
+      evaluation fails is left alone so the error still surfaces when
+      the expression is evaluated.
+    - Common-subexpression elimination: a subexpression over variables
+      that occurs more than once is computed once per evaluation.
+
+    The input tree is not modified. Returns an OptimizedExpression.
+    """
+    if functions is None:
+        functions = allowed_names
+    if operators is None:
+        operators = allowed_operators
+    if checks is None:
+        checks = call_checks
+    body = _Folder(functions, operators, checks).visit(tree.body)
+    body, bindings = _eliminate_common(body, functions, operators)
+    return OptimizedExpression(ast.Expression(body=body), bindings)
+
+
+def _constant_node(value):
+    # Keep negative numbers as unary minus so ast.unparse brackets them
+    if value < 0 or (value == 0 and str(value).startswith("-")):
+        return ast.UnaryOp(op=ast.USub(), operand=ast.Constant(-value))
+    return ast.Constant(value)
+
+
+def _constant_value(node):
+    """The number a folded node stands for, or None if not constant."""
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if isinstance(value, (int, float)):
+            return value
+    elif (
+        isinstance(node, ast.UnaryOp)
+        and isinstance(node.op, ast.USub)
+        and isinstance(node.operand, ast.Constant)
+        and isinstance(node.operand.value, (int, float))
+    ):
+        return -node.operand.value
+    return None
+
+
+class _Folder:
+    """Bottom-up constant folding over a copy of the tree."""
+
+    def __init__(self, functions, operators, checks):
+        self.functions = functions
+        self.operators = operators
+        self.checks = checks
+
+    def visit(self, node):
+        if isinstance(node, ast.BinOp):
+            node = ast.BinOp(
+                left=self.visit(node.left), op=node.op, right=self.visit(node.right)
+            )
+            children = [node.left, node.right]
+            foldable = type(node.op) in self.operators
+        elif isinstance(node, ast.UnaryOp):
+            node = ast.UnaryOp(op=node.op, operand=self.visit(node.operand))
+            children = [node.operand]
+            foldable = type(node.op) in self.operators
+        elif isinstance(node, ast.Call):
+            node = ast.Call(
+                func=node.func,
+                args=[self.visit(arg) for arg in node.args],
+                keywords=node.keywords,
+            )
+            children = node.args
+            foldable = (
+                isinstance(node.func, ast.Name)
+                and node.func.id in self.functions
+                and node.func.id not in user_functions
+                and getattr(self.functions[node.func.id], "foldable", True)
+                and not node.keywords
+            )
+        else:
+            return node
+
+        if not foldable or any(_constant_value(c) is None for c in children):
+            return node
+        if _constant_value(node) is not None:
+            return node  # already a literal negative number
+        run = compile_tree(node, self.functions, self.operators, self.checks)
+        try:
+            value = run({})
+        except Exception:
+            return node
+        if not isinstance(value, (int, float)):
+            return node
+        return _constant_node(value)
+
+
+def _shape(node, functions, operators):
+    """
+    The part of a node that identifies it apart from its children, or
+    None if the node must not be shared (unknown function, keywords).
+    """
+    if isinstance(node, ast.Name):
+        return ("name", node.id)
+    if isinstance(node, ast.Constant):
+        return ("constant", type(node.value), node.value)
+    if isinstance(node, (ast.BinOp, ast.UnaryOp)):
+        if type(node.op) in operators:
+            return (type(node), type(node.op))
+    elif isinstance(node, ast.Call):
+        if (
+            isinstance(node.func, ast.Name)
+            and node.func.id in functions
+            and not node.keywords
+        ):
+            return ("call", node.func.id)
+    return None
+
+
+def _eliminate_common(body, functions, operators):
+    """
+    Replace repeated pure subexpressions of `body` with `$N` names.
+
+    Nested repeats are shared at the outermost level: in
+    (x*y + 1) * (x*y + 1) only `x*y + 1` becomes a binding.
+    """
+    # Hash-cons the tree: structurally equal subtrees get the same key,
+    # in a single bottom-up pass (None marks a subtree that is not pure)
+    interned = {}
+    keys = {}
+
+    def intern(node):
+        # A plain loop, not a comprehension: one stack frame per level
+        children = []
+        for child in _children(node):
+            children.append(intern(child))
+        shape = _shape(node, functions, operators)
+        if shape is None or None in children:
+            key = None
+        else:
+            key = interned.setdefault((shape, tuple(children)), len(interned))
+        keys[id(node)] = key
+        return key
+
+    intern(body)
+
+    def shareable(node):
+        return keys[id(node)] is not None and not (
+            isinstance(node, (ast.Name, ast.Constant))
+            or _constant_value(node) is not None
+        )
+
+    counts = Counter()
+    stack = [body]
+    while stack:
+        node = stack.pop()
+        if shareable(node):
+            counts[keys[id(node)]] += 1
+        stack.extend(_children(node))
+
+    # Count uses the way evaluation would see them after sharing: the
+    # first occurrence of a repeated subexpression is walked into,
+    # later ones are not (their inner subexpressions come for free)
+    uses = Counter()
+    seen = set()
+    stack = [body]
+    while stack:
+        node = stack.pop()
+        if shareable(node):
+            key = keys[id(node)]
+            uses[key] += 1
+            if counts[key] > 1:
+                if key in seen:
+                    continue
+                seen.add(key)
+        stack.extend(_children(node))
+
+    names = {}
+    bindings = []
+
+    def rewrite(node):
+        if shareable(node) and uses[keys[id(node)]] > 1:
+            key = keys[id(node)]
+            if key not in names:
+                definition = _rewrite_children(node, rewrite)
+                names[key] = f"{SUBEXPRESSION_PREFIX}{len(bindings) + 1}"
+                bindings.append((names[key], definition))
+            return ast.Name(id=names[key], ctx=ast.Load())
+        return _rewrite_children(node, rewrite)
+
+    return rewrite(body), bindings
+
+
+def _is_special_form(node):
+    return isinstance(node.func, ast.Name) and node.func.id in special_forms
+
+
+def _children(node):
+    if isinstance(node, ast.BinOp):
+        return [node.left, node.right]
+    if isinstance(node, ast.UnaryOp):
+        return [node.operand]
+    if isinstance(node, ast.Call):
+        # Nothing is shared into or out of a special form: its arguments
+        # may see a bound variable that means something else outside
+        if _is_special_form(node):
+            return []
+        return node.args
+    return []
+
+
+def _rewrite_children(node, rewrite):
+    if isinstance(node, ast.BinOp):
+        return ast.BinOp(left=rewrite(node.left), op=node.op, right=rewrite(node.right))
+    if isinstance(node, ast.UnaryOp):
+        return ast.UnaryOp(op=node.op, operand=rewrite(node.operand))
+    if isinstance(node, ast.Call) and not _is_special_form(node):
+        return ast.Call(
+            func=node.func,
+            args=[rewrite(arg) for arg in node.args],
+            keywords=node.keywords,
+        )
+    return node
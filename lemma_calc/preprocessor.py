@@ -1,42 +1,168 @@
-import re
+# lemma_calc/preprocessor.py
 
+from .constants import math_constants
 
-def replace_exponentiation(expr):
-    """Replace '^' with '**' for exponentiation."""
-    return expr.replace("^", "**")
+# Token kinds produced by tokenize()
+NUMBER = "number"
+NAME = "name"
+OP = "op"
+OPEN = "open"
+CLOSE = "close"
+BANG = "bang"
 
+# Characters accepted as a name, besides ASCII letters, digits and '_'
+NAME_ALIASES = {"π": "pi"}
 
-def insert_implicit_multiplication(expr):
+# Names that are Python keywords, and what they are parsed as
+KEYWORD_NAMES = {"if": "if_"}
+
+# Kinds after which a number, name or '(' means implicit multiplication
+_ATOM_END = (NUMBER, NAME, CLOSE, BANG)
+
+
+def _scan_number(expr, i, n):
+    """Return the end index of the number literal starting at i."""
+    while i < n and expr[i].isdigit():
+        i += 1
+    if i < n and expr[i] == ".":
+        i += 1
+        while i < n and expr[i].isdigit():
+            i += 1
+    # Exponent only if digits follow, so '2e' stays 2 * e
+    if i < n and expr[i] in "eE":
+        j = i + 1
+        if j < n and expr[j] in "+-":
+            j += 1
+        if j < n and expr[j].isdigit():
+            while j < n and expr[j].isdigit():
+                j += 1
+            i = j
+    return i
+
+
+def tokenize(expr):
     """
-    Insert '*' where implicit multiplication is assumed, e.g.:
-    - between number and parenthesis: 2(3) => 2*(3)
-    - between closing parenthesis and number or identifier: (2)3 => (2)*3, (2)pi => (2)*pi
-    - between number and identifier: 2pi => 2*pi
+    Split an expression into (kind, text) tokens in a single pass.
+
+    Whitespace separates tokens and is dropped. '(' and '[' are OPEN,
+    ')' and ']' CLOSE tokens. '^' becomes '**' and
+    '!' is a BANG token unless it starts '!='. '==', '<=' and '>=' are
+    single tokens.
     """
-    expr = re.sub(r"(\d)(\()", r"\1*\2", expr)
-    expr = re.sub(r"(\))(\d|[a-zA-Z_])", r"\1*\2", expr)
-    expr = re.sub(r"(\d)([a-zA-Z_])", r"\1*\2", expr)
-    return expr
+    tokens = []
+    i = 0
+    n = len(expr)
+    while i < n:
+        ch = expr[i]
+        if ch.isspace():
+            i += 1
+        elif ch.isdigit() or (ch == "." and i + 1 < n and expr[i + 1].isdigit()):
+            end = _scan_number(expr, i, n)
+            tokens.append((NUMBER, expr[i:end]))
+            i = end
+        elif ch.isalpha() or ch == "_":
+            if ch in NAME_ALIASES:
+                tokens.append((NAME, NAME_ALIASES[ch]))
+                i += 1
+                continue
+            end = i + 1
+            while end < n and (expr[end].isalnum() or expr[end] == "_"):
+                if expr[end] in NAME_ALIASES:
+                    break
+                end += 1
+            tokens.append((NAME, expr[i:end]))
+            i = end
+        elif ch in "([":
+            tokens.append((OPEN, ch))
+            i += 1
+        elif ch in ")]":
+            tokens.append((CLOSE, ch))
+            i += 1
+        elif ch == "^":
+            tokens.append((OP, "**"))
+            i += 1
+        elif ch == "!":
+            if i + 1 < n and expr[i + 1] == "=":
+                tokens.append((OP, "!="))
+                i += 2
+            else:
+                tokens.append((BANG, ch))
+                i += 1
+        elif ch in "=<>" and i + 1 < n and expr[i + 1] == "=":
+            tokens.append((OP, expr[i : i + 2]))
+            i += 2
+        else:
+            tokens.append((OP, ch))
+            i += 1
+    return tokens
 
 
-def handle_factorial(expr):
+def preprocess_expression(expr, shadowed=()):
     """
-    Replace 'n!' with 'factorial(n)' including expressions in parentheses.
-    Examples:
-        5! -> factorial(5)
-        (2+3)! -> factorial((2+3))
+    Rewrite calculator syntax into a Python expression in one linear pass:
+    - Drop a trailing '=' and all whitespace
+    - Replace '^' with '**'
+    - Replace 'pi' and 'e' with their values unless listed in `shadowed`
+    - Turn postfix n!, (expr)! and f(x)! into factorial(...)
+    - Insert '*' for implicit multiplication: 3(4+2), (2+3)4, 2pi, 5!(22),
+      2[1, 2], x[1, 2]
+    - Keep vector and matrix literals ([1, 2], [[1, 2], [3, 4]]) and '@'
+      (matrix product) as they are
+    - Turn a single '=' inside parentheses into '==', so equations can be
+      passed to functions: solve(x^2 = 2, x)
+    - Rename names that are Python keywords: if(...) becomes if_(...)
+
+    A name directly followed by '(' is kept as a call; calling a variable
+    is treated as multiplication when the expression is evaluated.
     """
-    expr = re.sub(r"(\([^()]*\))!", r"factorial\1", expr)
-    expr = re.sub(r"(\d+)!", r"factorial(\1)", expr)
-    return expr
-
-
-def preprocess_expression(expr):
-    """Run all preprocessing functions in sequence."""
-    for func in [
-        replace_exponentiation,
-        insert_implicit_multiplication,
-        handle_factorial,
-    ]:
-        expr = func(expr)
-    return expr
+    expr = expr.rstrip()
+    if expr.endswith("=") and not expr.endswith(("==", "!=", "<=", ">=")):
+        expr = expr[:-1]
+
+    out = []
+    # Number of 'factorial(' prefixes to emit before out[i]
+    prefixes = {}
+    # For each open '(': index where the group (or call) starts in out
+    groups = []
+    atom_start = None
+    prev = None
+
+    for kind, text in tokenize(expr):
+        if kind in (NUMBER, NAME, OPEN) and prev in _ATOM_END:
+            if not (text == "(" and prev == NAME):
+                out.append("*")
+
+        if kind == NUMBER:
+            atom_start = len(out)
+            out.append(text)
+        elif kind == NAME:
+            atom_start = len(out)
+            if text in math_constants and text not in shadowed:
+                out.append(f"({math_constants[text]})")
+                kind = NUMBER
+            else:
+                out.append(KEYWORD_NAMES.get(text, text))
+        elif kind == OPEN:
+            groups.append(atom_start if prev == NAME and text == "(" else len(out))
+            out.append(text)
+        elif kind == CLOSE:
+            atom_start = groups.pop() if groups else len(out)
+            out.append(text)
+        elif text == "=" and groups:
+            out.append("==")
+        elif kind == BANG:
+            if prev not in _ATOM_END:
+                # Nothing to apply the factorial to; let the parser complain
+                out.append(text)
+                kind = OP
+            else:
+                prefixes[atom_start] = prefixes.get(atom_start, 0) + 1
+                out.append(")")
+        else:
+            out.append(text)
+        prev = kind
+
+    if prefixes:
+        for index, count in prefixes.items():
+            out[index] = "factorial(" * count + out[index]
+    return "".join(out)
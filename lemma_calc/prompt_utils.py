@@ -1,28 +1,39 @@
 # lemma_calc/prompt_utils.py
 
-from prompt_toolkit.completion import WordCompleter
+from prompt_toolkit.completion import Completer, Completion
+import re
 import threading
 import sys
 import time
 import os
+from .completion import CompletionIndex
 
-# Allowed function names for tab-completion (used in the input prompt)
-allowed_names = {
-    "sin": None,
-    "cos": None,
-    "tan": None,
-    "sqrt": None,
-    "log": None,
-    # Add all additional supported functions here...
-}
-
-# Combine functions, constants, and commands for auto-completion
-function_completions = list(
-    set(list(allowed_names.keys()) + ["pi", "e", "history", "clear", "q"])
-)
-
-# Create a WordCompleter instance for prompt_toolkit
-completer = WordCompleter(function_completions, ignore_case=True)
+# The name being typed: the identifier right before the cursor
+_WORD_BEFORE_CURSOR = re.compile(r"[A-Za-z_][A-Za-z0-9_]*\Z")
+
+
+class TrieCompleter(Completer):
+    """
+    prompt_toolkit completer over a completion.CompletionIndex: offers
+    the best-ranked functions, variables, commands and history names
+    for the identifier being typed.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def get_completions(self, document, complete_event):
+        match = _WORD_BEFORE_CURSOR.search(document.text_before_cursor)
+        if not match:
+            return
+        prefix = match.group()
+        for word, kind in self.index.complete(prefix):
+            yield Completion(word, start_position=-len(prefix), display_meta=kind)
+
+
+# Updated by the REPL as variables are assigned and statements evaluated
+completions = CompletionIndex()
+completer = TrieCompleter(completions)
 
 
 def wait_for_keypress_or_timeout(timeout, event):
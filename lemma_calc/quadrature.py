@@ -0,0 +1,317 @@
+# lemma_calc/quadrature.py
+
+import ast
+import math
+from collections import deque
+from numbers import Real
+from .compiler import SpecialForm, compile_tree
+from .constants import special_forms
+from .guards import check_cancelled
+
+# Default relative (and absolute) error goal of integrate()
+INTEGRATE_TOLERANCE = 1e-10
+# Integrand evaluations one integrate() call may spend
+INTEGRATE_MAX_EVALS = 100_000
+# Reports of the most recent integrations, for the REPL to show
+MAX_REPORTS = 16
+
+# 15-point Kronrod nodes on [-1, 1] (positive half, the centre last) and
+# weights; the 7-point Gauss rule uses every other node
+_KRONROD_NODES = (
+    0.991455371120812639206854697526329,
+    0.949107912342758524526189684047851,
+    0.864864423359769072789712788640926,
+    0.741531185599394439863864773280788,
+    0.586087235467691130294144845693013,
+    0.405845151377397166906606412076961,
+    0.207784955007898467600689403773245,
+    0.0,
+)
+_KRONROD_WEIGHTS = (
+    0.022935322010529224963732008058970,
+    0.063092092629978553290700663189204,
+    0.104790010322250183839876322541518,
+    0.140653259715525918745189590510238,
+    0.169004726639267902826583426598550,
+    0.190350578064785409913256402421014,
+    0.204432940075298892414161999234649,
+    0.209482141084727828012999174891714,
+)
+_GAUSS_WEIGHTS = (
+    0.129484966168869693270611432679082,
+    0.279705391489276667901467771423780,
+    0.381830050505118944950369775488975,
+    0.417959183673469387755102040816327,
+)
+_POINTS_PER_INTERVAL = 15
+_EPSILON = 2.220446049250313e-16
+
+reports = deque(maxlen=MAX_REPORTS)
+
+
+class QuadResult:
+    """
+    The outcome of quad(): the integral `value`, an estimate of its
+    absolute `error`, the number of integrand `evaluations` spent, and
+    whether the error goal was met (`converged`).
+    """
+
+    __slots__ = ("value", "error", "evaluations", "converged")
+
+    def __init__(self, value, error, evaluations, converged):
+        self.value = value
+        self.error = error
+        self.evaluations = evaluations
+        self.converged = converged
+
+    def __repr__(self):
+        return (
+            f"QuadResult(value={self.value!r}, error={self.error!r}, "
+            f"evaluations={self.evaluations}, converged={self.converged})"
+        )
+
+
+def _nodes(lo, hi):
+    """The 15 sample points of [lo, hi]: the centre, then pairs c -+ h*x."""
+    centre = 0.5 * (lo + hi)
+    half = 0.5 * (hi - lo)
+    points = [centre]
+    for x in _KRONROD_NODES[:7]:
+        points.append(centre - half * x)
+        points.append(centre + half * x)
+    return points
+
+
+def _kronrod(values, half):
+    """
+    Apply the Gauss-Kronrod 7/15 pair to the samples of one interval.
+
+    Returns (integral, error, noise): the Kronrod estimate, the QUADPACK
+    error estimate derived from its difference to the Gauss estimate,
+    and the rounding noise level below which refining is pointless.
+    """
+    centre = values[0]
+    kronrod = _KRONROD_WEIGHTS[7] * centre
+    gauss = _GAUSS_WEIGHTS[3] * centre
+    absolute = abs(kronrod)
+    for i in range(7):
+        pair = values[1 + 2 * i] + values[2 + 2 * i]
+        kronrod += _KRONROD_WEIGHTS[i] * pair
+        absolute += _KRONROD_WEIGHTS[i] * (
+            abs(values[1 + 2 * i]) + abs(values[2 + 2 * i])
+        )
+        if i % 2:
+            gauss += _GAUSS_WEIGHTS[i // 2] * pair
+
+    mean = 0.5 * kronrod
+    spread = _KRONROD_WEIGHTS[7] * abs(centre - mean)
+    for i in range(7):
+        spread += _KRONROD_WEIGHTS[i] * (
+            abs(values[1 + 2 * i] - mean) + abs(values[2 + 2 * i] - mean)
+        )
+
+    error = abs((kronrod - gauss) * half)
+    spread *= half
+    if spread and error:
+        error = spread * min(1.0, (200 * error / spread) ** 1.5)
+    return kronrod * half, error, 50 * _EPSILON * absolute * half
+
+
+def _estimate(sample, intervals):
+    """Sample every interval in one batch and return their estimates."""
+    points = []
+    for lo, hi in intervals:
+        points.extend(_nodes(lo, hi))
+    values = sample(points)
+    for x, value in zip(points, values):
+        if not math.isfinite(value):
+            raise ValueError(f"Integration error: integrand is not finite at {x!r}.")
+    estimates = []
+    for i, (lo, hi) in enumerate(intervals):
+        start = i * _POINTS_PER_INTERVAL
+        estimates.append(
+            (lo, hi)
+            + _kronrod(values[start : start + _POINTS_PER_INTERVAL], 0.5 * (hi - lo))
+        )
+    return estimates
+
+
+def quad(sample, a, b, tol=INTEGRATE_TOLERANCE, max_evals=INTEGRATE_MAX_EVALS):
+    """
+    Integrate over [a, b] by adaptive Gauss-Kronrod (7/15) quadrature.
+
+    `sample(points)` returns the integrand's values at a list of points.
+    Each round, every interval whose error estimate exceeds its share
+    of the goal max(tol, tol * |integral|) is bisected, and the new
+    intervals are all sampled in a single call, so the integrand can be
+    evaluated in batches rather than point by point.
+
+    Stops early, with converged=False, rather than spend more than
+    `max_evals` evaluations. Returns a QuadResult.
+    """
+    if a == b:
+        return QuadResult(0.0, 0.0, 0, True)
+    if b < a:
+        result = quad(sample, b, a, tol, max_evals)
+        result.value = -result.value
+        return result
+    if not (math.isfinite(a) and math.isfinite(b)):
+        raise ValueError("Integration error: bounds must be finite.")
+    if max_evals < _POINTS_PER_INTERVAL:
+        raise ValueError(
+            f"Integration error: needs a budget of at least "
+            f"{_POINTS_PER_INTERVAL} evaluations."
+        )
+
+    width = b - a
+    evaluations = _POINTS_PER_INTERVAL
+    pending = _estimate(sample, [(a, b)])
+    done_values = []
+    done_error = 0.0
+
+    while True:
+        value = math.fsum(done_values + [p[2] for p in pending])
+        error = done_error + sum(p[3] for p in pending)
+        goal = max(tol, tol * abs(value))
+        if error <= goal or not pending:
+            return QuadResult(value, error, evaluations, True)
+
+        refine = []
+        for lo, hi, part, part_error, noise in pending:
+            mid = 0.5 * (lo + hi)
+            if (
+                part_error <= goal * (hi - lo) / width
+                or part_error <= noise
+                or not lo < mid < hi
+            ):
+                done_values.append(part)
+                done_error += part_error
+            else:
+                refine.append((lo, hi, part, part_error))
+
+        if not refine:
+            return QuadResult(value, error, evaluations, True)
+        cost = 2 * _POINTS_PER_INTERVAL * len(refine)
+        if evaluations + cost > max_evals:
+            return QuadResult(value, error, evaluations, False)
+
+        halves = []
+        for lo, hi, _, _ in refine:
+            mid = 0.5 * (lo + hi)
+            halves.append((lo, mid))
+            halves.append((mid, hi))
+        pending = _estimate(sample, halves)
+        evaluations += cost
+
+
+def _real(value, what):
+    if isinstance(value, bool) or not isinstance(value, Real):
+        raise ValueError(f"Integration error: {what} must be a real number.")
+    return float(value)
+
+
+def _sampler(integrand, vector, var, env):
+    """
+    Build sample(points) for quad(): the integrand is evaluated with
+    `var` bound to each point in a private copy of the variables.
+
+    With NumPy installed, each batch first runs as one vectorized pass
+    over the same expression; if that fails (a domain error, say), the
+    batch and all later ones go through the scalar closure instead, so
+    errors are reported exactly as the scalar engine reports them.
+    """
+    local = dict(env)
+    vector = [vector]
+
+    def sample(points):
+        check_cancelled()
+        if vector[0] is not None:
+            run, np = vector[0]
+            local[var] = np.array(points)
+            try:
+                with np.errstate(all="raise"):
+                    values = np.asarray(run(local), dtype=float)
+                return np.broadcast_to(values, (len(points),)).tolist()
+            except Exception:
+                vector[0] = None
+        values = []
+        for x in points:
+            local[var] = x
+            values.append(_real(integrand(local), "the integrand"))
+        return values
+
+    return sample
+
+
+def _vector_integrand(node, functions):
+    from . import vectorized  # imports core, which imports this module
+
+    if vectorized.np is None:
+        return None
+    functions, operators = vectorized.vector_tables(functions)
+    run = compile_tree(node, functions, operators, checks={})
+    return run, vectorized.np
+
+
+def _integral(name, args, compile, functions):
+    """Compile the arguments of integrate()-style calls; see _integrate."""
+    if len(args) not in (4, 5):
+        raise ValueError(
+            f"{name}() takes 4 or 5 arguments: {name}(expr, x, a, b[, tol])"
+        )
+    if not isinstance(args[1], ast.Name):
+        raise ValueError(f"{name}() needs a variable name as its second argument")
+    node = args[0]
+    var = args[1].id
+    integrand = compile(node)
+    limits = [compile(arg) for arg in args[2:]]
+    # The vectorized integrand, compiled on first use: (run, numpy) or None
+    vector = []
+
+    def run(env):
+        if not vector:
+            vector.append(_vector_integrand(node, functions))
+        a, b, *tol = [_real(limit(env), "bounds and tolerance") for limit in limits]
+        tol = tol[0] if tol else INTEGRATE_TOLERANCE
+        if tol <= 0:
+            raise ValueError("Integration error: tolerance must be positive.")
+        result = quad(_sampler(integrand, vector[0], var, env), a, b, tol)
+        reports.append(result)
+        return result
+
+    return run
+
+
+def _integrate(args, compile, functions):
+    integral = _integral("integrate", args, compile, functions)
+
+    def run(env):
+        result = integral(env)
+        if not result.converged:
+            raise ValueError(
+                f"Integration error: no convergence within {INTEGRATE_MAX_EVALS:,} "
+                f"evaluations (estimate {result.value:.12g} ± {result.error:.2g})."
+            )
+        return result.value
+
+    return run
+
+
+def _integrate_error(args, compile, functions):
+    integral = _integral("integrate_error", args, compile, functions)
+
+    def run(env):
+        return integral(env).error
+
+    return run
+
+
+def take_reports():
+    """Return and forget the QuadResults of recent integrations."""
+    taken = list(reports)
+    reports.clear()
+    return taken
+
+
+special_forms["integrate"] = SpecialForm(_integrate, bound=1, scoped=(0,))
+special_forms["integrate_error"] = SpecialForm(_integrate_error, bound=1, scoped=(0,))
@@ -0,0 +1,181 @@
+# lemma_calc/reactive.py
+
+from .core import compile_expression, run_compiled, shadowed_constants
+
+
+class DependencyGraph:
+    """
+    Spreadsheet-style variables: each assignment keeps its expression,
+    and redefining a variable recomputes everything derived from it.
+
+    `formulas` maps a variable to its CompiledExpression (or to its
+    source, for formulas restored from a snapshot, compiled when first
+    recomputed), `depends_on` to the variables its expression reads and
+    `dependents` the reverse.
+    Only variables downstream of a change are recomputed, in topological
+    order, so a change costs time proportional to what it affects.
+    """
+
+    def __init__(self):
+        self.formulas = {}
+        self.depends_on = {}
+        self.dependents = {}
+
+    def __contains__(self, name):
+        return name in self.formulas
+
+    def __len__(self):
+        return len(self.formulas)
+
+    def define(self, name, expr, variables):
+        """
+        Set `name` to the expression `expr`, evaluate it and update every
+        variable that depends on it.
+
+        Returns:
+            tuple: (value, updated, failed) where `updated` lists the
+            recomputed downstream variables in order and `failed` maps
+            downstream variables whose recomputation raised to the error
+            message (those are removed from `variables`).
+
+        A KeyboardInterrupt (a cancelled evaluation) leaves the graph and
+        the variables as they were.
+
+        Raises:
+            ValueError: If the definition would create a cycle, or the
+                expression itself cannot be evaluated.
+        """
+        compiled = compile_expression(expr, shadowed_constants(variables))
+        deps = {
+            dep
+            for dep in compiled.names
+            if dep == name or dep in variables or dep in self.formulas
+        }
+        cycle = self._find_path(name, deps)
+        if cycle is not None:
+            raise ValueError(f"Cycle error: {' -> '.join(cycle + [cycle[0]])}")
+
+        value = run_compiled(compiled, variables)
+        downstream = self._downstream(name)
+        previous = {
+            var: variables[var] for var in [name] + downstream if var in variables
+        }
+        formula = self.formulas.get(name)
+        old_deps = self.depends_on.get(name, ())
+        self._set_edges(name, deps)
+        self.formulas[name] = compiled
+        variables[name] = value
+
+        updated = []
+        failed = {}
+        try:
+            for dependent in downstream:
+                try:
+                    variables[dependent] = run_compiled(
+                        self._formula(dependent, variables), variables
+                    )
+                    updated.append(dependent)
+                except ValueError as e:
+                    variables.pop(dependent, None)
+                    failed[dependent] = str(e)
+        except KeyboardInterrupt:
+            for var in [name] + downstream:
+                variables.pop(var, None)
+            variables.update(previous)
+            self._set_edges(name, old_deps)
+            if formula is None:
+                del self.formulas[name]
+            else:
+                self.formulas[name] = formula
+            raise
+        return value, updated, failed
+
+    def _formula(self, name, variables):
+        formula = self.formulas[name]
+        if isinstance(formula, str):
+            formula = compile_expression(formula, shadowed_constants(variables))
+            self.formulas[name] = formula
+        return formula
+
+    def sources(self):
+        """Map each variable to the source of its formula."""
+        return {
+            name: formula if isinstance(formula, str) else formula.source
+            for name, formula in self.formulas.items()
+        }
+
+    def restore(self, sources, depends_on):
+        """
+        Replace the formulas with `sources` (variable -> expression) and
+        their dependencies (variable -> names read), as saved by sources()
+        and `depends_on`. Nothing is compiled or evaluated until a change
+        recomputes them.
+        """
+        self.clear()
+        self.formulas.update(sources)
+        for name, deps in depends_on.items():
+            self._set_edges(name, deps)
+
+    def clear(self):
+        self.formulas.clear()
+        self.depends_on.clear()
+        self.dependents.clear()
+
+    def _set_edges(self, name, deps):
+        for dep in self.depends_on.pop(name, ()):
+            users = self.dependents.get(dep)
+            if users is not None:
+                users.discard(name)
+                if not users:
+                    del self.dependents[dep]
+        if deps:
+            self.depends_on[name] = set(deps)
+            for dep in deps:
+                self.dependents.setdefault(dep, set()).add(name)
+
+    def _find_path(self, name, deps):
+        """
+        Return a dependency path from `name` back to itself if `name`
+        were to read `deps`, else None.
+        """
+        if name in deps:
+            return [name]
+        # Walk what depends on `name`; reaching one of deps closes a cycle
+        parents = {name: None}
+        stack = [name]
+        while stack:
+            node = stack.pop()
+            for user in self.dependents.get(node, ()):
+                if user in parents:
+                    continue
+                parents[user] = node
+                if user in deps:
+                    path = [user]
+                    while path[-1] != name:
+                        path.append(parents[path[-1]])
+                    return path
+                stack.append(user)
+        return None
+
+    def _downstream(self, name):
+        """
+        Variables that (transitively) depend on `name`, in an order where
+        each comes after everything it reads.
+        """
+        order = []
+        visited = {name}
+        # Iterative post-order DFS over dependents
+        stack = [(name, iter(self.dependents.get(name, ())))]
+        while stack:
+            node, users = stack[-1]
+            for user in users:
+                if user not in visited and user in self.formulas:
+                    visited.add(user)
+                    stack.append((user, iter(self.dependents.get(user, ()))))
+                    break
+            else:
+                stack.pop()
+                if node != name:
+                    order.append(node)
+        order.reverse()
+        return order
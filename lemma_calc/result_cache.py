@@ -0,0 +1,146 @@
+# lemma_calc/result_cache.py
+
+import ast
+import hashlib
+import struct
+import threading
+
+# Default database file of --cache
+RESULT_CACHE_FILE = "results.sqlite"
+# Total size of the stored values before the least recently used go
+RESULT_CACHE_MAX_BYTES = 64 * 2**20
+# Results that took less time than this to compute are not worth storing
+RESULT_CACHE_MIN_SECONDS = 0.002
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+"""
+
+
+def result_key(tree):
+    """
+    Hash of a parsed expression. Parsing has already normalized the
+    spelling (whitespace, '^' vs '**', implicit multiplication, pi and
+    e), and ast.dump leaves out source positions, so every way of writing
+    the same expression gets the same key.
+    """
+    return hashlib.sha256(ast.dump(tree).encode()).hexdigest()
+
+
+def _encode(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        length = value.bit_length() // 8 + 1
+        return "int", value.to_bytes(length, "little", signed=True)
+    if isinstance(value, float):
+        return "float", struct.pack("<d", value)
+    return None
+
+
+def _decode(kind, blob):
+    if kind == "int":
+        return int.from_bytes(blob, "little", signed=True)
+    return struct.unpack("<d", blob)[0]
+
+
+class ResultCache:
+    """
+    Results of variable-free expressions, kept in an SQLite file so they
+    survive across sessions.
+
+    Values are stored as raw bytes (ints of any size, floats) under
+    `result_key` of the parsed expression. When the stored values exceed
+    `max_bytes`, the least recently used are evicted. Safe to share
+    between threads.
+    """
+
+    def __init__(self, path=RESULT_CACHE_FILE, max_bytes=RESULT_CACHE_MAX_BYTES):
+        import sqlite3  # Only when --cache is used: it slows down startup
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        row = self._db.execute("SELECT MAX(used), SUM(size) FROM results").fetchone()
+        self._clock = row[0] or 0
+        self._size = row[1] or 0
+
+    def get(self, key):
+        """Return the stored value for `key`, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT kind, value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._clock += 1
+            with self._db:
+                self._db.execute(
+                    "UPDATE results SET used = ? WHERE key = ?", (self._clock, key)
+                )
+        return _decode(*row)
+
+    def put(self, key, value):
+        """Store a result; values other than ints and floats are ignored."""
+        encoded = _encode(value)
+        if encoded is None:
+            return
+        kind, blob = encoded
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock, self._db:
+            self._clock += 1
+            old = self._db.execute(
+                "SELECT size FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, kind, blob, len(blob), self._clock),
+            )
+            self._size += len(blob) - (old[0] if old else 0)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM results ORDER BY used LIMIT 64"
+            ).fetchall()
+            for key, size in rows:
+                if self._size <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._size -= size
+
+    def clear(self):
+        """Delete every stored result."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM results")
+            self._size = 0
+
+    def info(self):
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM results").fetchone()
+        return {
+            "entries": entries,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
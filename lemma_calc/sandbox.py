@@ -0,0 +1,195 @@
+# lemma_calc/sandbox.py
+
+import threading
+from . import columns, core, userfuncs
+from .compiler import free_names
+
+# Defaults for the worker-process execution mode
+SANDBOX_TIMEOUT = 5.0  # seconds of wall-clock time per evaluation
+SANDBOX_MEMORY_MB = 512  # address-space limit of the worker process
+
+
+def _limit_memory(memory_mb):
+    try:
+        import resource
+    except ImportError:  # Not available on Windows; rely on the timeout
+        return
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _worker(conn, memory_mb):
+    """
+    Worker loop: evaluate (expr, variables, definitions) requests until
+    EOF. `definitions` are the user functions (see userfuncs.export), sent
+    only when they changed since the previous request, else None. Loaded
+    columns arrive as columns.ColumnReference and are mapped again here.
+    """
+    _limit_memory(memory_mb)
+    # The worker itself must evaluate directly, never via another sandbox.
+    # The parent looks results up and stores them, and the result cache's
+    # SQLite connection and lock must not be used across a fork
+    core.set_sandbox(None)
+    core.set_result_cache(None)
+    while True:
+        try:
+            expr, variables, definitions = conn.recv()
+        except EOFError:
+            break
+        try:
+            if definitions is not None:
+                userfuncs.restore(definitions)
+            for name, value in variables.items():
+                if isinstance(value, columns.ColumnReference):
+                    variables[name] = value.open()
+            conn.send(("ok", core.evaluate_expression(expr, variables)))
+        except MemoryError:
+            conn.send(("error", "Resource error: memory limit exceeded."))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+def _shareable(value):
+    # Columns go over as where their file is, not as all of their data
+    if columns.is_column(value):
+        reference = columns.column_reference(value)
+        if reference is not None:
+            return reference
+    return value
+
+
+class SandboxWorker:
+    """
+    Evaluates expressions in a separate worker process with a wall-clock
+    and memory limit.
+
+    A runaway evaluation only costs the worker: on timeout it is killed
+    and a fresh one is started for the next request, so the calling
+    session (REPL, batch run, server) keeps going.
+
+    One worker may serve several threads and function tables (the
+    calculator.Calculator sessions of a server): evaluations take turns,
+    and the worker is sent the caller's functions whenever they differ
+    from the last ones it received.
+    """
+
+    def __init__(self, timeout=SANDBOX_TIMEOUT, memory_mb=SANDBOX_MEMORY_MB):
+        import multiprocessing  # Only when --sandbox is used: it slows down startup
+
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self._multiprocessing = multiprocessing
+        self._process = None
+        self._conn = None
+        # The table and generation of the definitions the worker has
+        self._table = None
+        self._generation = None
+        self._lock = threading.Lock()
+        # Set by cancel() for the evaluation waiting on the killed worker
+        self._cancelled = False
+
+    def _context(self):
+        """
+        The multiprocessing context to start a worker with. fork starts
+        one in milliseconds and doesn't re-import the caller's __main__,
+        but only while this is the sole thread: a forked child inherits
+        the locks other threads hold (the REPL's dispatcher, the server's
+        executor). Otherwise forkserver, whose server is a fresh process,
+        or spawn where neither is available.
+        """
+        methods = self._multiprocessing.get_all_start_methods()
+        if "fork" in methods and threading.active_count() == 1:
+            method = "fork"
+        elif "forkserver" in methods:
+            method = "forkserver"
+        else:
+            method = "spawn"
+        return self._multiprocessing.get_context(method)
+
+    def _start(self):
+        context = self._context()
+        parent_conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_worker, args=(child_conn, self.memory_mb), daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        self._table = None
+        self._generation = None
+        self._cancelled = False
+
+    def kill(self):
+        """Stop the worker process (a new one starts on the next call)."""
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+            self._conn.close()
+            self._process = None
+            self._conn = None
+
+    close = kill
+
+    def cancel(self):
+        """
+        Kill the worker from another thread: the evaluation waiting for
+        it raises KeyboardInterrupt (a new worker starts on the next call).
+        """
+        process = self._process
+        if process is not None:
+            self._cancelled = True
+            process.kill()
+
+    def evaluate(self, expr, variables, table=None):
+        """
+        Evaluate `expr` in the worker. Only the variables the expression
+        reads are sent over, and the user functions of `table` (a
+        userfuncs.FunctionTable, default the REPL's) when they changed.
+        Raises ValueError like evaluate_expression.
+        """
+        if table is None:
+            table = userfuncs.table
+        # Only parse here: compiling folds constants, which is evaluation
+        # work that belongs in the worker
+        tree = core.parse_expression(expr, core.shadowed_constants(variables))
+        needed = {
+            name: _shareable(variables[name])
+            for name in free_names(tree)
+            if name in variables
+        }
+
+        with self._lock:
+            return self._evaluate(expr, needed, table)
+
+    def _evaluate(self, expr, needed, table):
+        if (
+            self._process is None
+            or self._cancelled  # killed, maybe not reaped yet
+            or not self._process.is_alive()
+        ):
+            self.kill()
+            self._start()
+        definitions = None
+        if self._table is not table or self._generation != table.generation:
+            definitions = table.export()
+        try:
+            self._conn.send((expr, needed, definitions))
+            self._table = table
+            self._generation = table.generation
+            if not self._conn.poll(self.timeout):
+                self.kill()
+                raise ValueError(
+                    f"Resource error: evaluation took longer than {self.timeout:g}s "
+                    "and was stopped."
+                )
+            status, value = self._conn.recv()
+        except (EOFError, OSError):
+            self.kill()
+            if self._cancelled:
+                self._cancelled = False
+                raise KeyboardInterrupt
+            # Worker died, e.g. killed by the OS for using too much memory
+            raise ValueError("Resource error: the evaluation worker crashed.")
+        if status == "error":
+            raise ValueError(value)
+        return value
@@ -0,0 +1,308 @@
+# lemma_calc/server.py
+
+import asyncio
+import json
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from .batch import dump_record
+from .cache import LRUCache
+from .calculator import Calculator
+from .core import ANSWER_NAMES, format_result
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+
+# Limits that keep one client from exhausting the server
+MAX_BODY_BYTES = 8 * 1024 * 1024  # largest accepted request body
+MAX_BATCH = 100_000  # statements per /batch request
+MAX_PENDING = 64  # queued evaluation requests before answering 503
+MAX_SESSIONS = 1024  # least recently used sessions are dropped beyond this
+KEEPALIVE_TIMEOUT = 30.0  # seconds an idle connection is kept open
+BATCH_CHUNK = 256  # statements evaluated per executor job
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Session:
+    """
+    A client's Calculator (its variables and user functions) plus a lock
+    keeping its requests in order.
+    """
+
+    def __init__(self):
+        self.calculator = Calculator()
+        self.lock = asyncio.Lock()
+
+
+class CalcServer:
+    """
+    Long-running JSON-over-HTTP evaluation server.
+
+    Endpoints (all bodies and responses are JSON):
+    - POST /eval      {"expr": "...", "session": id?} → one record
+    - POST /batch     {"exprs": [...], "session": id?} → {"results": [...]}
+    - POST /sessions  → {"session": id}
+    - GET /sessions/ID → the session's variables (without ans); DELETE drops it
+    - GET /health     → {"status": "ok", ...}
+
+    Records have the same shape as `--batch --format jsonl` output.
+    Without a session, statements share variables only within one request.
+    Sessions are independent calculator.Calculator instances: functions
+    defined in one are not seen by the others.
+
+    Connections are HTTP/1.1 keep-alive and requests on one connection
+    are answered in order; the next request is not read until the last
+    response has been written (drain), so a slow reader throttles itself.
+    Evaluation runs on a single worker thread so the event loop stays
+    responsive; at most MAX_PENDING requests may wait for it, beyond
+    that the server answers 503 with Retry-After.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING, max_sessions=MAX_SESSIONS):
+        self.sessions = LRUCache(max_sessions)
+        self.max_pending = max_pending
+        self.pending = 0
+        self.requests = 0
+        # One thread: evaluation is CPU-bound and the GIL gives nothing
+        # back to more threads
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._server = None
+
+    async def start(self, address=DEFAULT_ADDRESS):
+        """Listen on "host:port" or "unix:/path/to/socket"."""
+        if address.startswith("unix:"):
+            self._server = await asyncio.start_unix_server(
+                self._handle_connection, path=address[len("unix:") :]
+            )
+        else:
+            host, _, port = address.rpartition(":")
+            self._server = await asyncio.start_server(
+                self._handle_connection, host or "127.0.0.1", int(port)
+            )
+        return self._server
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        self._executor.shutdown(wait=False)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(
+                        _read_request(reader), KEEPALIVE_TIMEOUT
+                    )
+                except HTTPError as e:
+                    await _write_response(writer, e.status, {"error": str(e)}, False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    status, payload = await self._dispatch(method, path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                await _write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (
+            asyncio.TimeoutError,
+            asyncio.IncompleteReadError,
+            ConnectionError,
+            ValueError,  # header line over the StreamReader limit
+        ):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        self.requests += 1
+        if path == "/health" and method == "GET":
+            return HTTPStatus.OK, {
+                "status": "ok",
+                "sessions": len(self.sessions),
+                "pending": self.pending,
+                "requests": self.requests,
+            }
+        if path == "/sessions" and method == "POST":
+            session_id = secrets.token_hex(8)
+            self.sessions.put(session_id, Session())
+            return HTTPStatus.CREATED, {"session": session_id}
+        if path.startswith("/sessions/"):
+            session_id = path[len("/sessions/") :]
+            session = self._session(session_id)
+            if method == "GET":
+                variables = {
+                    name: format_result(value)
+                    for name, value in session.calculator.variables.items()
+                    if name not in ANSWER_NAMES
+                }
+                return HTTPStatus.OK, {"session": session_id, "variables": variables}
+            if method == "DELETE":
+                self.sessions.pop(session_id)
+                return HTTPStatus.OK, {"session": session_id, "deleted": True}
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Method not allowed")
+        if path in ("/eval", "/batch"):
+            if method != "POST":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Method not allowed")
+            request = _parse_json(body)
+            if path == "/eval":
+                exprs = [request.get("expr")]
+            else:
+                exprs = request.get("exprs")
+                if not isinstance(exprs, list):
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "'exprs' must be a list")
+                if len(exprs) > MAX_BATCH:
+                    raise HTTPError(
+                        HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                        f"At most {MAX_BATCH} statements per batch",
+                    )
+            if not all(isinstance(expr, str) for expr in exprs):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Expressions must be strings")
+            session_id = request.get("session")
+            if session_id is None:
+                session = Session()
+            elif isinstance(session_id, str):
+                session = self._session(session_id)
+            else:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "'session' must be a string")
+            records = await self._evaluate(session, exprs)
+            if path == "/eval":
+                return HTTPStatus.OK, records[0]
+            errors = sum("error" in record for record in records)
+            return HTTPStatus.OK, _RawJSON(
+                '{"errors":%d,"results":[%s]}'
+                % (errors, ",".join(dump_record(record) for record in records))
+            )
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No such endpoint: {path}")
+
+    def _session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown session '{session_id}'")
+        return session
+
+    async def _evaluate(self, session, exprs):
+        if self.pending >= self.max_pending:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Server busy, retry later")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            records = []
+            async with session.lock:
+                # Evaluate in chunks so one large batch doesn't hold the
+                # worker thread while other requests wait
+                for i in range(0, len(exprs), BATCH_CHUNK):
+                    records.extend(
+                        await loop.run_in_executor(
+                            self._executor,
+                            _evaluate_chunk,
+                            exprs[i : i + BATCH_CHUNK],
+                            session.calculator,
+                        )
+                    )
+            return records
+        finally:
+            self.pending -= 1
+
+
+class _RawJSON(str):
+    """A response body that is already serialized."""
+
+
+def _evaluate_chunk(exprs, calculator):
+    return [calculator.execute(expr) for expr in exprs]
+
+
+def _parse_json(body):
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Request body is not valid JSON")
+    if not isinstance(request, dict):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Request body must be a JSON object")
+    return request
+
+
+async def _read_request(reader):
+    """
+    Read one HTTP/1.1 request. Returns (method, path, headers, body), or
+    None when the client closed the connection between requests.
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, path, _ = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Chunked bodies not supported")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(
+            HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            f"Request body larger than {MAX_BODY_BYTES} bytes",
+        )
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path.split("?", 1)[0], headers, body
+
+
+async def _write_response(writer, status, payload, keep_alive):
+    if isinstance(payload, _RawJSON):
+        body = payload.encode("utf-8")
+    else:
+        body = dump_record(payload).encode("utf-8")
+    status = HTTPStatus(status)
+    head = [
+        f"HTTP/1.1 {status.value} {status.phrase}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if status == HTTPStatus.SERVICE_UNAVAILABLE:
+        head.append("Retry-After: 1")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+    # Wait for the client to take the response before reading the next
+    # request: a client that stops reading stops being served
+    await writer.drain()
+
+
+def serve(address=DEFAULT_ADDRESS):
+    """Run the server until interrupted."""
+
+    async def run():
+        server = CalcServer()
+        await server.start(address)
+        print(f"LemmaCalc server listening on {address}", flush=True)
+        try:
+            await server.serve_forever()
+        finally:
+            server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,375 @@
+# lemma_calc/snapshot.py
+
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from . import userfuncs
+from .core import compile_cache_keys, warm_compile_cache
+from .reactive import DependencyGraph
+
+# Directory of the files written by `save session <name>`
+SESSION_DIR = "sessions"
+SESSION_SUFFIX = ".lcs"
+# Bumped whenever the layout below changes; other versions are refused
+SNAPSHOT_VERSION = 1
+# Time a restore may spend recompiling the saved expressions
+WARM_SECONDS = 0.05
+
+_MAGIC = b"LEMMASNP"
+# Magic, version, then the byte length of the metadata and of each section
+_HEADER = struct.Struct("<8sH8Q")
+_SECTIONS = (
+    "int names",
+    "int values",
+    "float names",
+    "float values",
+    "big names",
+    "big offsets",
+    "big data",
+)
+_INT64 = 2**63
+_SESSION_NAME = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_.-]*\Z")
+
+
+class LazyVariables(dict):
+    """
+    A variables dict restored from a snapshot whose big integers stay in
+    the snapshot file until they are first read.
+
+    `pending` maps the names not loaded yet to their index in the file's
+    big-integer section. Looking a name up (`variables[name]`, `in`,
+    get) loads it; assigning or deleting it forgets the stored value.
+    Code that copies the variables should call load() on the names it
+    needs first (see core.load_lazy), as dict(variables) only copies
+    what is loaded.
+    """
+
+    def __init__(self, values, pending=None, data=b"", offsets=(0,), base=0):
+        super().__init__(values)
+        self.pending = pending or {}
+        self._data = data
+        # Value i is data[base + offsets[i] : base + offsets[i + 1]]
+        self._offsets = offsets
+        self._base = base
+
+    def __missing__(self, name):
+        if name in self.pending:
+            return self._load(name)
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self.pending
+
+    def __setitem__(self, name, value):
+        if self.pending:
+            self.pending.pop(name, None)
+        dict.__setitem__(self, name, value)
+
+    def __delitem__(self, name):
+        if self.pending.pop(name, None) is None:
+            dict.__delitem__(self, name)
+
+    def get(self, name, default=None):
+        if name in self:
+            return self[name]
+        return default
+
+    def pop(self, name, *default):
+        if name in self.pending:
+            self._load(name)
+        return dict.pop(self, name, *default)
+
+    def _load(self, name):
+        i = self.pending.pop(name)
+        start = self._base + self._offsets[i]
+        end = self._base + self._offsets[i + 1]
+        if not start <= end <= len(self._data):
+            raise ValueError(
+                f"Snapshot error: the stored value of '{name}' is damaged."
+            )
+        value = int.from_bytes(self._data[start:end], "little", signed=True)
+        dict.__setitem__(self, name, value)
+        if not self.pending:
+            self.close()
+        return value
+
+    def load(self, names):
+        """Load the pending values among `names`; return them as a dict."""
+        if not self.pending:
+            return {}
+        return {name: self._load(name) for name in names if name in self.pending}
+
+    def load_all(self):
+        """Load every pending value (and close the snapshot file)."""
+        self.load(list(self.pending))
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = b""
+
+
+def session_path(name):
+    """The file `save session <name>` writes."""
+    if not _SESSION_NAME.match(name):
+        raise ValueError(
+            f"Snapshot error: invalid session name '{name}' (use letters, digits, "
+            "'_', '-' and '.')."
+        )
+    return os.path.join(SESSION_DIR, name + SESSION_SUFFIX)
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _names(blob):
+    return blob.decode("utf-8").split("\n") if blob else []
+
+
+def save_snapshot(path, variables, graph=None):
+    """
+    Write `variables`, the formulas of a spreadsheet-mode `graph`, the
+    user functions and the sources of the compiled-expression cache to a
+    snapshot file.
+
+    Integers (True and False as 1 and 0) and floats are stored as packed
+    arrays, integers outside 64 bits as raw little-endian bytes that
+    load_snapshot() leaves in the file until used; values of other types
+    are skipped, as are user functions that captured such values. The file is
+    written next to `path` and then renamed over it, so a failed save
+    never leaves a half-written snapshot.
+
+    Returns:
+        tuple: (saved, skipped) counts of variables.
+    """
+    load_all = getattr(variables, "load_all", None)
+    if load_all is not None:
+        load_all()
+
+    ints, int_values = [], array("q")
+    floats, float_values = [], array("d")
+    bigs, offsets, chunks = [], array("Q", [0]), []
+    skipped = 0
+    for name, value in variables.items():
+        if isinstance(value, int):
+            value = int(value)
+            if -_INT64 <= value < _INT64:
+                ints.append(name)
+                int_values.append(value)
+            else:
+                length = value.bit_length() // 8 + 1
+                chunk = value.to_bytes(length, "little", signed=True)
+                bigs.append(name)
+                chunks.append(chunk)
+                offsets.append(offsets[-1] + len(chunk))
+        elif isinstance(value, float):
+            floats.append(name)
+            float_values.append(value)
+        else:
+            skipped += 1
+
+    formulas = {}
+    depends_on = {}
+    if graph is not None:
+        formulas = graph.sources()
+        depends_on = {name: sorted(deps) for name, deps in graph.depends_on.items()}
+    compiled = [[expr, list(shadowed)] for expr, shadowed in compile_cache_keys()]
+    functions = [
+        [name, params, body, captured]
+        for name, params, body, captured in userfuncs.export()
+        if all(isinstance(value, (int, float)) for value in captured.values())
+    ]
+    meta = json.dumps(
+        {
+            "formulas": formulas,
+            "depends_on": depends_on,
+            "functions": functions,
+            "compiled": compiled,
+        }
+    ).encode("utf-8")
+    sections = (
+        "\n".join(ints).encode("utf-8"),
+        _little_endian(int_values).tobytes(),
+        "\n".join(floats).encode("utf-8"),
+        _little_endian(float_values).tobytes(),
+        "\n".join(bigs).encode("utf-8"),
+        _little_endian(offsets).tobytes(),
+        b"".join(chunks),
+    )
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(
+            _HEADER.pack(
+                _MAGIC, SNAPSHOT_VERSION, len(meta), *[len(s) for s in sections]
+            )
+        )
+        f.write(meta)
+        for section in sections:
+            f.write(section)
+    os.replace(tmp, path)
+    return len(ints) + len(floats) + len(bigs), skipped
+
+
+class Snapshot:
+    """
+    A restored session: its `variables` (a LazyVariables), the
+    DependencyGraph of its formulas (None if it had none), and the
+    number of cached expressions recompiled while restoring.
+    """
+
+    __slots__ = ("variables", "graph", "compiled")
+
+    def __init__(self, variables, graph, compiled):
+        self.variables = variables
+        self.graph = graph
+        self.compiled = compiled
+
+
+def _check(condition, problem):
+    if not condition:
+        raise ValueError(f"Snapshot error: {problem}.")
+
+
+def _read_meta(blob):
+    try:
+        meta = json.loads(blob.decode("utf-8"))
+    except ValueError:
+        meta = None
+    _check(isinstance(meta, dict), "the metadata is damaged")
+    formulas = meta.get("formulas", {})
+    depends_on = meta.get("depends_on", {})
+    compiled = meta.get("compiled", [])
+    functions = meta.get("functions", [])
+    _check(
+        isinstance(formulas, dict)
+        and all(k.isidentifier() and isinstance(v, str) for k, v in formulas.items())
+        and isinstance(depends_on, dict)
+        and all(
+            k in formulas and isinstance(v, list) and all(isinstance(d, str) for d in v)
+            for k, v in depends_on.items()
+        ),
+        "the saved formulas are damaged",
+    )
+    _check(
+        isinstance(compiled, list)
+        and all(
+            isinstance(item, list)
+            and len(item) == 2
+            and isinstance(item[0], str)
+            and isinstance(item[1], list)
+            and all(isinstance(name, str) for name in item[1])
+            for item in compiled
+        ),
+        "the saved expressions are damaged",
+    )
+    _check(
+        isinstance(functions, list)
+        and all(
+            isinstance(item, list)
+            and len(item) == 4
+            and isinstance(item[0], str)
+            and item[0].isidentifier()
+            and isinstance(item[1], list)
+            and all(isinstance(p, str) and p.isidentifier() for p in item[1])
+            and isinstance(item[2], str)
+            and isinstance(item[3], dict)
+            and all(isinstance(v, (int, float)) for v in item[3].values())
+            for item in functions
+        ),
+        "the saved functions are damaged",
+    )
+    compiled = [(expr, tuple(shadowed)) for expr, shadowed in compiled]
+    return formulas, depends_on, functions, compiled
+
+
+def load_snapshot(path, warm_seconds=WARM_SECONDS):
+    """
+    Restore a session written by save_snapshot().
+
+    Small integers and floats are unpacked straight from their arrays;
+    big integers are only indexed, and read from the memory-mapped file
+    when first used (see LazyVariables). The user functions are replaced
+    by the saved ones. Formulas are recompiled when first recomputed, and
+    the saved expressions are recompiled, most recent first, for at most
+    `warm_seconds`.
+
+    The file is only ever parsed as data: anything malformed raises a
+    ValueError instead of being executed.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        _check(size >= _HEADER.size, "not a LemmaCalc session file")
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic, version, meta_length, *lengths = _HEADER.unpack_from(data)
+        _check(magic == _MAGIC, "not a LemmaCalc session file")
+        _check(
+            version == SNAPSHOT_VERSION,
+            f"unsupported snapshot version {version} (expected {SNAPSHOT_VERSION})",
+        )
+        _check(
+            _HEADER.size + meta_length + sum(lengths) == size,
+            "the file is truncated or damaged",
+        )
+        position = _HEADER.size + meta_length
+        formulas, depends_on, functions, compiled = _read_meta(
+            data[_HEADER.size : position]
+        )
+        blobs = {}
+        for section, length in zip(_SECTIONS, lengths):
+            if section != "big data":
+                blobs[section] = data[position : position + length]
+            position += length
+        big_data_start = position - lengths[-1]
+
+        ints = _names(blobs["int names"])
+        floats = _names(blobs["float names"])
+        bigs = _names(blobs["big names"])
+        int_values = _little_endian(array("q", blobs["int values"]))
+        float_values = _little_endian(array("d", blobs["float values"]))
+        offsets = _little_endian(array("Q", blobs["big offsets"]))
+        _check(
+            len(ints) == len(int_values)
+            and len(floats) == len(float_values)
+            and len(bigs) + 1 == len(offsets)
+            and offsets[0] == 0
+            and offsets[-1] == lengths[-1],
+            "the variable sections do not match",
+        )
+        _check(
+            all(map(str.isidentifier, ints + floats + bigs)),
+            "a variable name is invalid",
+        )
+        userfuncs.restore(functions)
+    except (ValueError, struct.error):
+        data.close()
+        raise
+    except UnicodeDecodeError:
+        data.close()
+        raise ValueError("Snapshot error: a variable name is invalid.")
+
+    values = dict(zip(ints, int_values.tolist()))
+    values.update(zip(floats, float_values.tolist()))
+    if bigs:
+        pending = dict(zip(bigs, range(len(bigs))))
+        variables = LazyVariables(values, pending, data, offsets, big_data_start)
+    else:
+        data.close()
+        variables = LazyVariables(values)
+
+    graph = None
+    if formulas:
+        graph = DependencyGraph()
+        graph.restore(formulas, depends_on)
+    return Snapshot(variables, graph, warm_compile_cache(compiled, warm_seconds))
@@ -0,0 +1,162 @@
+# lemma_calc/stats.py
+
+import time
+from .constants import allowed_names
+
+# Set by enable()/disable(); checked by core before timing anything
+enabled = False
+
+# Pipeline stages in the order they run, for the report
+STAGES = (
+    "preprocess",
+    "parse",
+    "optimize",
+    "compile",
+    "evaluate",
+    "format",
+    "assignment",
+)
+
+# stage -> [calls, total nanoseconds]
+stage_times = {}
+# function name -> number of calls
+function_calls = {}
+
+# Functions replaced by counting wrappers while enabled
+_originals = {}
+
+
+def _record(stage, elapsed):
+    entry = stage_times.get(stage)
+    if entry is None:
+        stage_times[stage] = [1, elapsed]
+    else:
+        entry[0] += 1
+        entry[1] += elapsed
+
+
+def timed(stage, func, *args):
+    """Call func(*args) and add its duration to `stage`."""
+    start = time.perf_counter_ns()
+    try:
+        return func(*args)
+    finally:
+        _record(stage, time.perf_counter_ns() - start)
+
+
+def stage(name, func, *args):
+    """Like timed(), but only measures while instrumentation is enabled."""
+    if not enabled:
+        return func(*args)
+    return timed(name, func, *args)
+
+
+def _counting(name, func):
+    def counted(*args):
+        # Spreadsheet formulas may outlive a disable(); don't count those
+        if enabled:
+            function_calls[name] = function_calls.get(name, 0) + 1
+        return func(*args)
+
+    counted.__wrapped__ = func
+    return counted
+
+
+def enable():
+    """
+    Start collecting stage timings and function call counts.
+
+    Functions in allowed_names are swapped for counting wrappers, so
+    while disabled they are called directly and cost nothing extra.
+    Compiled expressions hold on to the functions they were compiled
+    with, so the compile cache is cleared on every switch.
+    """
+    global enabled
+    if enabled:
+        return
+    for name, func in allowed_names.items():
+        _originals[name] = func
+        allowed_names[name] = _counting(name, func)
+    enabled = True
+    _clear_compiled()
+
+
+def disable():
+    """Stop collecting and restore the original functions."""
+    global enabled
+    if not enabled:
+        return
+    for name, func in _originals.items():
+        if name in allowed_names:
+            allowed_names[name] = func
+    _originals.clear()
+    enabled = False
+    _clear_compiled()
+
+
+def install(name, func):
+    """Add `func` to allowed_names, counted like the built-ins while enabled."""
+    if enabled:
+        _originals[name] = func
+        func = _counting(name, func)
+    allowed_names[name] = func
+
+
+def uninstall(name):
+    """Remove a function added by install()."""
+    allowed_names.pop(name, None)
+    _originals.pop(name, None)
+
+
+def reset():
+    """Forget collected timings and counts."""
+    stage_times.clear()
+    function_calls.clear()
+
+
+def _clear_compiled():
+    from .core import clear_compile_cache
+
+    clear_compile_cache()
+
+
+def report():
+    """Return the collected statistics as printable text."""
+    from .core import compile_cache_info
+    from .userfuncs import memo_info
+
+    if not stage_times and not function_calls:
+        state = "on" if enabled else "off ('stats on' to start)"
+        return f"No statistics collected yet (instrumentation is {state})."
+
+    lines = [f"{'stage':<12} {'calls':>8} {'total ms':>10} {'mean µs':>10}"]
+    ordered = [s for s in STAGES if s in stage_times]
+    ordered += sorted(s for s in stage_times if s not in STAGES)
+    for name in ordered:
+        calls, total = stage_times[name]
+        lines.append(
+            f"{name:<12} {calls:>8,} {total / 1e6:>10.3f} {total / calls / 1e3:>10.2f}"
+        )
+
+    if function_calls:
+        calls = sorted(function_calls.items(), key=lambda item: (-item[1], item[0]))
+        lines.append("")
+        lines.append("function calls: " + ", ".join(f"{n} {c:,}" for n, c in calls))
+
+    cache = compile_cache_info()
+    lines.append("")
+    lines.append(
+        f"compile cache: {cache['hits']:,} hits, {cache['misses']:,} misses, "
+        f"{cache['evictions']:,} evictions ({cache['size']}/{cache['maxsize']})"
+    )
+    memos = memo_info()
+    if memos:
+        lines.append(
+            "function memo: "
+            + ", ".join(
+                f"{name} {info['hits']:,} hits, {info['misses']:,} misses "
+                f"({info['size']}/{info['maxsize']})"
+                for name, info in memos.items()
+            )
+        )
+    return "\n".join(lines)
@@ -0,0 +1,483 @@
+# lemma_calc/symbolic.py
+
+import ast
+import math
+import sys
+from numbers import Real
+from .cache import LRUCache
+from .compiler import SpecialForm, free_names
+from .constants import COMPILE_CACHE_SIZE, allowed_names, special_forms
+from .guards import check_cancelled
+
+# Newton steps tried from the starting guess before bracketing
+NEWTON_MAX_STEPS = 50
+# Doublings of the search step when looking for a sign change
+BRACKET_MAX_STEPS = 60
+# Iterations of Brent's method on a bracket
+BRENT_MAX_STEPS = 200
+# Starting guess of solve() and root() when none is given
+DEFAULT_GUESS = 1.0
+
+_EPSILON = 2.220446049250313e-16
+# Largest |f(root)| accepted after Brent's method, relative to the
+# function's scale over the bracket: more than that is a jump or a pole
+_RESIDUAL = math.sqrt(_EPSILON)
+
+# Derivative trees keyed on (ast.dump(node), variable)
+_derivatives = LRUCache(COMPILE_CACHE_SIZE)
+
+
+def _value(node):
+    """The number a node stands for, or None if it is not a literal."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = _value(node.operand)
+        return None if value is None else -value
+    return None
+
+
+def _number(value):
+    if value < 0:
+        return ast.UnaryOp(op=ast.USub(), operand=ast.Constant(-value))
+    return ast.Constant(value)
+
+
+def _call(name, *args):
+    func = ast.Name(id=name, ctx=ast.Load())
+    return ast.Call(func=func, args=list(args), keywords=[])
+
+
+# Node builders that simplify the 0s and 1s the rules produce, so
+# derivatives stay small and cheap to evaluate
+
+
+def _add(a, b):
+    if _value(a) == 0:
+        return b
+    if _value(b) == 0:
+        return a
+    return ast.BinOp(left=a, op=ast.Add(), right=b)
+
+
+def _sub(a, b):
+    if _value(b) == 0:
+        return a
+    if _value(a) == 0:
+        return _neg(b)
+    if _value(a) is not None and _value(b) is not None:
+        return _number(_value(a) - _value(b))
+    return ast.BinOp(left=a, op=ast.Sub(), right=b)
+
+
+def _neg(a):
+    if _value(a) is not None:
+        return _number(-_value(a))
+    if isinstance(a, ast.UnaryOp) and isinstance(a.op, ast.USub):
+        return a.operand
+    return ast.UnaryOp(op=ast.USub(), operand=a)
+
+
+def _mul(a, b):
+    if _value(a) == 0 or _value(b) == 0:
+        return ast.Constant(0)
+    if _value(a) == 1:
+        return b
+    if _value(b) == 1:
+        return a
+    if _value(a) is not None and _value(b) is not None:
+        return _number(_value(a) * _value(b))
+    return ast.BinOp(left=a, op=ast.Mult(), right=b)
+
+
+def _div(a, b):
+    if _value(a) == 0:
+        return ast.Constant(0)
+    if _value(b) == 1:
+        return a
+    return ast.BinOp(left=a, op=ast.Div(), right=b)
+
+
+def _pow(a, b):
+    if _value(b) == 1:
+        return a
+    return ast.BinOp(left=a, op=ast.Pow(), right=b)
+
+
+# f -> f'(u) for functions of one argument; the chain rule multiplies by u'
+_CHAIN_RULES = {
+    "sin": lambda u: _call("cos", u),
+    "cos": lambda u: _neg(_call("sin", u)),
+    "tan": lambda u: _div(ast.Constant(1), _pow(_call("cos", u), ast.Constant(2))),
+    "asin": lambda u: _div(
+        ast.Constant(1),
+        _call("sqrt", _sub(ast.Constant(1), _pow(u, ast.Constant(2)))),
+    ),
+    "acos": lambda u: _neg(
+        _div(
+            ast.Constant(1),
+            _call("sqrt", _sub(ast.Constant(1), _pow(u, ast.Constant(2)))),
+        )
+    ),
+    "atan": lambda u: _div(
+        ast.Constant(1), _add(ast.Constant(1), _pow(u, ast.Constant(2)))
+    ),
+    "exp": lambda u: _call("exp", u),
+    "log": lambda u: _div(ast.Constant(1), u),
+    "log10": lambda u: _div(ast.Constant(1), _mul(u, ast.Constant(math.log(10)))),
+    "sqrt": lambda u: _div(ast.Constant(1), _mul(ast.Constant(2), _call("sqrt", u))),
+    "abs": lambda u: _div(u, _call("abs", u)),
+    "degrees": lambda u: ast.Constant(180 / math.pi),
+    "radians": lambda u: ast.Constant(math.pi / 180),
+    # Piecewise constant: zero wherever the derivative exists
+    "floor": lambda u: ast.Constant(0),
+    "ceil": lambda u: ast.Constant(0),
+    "round": lambda u: ast.Constant(0),
+}
+
+
+def derivative(node, var, functions=None):
+    """
+    Return the derivative of an expression tree with respect to `var`,
+    as a new tree that compiles like any other expression.
+
+    `functions` is the table the tree is compiled against (allowed_names
+    by default): a call to a name not in it is implicit multiplication,
+    as it is for the compiler.
+
+    Derivatives are cached per (tree, variable), so solving the same
+    equation again, or one sharing a side with it, reuses the work.
+
+    Raises:
+        ValueError: If the expression uses something without a
+            derivative rule (factorial, integrate, ...).
+    """
+    if isinstance(node, ast.Expression):
+        node = node.body
+    if functions is None:
+        functions = allowed_names
+    # Which called names are functions is all the table changes
+    called = frozenset(
+        sub.func.id
+        for sub in ast.walk(node)
+        if isinstance(sub, ast.Call)
+        and isinstance(sub.func, ast.Name)
+        and sub.func.id in functions
+    )
+    key = (ast.dump(node), var, called)
+    result = _derivatives.get(key)
+    if result is None:
+        result = _Differentiator(var, functions).visit(node)
+        _derivatives.put(key, result)
+    return result
+
+
+class _Differentiator:
+
+    def __init__(self, var, functions):
+        self.var = var
+        self.functions = functions
+
+    def visit(self, node):
+        method = getattr(self, "_visit_" + type(node).__name__, None)
+        if method is None:
+            raise ValueError(f"Cannot differentiate {ast.unparse(node)}")
+        return method(node)
+
+    def _visit_Constant(self, node):
+        return ast.Constant(0)
+
+    def _visit_Name(self, node):
+        return ast.Constant(1 if node.id == self.var else 0)
+
+    def _visit_UnaryOp(self, node):
+        du = self.visit(node.operand)
+        if isinstance(node.op, ast.USub):
+            return _neg(du)
+        if isinstance(node.op, ast.UAdd):
+            return du
+        raise ValueError(f"Cannot differentiate {ast.unparse(node)}")
+
+    def _visit_BinOp(self, node):
+        u, v = node.left, node.right
+        du, dv = self.visit(u), self.visit(v)
+        op = node.op
+        if isinstance(op, ast.Add):
+            return _add(du, dv)
+        if isinstance(op, ast.Sub):
+            return _sub(du, dv)
+        if isinstance(op, ast.Mult):
+            return _add(_mul(du, v), _mul(u, dv))
+        if isinstance(op, ast.Div):
+            if _value(dv) == 0:
+                return _div(du, v)
+            return _div(_sub(_mul(du, v), _mul(u, dv)), _pow(v, ast.Constant(2)))
+        if isinstance(op, ast.Mod):
+            # u % v = u - v*floor(u/v)
+            return _sub(du, _mul(dv, _call("floor", _div(u, v))))
+        if isinstance(op, ast.Pow):
+            if _value(dv) == 0:
+                return _mul(_mul(v, _pow(u, _sub(v, ast.Constant(1)))), du)
+            if _value(du) == 0:
+                return _mul(_mul(node, _call("log", u)), dv)
+            return _mul(
+                node, _add(_mul(dv, _call("log", u)), _div(_mul(v, du), u))
+            )
+        raise ValueError(f"Cannot differentiate {ast.unparse(node)}")
+
+    def _visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise ValueError(f"Cannot differentiate {ast.unparse(node)}")
+        name = node.func.id
+        if name in special_forms or name == "factorial":
+            if self.var in free_names(node):
+                raise ValueError(f"Cannot differentiate {name}()")
+            return ast.Constant(0)
+        if name not in self.functions:
+            if len(node.args) != 1:
+                raise ValueError(f"Function {name} unknown or not allowed")
+            # Implicit multiplication with a variable, e.g. k(x+1)
+            product = ast.BinOp(left=node.func, op=ast.Mult(), right=node.args[0])
+            return self.visit(product)
+        if name == "log" and len(node.args) == 2:
+            # log(u, b) = log(u) / log(b)
+            u, base = node.args
+            return self.visit(
+                ast.BinOp(left=_call("log", u), op=ast.Div(), right=_call("log", base))
+            )
+        if name == "round" and len(node.args) == 2:
+            return ast.Constant(0)
+        rule = _CHAIN_RULES.get(name)
+        if rule is None or len(node.args) != 1:
+            raise ValueError(f"Cannot differentiate {ast.unparse(node)}")
+        (u,) = node.args
+        du = self.visit(u)
+        if _value(du) == 0:
+            return ast.Constant(0)
+        return _mul(rule(u), du)
+
+
+def _real(value):
+    if isinstance(value, bool) or not isinstance(value, Real):
+        raise ValueError("Solve error: the equation must have real values.")
+    return value
+
+
+def _underflowed(f, zero, nonzero, start):
+    """
+    Whether f(zero) == 0 only because f underflowed, as exp(x) does far
+    left of 0: f(nonzero) != 0, and where f reaches zero between the
+    two points its values are subnormal although x there is not
+    negligible at the scale of the search from `start`.
+    """
+    fn = f(nonzero)
+    for _ in range(BRENT_MAX_STEPS):
+        middle = 0.5 * (zero + nonzero)
+        if middle == zero or middle == nonzero:
+            break
+        try:
+            fm = f(middle)
+        except (ValueError, ArithmeticError):
+            return False
+        if fm == 0:
+            zero = middle
+        else:
+            nonzero, fn = middle, fm
+    scale = abs(start) + abs(nonzero - start)
+    return abs(fn) < sys.float_info.min and abs(nonzero) > _EPSILON * scale
+
+
+def _newton(f, df, x):
+    """Newton's method from x; returns the root or None on failure."""
+    start = previous = x
+    for _ in range(NEWTON_MAX_STEPS):
+        try:
+            fx = f(x)
+            if fx == 0:
+                if x != start and _underflowed(f, x, previous, start):
+                    return None
+                return x
+            slope = df(x)
+        except (ValueError, ArithmeticError):
+            return None
+        if not slope or not math.isfinite(slope):
+            return None
+        step = fx / slope
+        following = x - step
+        if not math.isfinite(following):
+            return None
+        if abs(step) <= 4 * _EPSILON * max(1.0, abs(following)):
+            return following
+        previous, x = x, following
+    return None
+
+
+def _bracket(f, x0, f0):
+    """
+    Search outward from x0 for a sign change of f, doubling the step.
+    Returns (a, b, fa, fb) or None. Points where f fails are skipped; a
+    zero that f only reaches by underflowing ends the search.
+    """
+    step = 0.01 * max(1.0, abs(x0))
+    sides = [[x0, f0], [x0, f0]]
+    for _ in range(BRACKET_MAX_STEPS):
+        for direction, side in zip((1, -1), sides):
+            x = x0 + direction * step
+            try:
+                fx = f(x)
+            except (ValueError, ArithmeticError):
+                continue
+            if fx == 0 and _underflowed(f, x, side[0], x0):
+                return None
+            if fx == 0 or (fx > 0) != (side[1] > 0):
+                return side[0], x, side[1], fx
+            side[0], side[1] = x, fx
+        step *= 2
+    return None
+
+
+def _brent(f, a, b, fa, fb):
+    """Brent's method on a bracket [a, b] with f(a), f(b) of opposite signs."""
+    c, fc = b, fb
+    d = e = b - a
+    for _ in range(BRENT_MAX_STEPS):
+        if (fb > 0) == (fc > 0):
+            c, fc = a, fa
+            d = e = b - a
+        if abs(fc) < abs(fb):
+            a, b, c = b, c, b
+            fa, fb, fc = fb, fc, fb
+        tol = 2 * _EPSILON * abs(b) + 1e-300
+        half = 0.5 * (c - b)
+        if abs(half) <= tol or fb == 0:
+            return b
+        if abs(e) >= tol and abs(fa) > abs(fb):
+            # Inverse quadratic interpolation, or secant when a == c
+            s = fb / fa
+            if a == c:
+                p = 2 * half * s
+                q = 1 - s
+            else:
+                q = fa / fc
+                r = fb / fc
+                p = s * (2 * half * q * (q - r) - (b - a) * (r - 1))
+                q = (q - 1) * (r - 1) * (s - 1)
+            if p > 0:
+                q = -q
+            p = abs(p)
+            if 2 * p < min(3 * half * q - abs(tol * q), abs(e * q)):
+                e, d = d, p / q
+            else:
+                d = e = half
+        else:
+            d = e = half
+        a, fa = b, fb
+        b += d if abs(d) > tol else math.copysign(tol, half)
+        fb = f(b)
+    return b
+
+
+def find_root(f, df, guess=DEFAULT_GUESS, bracket=None):
+    """
+    Find x with f(x) = 0.
+
+    Without a bracket, Newton's method runs from `guess` using the
+    derivative `df` (None if there is none); if it fails, a sign change
+    is searched for outward from the guess and narrowed by Brent's
+    method. With a bracket (a, b), Brent's method runs on it directly.
+
+    Raises:
+        ValueError: If no root is found.
+    """
+    if bracket is not None:
+        a, b = bracket
+        fa, fb = f(a), f(b)
+        if fa == 0 or fb == 0:
+            return a if fa == 0 else b
+        if (fa > 0) == (fb > 0):
+            raise ValueError(
+                f"Solve error: no sign change between {a:g} and {b:g}."
+            )
+    else:
+        f0 = f(guess)  # errors here are the user's to see
+        if f0 == 0:
+            return guess
+        if df is not None:
+            root = _newton(f, df, guess)
+            if root is not None:
+                return root
+        found = _bracket(f, guess, f0)
+        if found is None:
+            raise ValueError(f"Solve error: no root found near {guess:g}.")
+        a, b, fa, fb = found
+        if fb == 0:
+            return b
+
+    root = _brent(f, a, b, fa, fb)
+    # A sign change across a pole (1/x) or a jump (floor) is not a root
+    if not abs(f(root)) <= _RESIDUAL * max(abs(fa), abs(fb)):
+        raise ValueError(
+            f"Solve error: the sign changes at {root:g} but there is no root there."
+        )
+    return root
+
+
+def _solver(name, args, compile, functions):
+    if len(args) not in (2, 3, 4):
+        raise ValueError(
+            f"{name}() takes 2 to 4 arguments: {name}(equation, x[, guess]) "
+            f"or {name}(equation, x, a, b)"
+        )
+    if not isinstance(args[1], ast.Name):
+        raise ValueError(f"{name}() needs a variable name as its second argument")
+    var = args[1].id
+    equation = args[0]
+    if isinstance(equation, ast.Compare):
+        if len(equation.ops) != 1 or not isinstance(equation.ops[0], ast.Eq):
+            raise ValueError(f"{name}() takes a single equation, like x^2 = 2")
+        lhs, rhs = equation.left, equation.comparators[0]
+    else:
+        lhs, rhs = equation, ast.Constant(0)
+
+    run = compile(ast.BinOp(left=lhs, op=ast.Sub(), right=rhs))
+    try:
+        slope = compile(
+            _sub(derivative(lhs, var, functions), derivative(rhs, var, functions))
+        )
+    except ValueError:
+        slope = None  # bracketing still works without a derivative
+    limits = [compile(arg) for arg in args[2:]]
+
+    def solve(env):
+        local = dict(env)
+
+        def f(x):
+            check_cancelled()
+            local[var] = x
+            return _real(run(local))
+
+        df = None
+        if slope is not None:
+
+            def df(x):
+                local[var] = x
+                return _real(slope(local))
+
+        points = [_real(limit(env)) for limit in limits]
+        if len(points) == 2:
+            return find_root(f, df, bracket=points)
+        return find_root(f, df, points[0] if points else DEFAULT_GUESS)
+
+    return solve
+
+
+def _solve(args, compile, functions):
+    return _solver("solve", args, compile, functions)
+
+
+def _root(args, compile, functions):
+    return _solver("root", args, compile, functions)
+
+
+special_forms["solve"] = SpecialForm(_solve, bound=1, scoped=(0,))
+special_forms["root"] = SpecialForm(_root, bound=1, scoped=(0,))
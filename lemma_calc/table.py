@@ -0,0 +1,148 @@
+# lemma_calc/table.py
+
+import csv
+import re
+import sys
+from .bignum import int_to_str
+from .core import (
+    compile_expression,
+    evaluate_compiled,
+    evaluate_expression,
+    format_result,
+    load_lazy,
+    shadowed_constants,
+)
+from .guards import check_cancelled
+
+# table <expr> for <var> in <start>..<stop> [step <step>] [> file]
+_TABLE_PATTERN = re.compile(
+    r"^\s*table\s+(?P<expr>.+?)\s+for\s+(?P<var>[A-Za-z_][A-Za-z0-9_]*)\s+in\s+"
+    r"(?P<start>.+?)\s*\.\.\s*(?P<stop>.+?)"
+    r"(?:\s+step\s+(?P<step>.+?))?"
+    r"(?:\s*>\s*(?P<path>\S+))?\s*$",
+    re.IGNORECASE,
+)
+
+
+def grid(start, stop, step=1):
+    """
+    Return an iterator over start, start + step, ... up to and including
+    stop.
+
+    Points are computed as start + i*step rather than by repeated
+    addition, so float grids don't drift, and a stop that is a hair off
+    the grid due to rounding (0..1 step 0.1) is still included.
+    """
+    if step == 0:
+        raise ValueError("Table error: step must not be zero.")
+    if (stop - start) * step < 0:
+        raise ValueError("Table error: step must move from the start toward the end.")
+    if all(isinstance(v, int) for v in (start, stop, step)):
+        return iter(range(start, stop + (1 if step > 0 else -1), step))
+    count = int((stop - start) / step + 1e-9) + 1
+    return (start + i * step for i in range(count))
+
+
+def table(expr, var, start, stop, step=1, variables=None):
+    """
+    Lazily evaluate `expr` for `var` over a grid (see grid()).
+
+    The expression is compiled once, up front (so syntax errors surface
+    before any row); each row only rebinds `var` and runs the compiled
+    evaluator, so memory use does not grow with the number of rows.
+    Other names resolve from `variables`.
+
+    Returns an iterator of (x, value, error) tuples: error is None on
+    success, and value is None when evaluating that row failed.
+    """
+    env = dict(variables or {})
+    env[var] = start
+    compiled = compile_expression(expr, shadowed_constants(env))
+    env.update(load_lazy(variables, compiled.names - {var}))
+    return _rows(compiled.run, env, var, grid(start, stop, step))
+
+
+def _rows(run, env, var, points):
+    for x in points:
+        check_cancelled()
+        env[var] = x
+        try:
+            yield x, evaluate_compiled(run, env), None
+        except ValueError as e:
+            yield x, None, str(e)
+
+
+def parse_table_command(text, variables):
+    """
+    Parse `table <expr> for x in a..b [step h] [> file]`. The bounds and
+    step may be expressions (0..2pi step pi/8).
+
+    Returns:
+        tuple: (expr, var, start, stop, step, path or None)
+    """
+    match = _TABLE_PATTERN.match(text)
+    if not match:
+        raise ValueError(
+            "Usage: table <expr> for <var> in <start>..<end> [step <h>] [> file.csv]"
+        )
+    bounds = [
+        evaluate_expression(match.group(name), variables)
+        for name in ("start", "stop")
+    ]
+    step = evaluate_expression(match.group("step") or "1", variables)
+    for value in bounds + [step]:
+        if not isinstance(value, (int, float)):
+            raise ValueError("Table error: bounds and step must be real numbers.")
+    return (
+        match.group("expr"),
+        match.group("var"),
+        bounds[0],
+        bounds[1],
+        step,
+        match.group("path"),
+    )
+
+
+def _csv_value(value):
+    if isinstance(value, int):
+        return int_to_str(value)  # not subject to the int -> str limit
+    return value
+
+
+def write_csv(rows, out, var, expr):
+    """Write table rows as CSV (columns: var, expr, error). Returns rows written."""
+    writer = csv.writer(out)
+    writer.writerow([var, expr, "error"])
+    count = 0
+    for x, value, error in rows:
+        shown = "" if value is None else _csv_value(value)
+        writer.writerow([_csv_value(x), shown, error or ""])
+        count += 1
+    return count
+
+
+def write_text(rows, out, var, expr):
+    """Write table rows as aligned text. Returns rows written."""
+    width = max(len(var), 12)
+    out.write(f"{var:>{width}}  {expr}\n")
+    count = 0
+    for x, value, error in rows:
+        shown = f"Error: {error}" if error else format_result(value)
+        out.write(f"{format_result(x):>{width}}  {shown}\n")
+        count += 1
+    return count
+
+
+def run_table_command(text, variables, out=None):
+    """
+    Handle the REPL `table` command: stream the rows to `out` (default
+    stdout) as text, or to the file after '>' (CSV for *.csv paths).
+    Returns the number of rows written.
+    """
+    expr, var, start, stop, step, path = parse_table_command(text, variables)
+    rows = table(expr, var, start, stop, step, variables)
+    if path is None:
+        return write_text(rows, out or sys.stdout, var, expr)
+    writer = write_csv if path.lower().endswith(".csv") else write_text
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        return writer(rows, f, var, expr)
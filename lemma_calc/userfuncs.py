@@ -0,0 +1,358 @@
+# lemma_calc/userfuncs.py
+
+import ast
+import threading
+from collections import ChainMap
+from collections.abc import Mapping
+from . import stats
+from .cache import LRUCache
+from .compiler import SpecialForm, free_names
+from .constants import allowed_names, math_constants, special_forms, user_functions
+from .guards import check_cancelled
+from .optimizer import optimize
+
+# Nested user-function calls allowed before evaluation is stopped
+MAX_CALL_DEPTH = 100
+# Results kept per function (the least recently used go); 0 turns
+# memoization off
+MEMO_SIZE = 4096
+
+_MISSING = object()
+# Call depth of the user functions running in each thread
+_state = threading.local()
+
+
+class UserFunction:
+    """
+    A function defined in the session, such as f(x) = x^2 + 3x.
+
+    The body is compiled once, when it is defined. Variables it reads
+    other than its parameters are captured with their values at that
+    moment (`captured`), so a call depends only on its arguments and the
+    result can be memoized in `memo`, an LRUCache of up to `memo_size`
+    results. Calls to other user functions go through the called
+    function object, so redefining it takes effect everywhere.
+    """
+
+    __slots__ = ("name", "params", "body", "captured", "run", "memo")
+
+    # Calls are not constant-folded: the function may be redefined
+    foldable = False
+
+    def __init__(self, name, memo_size=None):
+        if memo_size is None:
+            memo_size = MEMO_SIZE
+        self.name = name
+        self.params = ()
+        self.body = ""
+        self.captured = {}
+        self.run = None
+        self.memo = LRUCache(memo_size) if memo_size else None
+
+    def __repr__(self):
+        return f"{self.name}({', '.join(self.params)}) = {self.body}"
+
+    def __call__(self, *args):
+        if len(args) != len(self.params):
+            raise TypeError(
+                f"{self.name}() takes {len(self.params)} argument(s) "
+                f"({len(args)} given)"
+            )
+        memo = self.memo
+        key = None
+        if memo is not None:
+            # 1 and 1.0 are equal keys but may give different results
+            key = args + tuple(map(type, args))
+            try:
+                value = memo.get(key, _MISSING)
+            except TypeError:  # unhashable, e.g. a NumPy array
+                key = None
+            else:
+                if value is not _MISSING:
+                    return value
+        if self.run is None:
+            raise ValueError(f"Function error: {self.name}() is not defined yet.")
+
+        depth = getattr(_state, "depth", 0)
+        if depth >= MAX_CALL_DEPTH:
+            raise ValueError(
+                f"Function error: more than {MAX_CALL_DEPTH} nested calls "
+                f"(in {self.name}())."
+            )
+        check_cancelled()
+        env = dict(self.captured)
+        env.update(zip(self.params, args))
+        _state.depth = depth + 1
+        try:
+            value = self.run(env)
+        finally:
+            _state.depth = depth
+        if key is not None:
+            memo.put(key, value)
+        return value
+
+
+def _parse(params, body, names):
+    """Parse a body in which `params` and `names` shadow math constants."""
+    from .core import parse_expression  # core imports this module
+
+    shadowed = tuple(
+        constant
+        for constant in math_constants
+        if constant in params or constant in names
+    )
+    return parse_expression(body, shadowed)
+
+
+class _Builtins(Mapping):
+    """allowed_names without the REPL's user functions."""
+
+    def __getitem__(self, name):
+        if name in user_functions:
+            raise KeyError(name)
+        return allowed_names[name]
+
+    def __contains__(self, name):
+        return name in allowed_names and name not in user_functions
+
+    def __iter__(self):
+        return (name for name in allowed_names if name not in user_functions)
+
+    def __len__(self):
+        return len(allowed_names) - len(user_functions)
+
+
+# The built-in functions, the base of every FunctionTable but the REPL's
+builtins = _Builtins()
+
+
+class FunctionTable:
+    """
+    The user functions of one namespace (`defined`, in the order they
+    were first defined) and the mapping its expressions are compiled
+    against (`functions`).
+
+    The module's `table` is the REPL's: its functions live in
+    constants.user_functions and are installed in allowed_names (see
+    stats.install). Other tables, such as a calculator.Calculator's,
+    layer their functions over `builtins` and see nothing of the REPL's.
+    `on_change` is called after every change, to drop expressions
+    compiled against the old definitions.
+    """
+
+    __slots__ = ("defined", "functions", "memo_size", "generation", "_on_change")
+
+    def __init__(self, defined=None, functions=None, on_change=None):
+        self.defined = {} if defined is None else defined
+        if functions is None:
+            functions = ChainMap(self.defined, builtins)
+        self.functions = functions
+        self.memo_size = MEMO_SIZE
+        # Bumped by every change, so copies elsewhere (the sandbox
+        # worker) can tell they are stale
+        self.generation = 0
+        self._on_change = on_change
+
+    def define(self, name, params, body, variables):
+        """
+        Define (or redefine) the user function `name(params) = body`.
+
+        Variables the body reads are captured from `variables`. Memoized
+        results of every function in the table are dropped, as they may
+        depend on the old definition.
+
+        Raises:
+            ValueError: For a built-in name, repeated parameters, a syntax
+                error or an unknown variable in the body.
+        """
+        if name in special_forms or name in math_constants or (
+            name in self.functions and name not in self.defined
+        ):
+            raise ValueError(
+                f"Function error: '{name}' is built in and cannot be redefined."
+            )
+        if len(set(params)) != len(params):
+            raise ValueError(f"Function error: repeated parameter in {name}().")
+
+        function = self.defined.get(name)
+        new = function is None
+        if new:
+            # Registered first, so the body can call the function itself
+            function = UserFunction(name, self.memo_size)
+            self._install(name, function)
+        try:
+            tree = _parse(params, body, variables)
+            captured = {}
+            for var in sorted(free_names(tree, self.functions) - set(params)):
+                if var not in variables:
+                    raise ValueError(f"Unknown variable or identifier {var}")
+                captured[var] = variables[var]
+            run = self._compile(tree)
+        except Exception:
+            if new:
+                self._uninstall(name)
+            raise
+
+        function.params = tuple(params)
+        function.body = body
+        function.captured = captured
+        function.run = run
+        self._changed()
+        return function
+
+    def _compile(self, tree):
+        return optimize(tree, self.functions).compile(self.functions)
+
+    def _install(self, name, function):
+        self.defined[name] = function
+        if self.defined is user_functions:
+            stats.install(name, function)
+
+    def _uninstall(self, name):
+        del self.defined[name]
+        if self.defined is user_functions:
+            stats.uninstall(name)
+
+    def _changed(self):
+        self.generation += 1
+        for function in self.defined.values():
+            if function.memo is not None:
+                function.memo.clear()
+        # Cached expressions may have compiled a call on the old table
+        if self._on_change is not None:
+            self._on_change()
+
+    def export(self):
+        """
+        The definitions of the user functions, in the order they were
+        first defined: [(name, params, body, captured), ...].
+        """
+        return [
+            (f.name, list(f.params), f.body, dict(f.captured))
+            for f in self.defined.values()
+        ]
+
+    def restore(self, definitions):
+        """
+        Replace the user functions with `definitions` as returned by
+        export(). Every function is registered before any body is
+        compiled, so bodies may call functions defined after them.
+
+        Raises:
+            ValueError: If a body no longer compiles (nothing is replaced).
+        """
+        functions = {}
+        for name, params, body, captured in definitions:
+            function = UserFunction(name, self.memo_size)
+            function.params = tuple(params)
+            function.body = body
+            function.captured = dict(captured)
+            functions[name] = function
+
+        previous = dict(self.defined)
+        self._replace(functions)
+        try:
+            for function in functions.values():
+                tree = _parse(function.params, function.body, function.captured)
+                function.run = self._compile(tree)
+        except ValueError:
+            self._replace(previous)
+            raise
+        self._changed()
+
+    def _replace(self, functions):
+        for name in list(self.defined):
+            self._uninstall(name)
+        for name, function in functions.items():
+            self._install(name, function)
+
+    def set_memo_size(self, size):
+        """Keep up to `size` results per user function (0: no memoization)."""
+        if size < 0:
+            raise ValueError("The memo size cannot be negative.")
+        self.memo_size = size
+        for function in self.defined.values():
+            function.memo = LRUCache(size) if size else None
+
+    def memo_info(self):
+        """Map each memoized user function to its cache counters."""
+        return {
+            name: function.memo.info()
+            for name, function in self.defined.items()
+            if function.memo is not None
+        }
+
+    def calls(self, tree):
+        """Whether a parsed expression calls one of the user functions."""
+        if not self.defined:
+            return False
+        return any(
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in self.defined
+            for node in ast.walk(tree)
+        )
+
+
+def _clear_compile_cache():
+    from .core import clear_compile_cache
+
+    clear_compile_cache()
+
+
+# The REPL's user functions
+table = FunctionTable(user_functions, allowed_names, _clear_compile_cache)
+
+
+def define_function(name, params, body, variables):
+    """
+    Define (or redefine) the REPL user function `name(params) = body`,
+    registered in allowed_names so expressions call it like a built-in
+    (see FunctionTable.define).
+    """
+    return table.define(name, params, body, variables)
+
+
+def export():
+    """The definitions of the REPL's user functions (see FunctionTable.export)."""
+    return table.export()
+
+
+def restore(definitions):
+    """Replace the REPL's user functions (see FunctionTable.restore)."""
+    table.restore(definitions)
+
+
+def set_memo_size(size):
+    """
+    Keep up to `size` results per user function (0: no memoization), in
+    the REPL and in the tables created from now on.
+    """
+    global MEMO_SIZE
+    table.set_memo_size(size)
+    MEMO_SIZE = size
+
+
+def memo_info():
+    """Memo counters of the REPL's user functions."""
+    return table.memo_info()
+
+
+def calls_user_function(tree):
+    """Whether a parsed expression calls a REPL user function anywhere."""
+    return table.calls(tree)
+
+
+def _if(args, compile, functions):
+    if len(args) != 3:
+        raise ValueError("if() takes 3 arguments: if(condition, then, otherwise)")
+    condition, then, otherwise = [compile(arg) for arg in args]
+
+    def run(env):
+        # Only the branch taken is evaluated, which lets functions recurse
+        return then(env) if condition(env) else otherwise(env)
+
+    return run
+
+
+special_forms["if_"] = SpecialForm(_if)
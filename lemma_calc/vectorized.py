@@ -0,0 +1,180 @@
+# lemma_calc/vectorized.py
+
+import ast
+from .arrays import array_power, load_numpy, ufunc_names
+from .cache import LRUCache
+from .compiler import compile_tree, check_factorial
+from .constants import allowed_names, allowed_operators
+from .constants import COMPILE_CACHE_SIZE
+from .guards import guarded_factorial
+from .userfuncs import builtins
+from .core import (
+    compile_expression,
+    evaluate_compiled,
+    load_lazy,
+    shadowed_constants,
+)
+
+# NumPy is optional; evaluate_many then loops in Python
+np = load_numpy()
+
+# (CompiledExpression, vector closure) keyed like the scalar
+# compiled-expression cache
+_vector_cache = LRUCache(COMPILE_CACHE_SIZE)
+_vector_tables = None
+
+
+def _vector_log(x, base=None):
+    if base is None:
+        return np.log(x)
+    return np.log(x) / np.log(base)
+
+
+def _vector_round(x, ndigits=0):
+    return np.round(x, ndigits)
+
+
+def _factorial_element(value):
+    if isinstance(value, np.integer):
+        value = int(value)
+    check_factorial([value])
+    return guarded_factorial(value)
+
+
+def _elementwise(func):
+    """Apply a scalar function element by element (no vector form)."""
+    vectorized = np.vectorize(func, otypes=[object])
+
+    def apply(*args):
+        return vectorized(*args)
+
+    return apply
+
+
+def vector_tables(functions=None):
+    """
+    Build (once) the function and operator tables used for vectorized
+    evaluation. Functions without a ufunc fall back to per-element calls,
+    as do the user functions of `functions` (the table an expression is
+    compiled against, allowed_names by default), added on every call.
+    """
+    global _vector_tables
+    if _vector_tables is None:
+        vector_functions = {}
+        for name, func in builtins.items():
+            if name in ufunc_names:
+                vector_functions[name] = getattr(np, ufunc_names[name])
+            else:
+                vector_functions[name] = _elementwise(func)
+        vector_functions["log"] = _vector_log
+        vector_functions["round"] = _vector_round
+        vector_functions["factorial"] = _elementwise(_factorial_element)
+
+        operators = dict(allowed_operators)
+        operators[ast.Pow] = array_power
+        _vector_tables = (vector_functions, operators)
+    vector_functions, operators = _vector_tables
+    if functions is None:
+        functions = allowed_names
+    defined = [name for name in functions if name not in builtins]
+    if defined:
+        vector_functions = dict(vector_functions)
+        for name in defined:
+            vector_functions[name] = _elementwise(functions[name])
+    return vector_functions, operators
+
+
+def _compile_vector(expr, shadowed):
+    key = (expr, shadowed)
+    compiled = compile_expression(expr, shadowed)
+    entry = _vector_cache.get(key)
+    # A new CompiledExpression means the function table changed since
+    if entry is None or entry[0] is not compiled:
+        functions, operators = vector_tables()
+        # Factorial arguments are checked per element instead
+        run = compile_tree(compiled.tree, functions, operators, checks={})
+        entry = (compiled, run)
+        _vector_cache.put(key, entry)
+    return entry[1]
+
+
+def _binding_length(bindings):
+    length = None
+    for name, values in bindings.items():
+        if isinstance(values, (int, float)):
+            continue
+        if length is None:
+            length = len(values)
+        elif len(values) != length:
+            raise ValueError(
+                f"Binding '{name}' has {len(values)} values, expected {length}"
+            )
+    return 1 if length is None else length
+
+
+def _run_vectorized(run, env):
+    with np.errstate(divide="raise", invalid="raise", over="raise"):
+        try:
+            return run(env)
+        except FloatingPointError as fpe:
+            if "divide by zero" in str(fpe):
+                raise ZeroDivisionError(str(fpe))
+            raise ValueError(f"Math error: {fpe}")
+
+
+def evaluate_many(expr, bindings, variables=None, use_numpy=None):
+    """
+    Evaluate one expression over many variable bindings at once.
+
+    Args:
+        expr (str): The expression, e.g. "sqrt(x^2 + y^2)".
+        bindings (dict): Maps names to equally long sequences (NumPy
+            arrays, lists, ...). Plain numbers are broadcast.
+        variables (dict, optional): Extra scalar variables.
+        use_numpy (bool, optional): Force or disable the NumPy path.
+            Defaults to using NumPy when it is installed.
+
+    With NumPy the expression runs as a single vectorized pass over
+    ufuncs and an ndarray is returned; otherwise it is evaluated row by
+    row with the compiled scalar closures and a list is returned.
+    Errors (division by zero, domain errors) are raised like
+    evaluate_expression does, for the whole batch.
+    """
+    if variables is None:
+        variables = {}
+    if use_numpy is None:
+        use_numpy = np is not None
+    elif use_numpy and np is None:
+        raise ValueError("NumPy is not installed; use use_numpy=False.")
+
+    length = _binding_length(bindings)
+    env = dict(variables)
+    env.update(bindings)
+    shadowed = shadowed_constants(env)
+    if type(variables) is not dict:
+        names = compile_expression(expr, shadowed).names - set(bindings)
+        env.update(load_lazy(variables, names))
+
+    if not use_numpy:
+        return _evaluate_rows(expr, shadowed, bindings, env, length)
+
+    for name, values in bindings.items():
+        env[name] = np.asarray(values)
+    run = _compile_vector(expr, shadowed)
+    result = evaluate_compiled(lambda env: _run_vectorized(run, env), env)
+    return np.broadcast_to(result, (length,)).copy()
+
+
+def _evaluate_rows(expr, shadowed, bindings, env, length):
+    run = compile_expression(expr, shadowed).run
+    columns = [
+        (name, values)
+        for name, values in bindings.items()
+        if not isinstance(values, (int, float))
+    ]
+    results = []
+    for i in range(length):
+        for name, values in columns:
+            env[name] = values[i]
+        results.append(evaluate_compiled(run, env))
+    return results
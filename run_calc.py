@@ -2,13 +2,16 @@
 
 import sys
 import os
-from lemma_calc.core_utils import handle_command_line_args
 
 # Adds the current directory to sys.path so lemma_calc is found
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
-from lemma_calc.main import main
+from lemma_calc.core_utils import handle_command_line_args
 
 if __name__ == "__main__":
-    handle_command_line_args()  # Handles --version, --man, --tldr and exits if needed
+    # Handles --version, --man, --tldr and --batch/piped input, exiting if needed
+    handle_command_line_args()
+
+    from lemma_calc.main import main
+
     main()  # Launch main REPL
@@ -0,0 +1,119 @@
+import unittest
+from lemma_calc import arrays, core
+from lemma_calc.calculator import Calculator
+from lemma_calc.core import evaluate_expression, format_result, process_assignment
+
+
+def show(expr, variables=None):
+    return format_result(evaluate_expression(expr, variables or {}))
+
+
+@unittest.skipIf(arrays.np is None, "NumPy is not installed")
+class ArrayValueTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        core.set_engine("closure")
+
+    def test_literals(self):
+        self.assertEqual(show("[1, 2, 3]"), "[1, 2, 3]")
+        self.assertEqual(show("[[1, 2], [3, 4.5]]"), "[[1, 2], [3, 4.5]]")
+        self.assertEqual(show("[x, 2x]", {"x": 3}), "[3, 6]")
+        self.assertEqual(evaluate_expression("[1, 2]", {}).dtype.kind, "i")
+        self.assertEqual(evaluate_expression("[10^30, 1]", {}).dtype.kind, "f")
+
+    def test_literals_are_built_once_and_read_only(self):
+        compiled = core.compile_expression("[1, 2, 3]")
+        first = core.run_compiled(compiled, {})
+        self.assertIs(core.run_compiled(compiled, {}), first)
+        self.assertFalse(first.flags.writeable)
+
+    def test_assignment_shares_the_array(self):
+        variables = {}
+        process_assignment("v = [1, 2, 3]", variables)
+        process_assignment("w = v", variables)
+        self.assertIs(variables["w"], variables["v"])
+
+    def test_broadcasting(self):
+        self.assertEqual(show("[1, 2] * 2 + 1"), "[3, 5]")
+        self.assertEqual(show("[[1, 2], [3, 4]] - [1, 1]"), "[[0, 1], [2, 3]]")
+        self.assertEqual(show("[1, 2]^-1"), "[1, 0.5]")
+        self.assertEqual(show("2^[3, 4]"), "[8, 16]")
+        with self.assertRaisesRegex(ValueError, "broadcast"):
+            evaluate_expression("[1, 2] + [1, 2, 3]", {})
+
+    def test_division_by_zero(self):
+        for expr in ("[1, 2] / 0", "[1, 2] % 0", "[1.5, 2] % [1, 0]", "[0.0] / 0"):
+            with self.subTest(expr=expr):
+                with self.assertRaisesRegex(ValueError, "division by zero"):
+                    evaluate_expression(expr, {})
+        self.assertEqual(show("[5, 7] % 3"), "[2, 1]")
+
+    def test_integers_do_not_wrap_around(self):
+        self.assertEqual(show("[10^10] * 10^10"), "[1e+20]")
+        self.assertEqual(show("[2^62] + [2^62]"), "[9.223372036854776e+18]")
+        self.assertEqual(show("[-2^62] - [2^62]"), "[-9.223372036854776e+18]")
+        big = "[2.767011611100075e+19, 3.6893488148001e+19]"
+        self.assertEqual(show("[3, 4] * 3037000500^2"), big)
+        self.assertEqual(evaluate_expression("[2^62, 2^62] @ [1, 1]", {}), 2.0**63)
+        self.assertEqual(evaluate_expression("sum([2^62, 2^62])", {}), 2**63)
+        self.assertEqual(evaluate_expression("sum([2^62, -2^62, 5])", {}), 5)
+        # Results that fit stay exact integers
+        self.assertEqual(evaluate_expression("[2^62] + [2^61]", {}).dtype.kind, "i")
+
+    def test_math_functions_apply_elementwise(self):
+        self.assertEqual(show("sqrt([4, 9])"), "[2, 3]")
+        self.assertEqual(show("floor([1.5, -1.5])"), "[1, -2]")
+        self.assertEqual(show("log([1, 8], 2)"), "[0, 3]")
+        self.assertEqual(show("abs([-1, 2])"), "[1, 2]")
+        with self.assertRaisesRegex(ValueError, "domain"):
+            evaluate_expression("sqrt([4, -1])", {})
+        with self.assertRaisesRegex(ValueError, "range"):
+            evaluate_expression("exp([1000])", {})
+
+    def test_matrix_product(self):
+        m = "[[1, 2], [3, 4]]"
+        self.assertEqual(show(f"{m} @ [1, 1]"), "[3, 7]")
+        self.assertEqual(show(f"{m} @ {m}"), "[[7, 10], [15, 22]]")
+        self.assertEqual(evaluate_expression("[1, 2] @ [3, 4]", {}), 11)
+        with self.assertRaisesRegex(ValueError, "don't match"):
+            evaluate_expression(f"{m} @ [1, 2, 3]", {})
+        with self.assertRaisesRegex(ValueError, "needs vectors"):
+            evaluate_expression("2 @ [1, 2]", {})
+
+    def test_bulk_functions(self):
+        values = {"v": evaluate_expression("[1, 2, 3, 4]", {})}
+        self.assertEqual(evaluate_expression("sum(v)", values), 10)
+        self.assertIs(type(evaluate_expression("sum(v)", values)), int)
+        self.assertEqual(evaluate_expression("mean(v)", values), 2.5)
+        self.assertEqual(evaluate_expression("dot(v, v)", values), 30)
+        self.assertEqual(evaluate_expression("det([[1, 2], [3, 4]])", {}), -2)
+        self.assertEqual(show("inv([[2, 0], [0, 4]])"), "[[0.5, 0], [0, 0.25]]")
+
+    def test_linear_algebra_errors(self):
+        with self.assertRaisesRegex(ValueError, "singular"):
+            evaluate_expression("inv([[1, 2], [2, 4]])", {})
+        with self.assertRaisesRegex(ValueError, "square matrix"):
+            evaluate_expression("det([1, 2])", {})
+        with self.assertRaisesRegex(ValueError, "same length"):
+            evaluate_expression("[[1, 2], [3]]", {})
+        with self.assertRaisesRegex(ValueError, "no values"):
+            evaluate_expression("mean([])", {})
+
+    def test_walker_engine(self):
+        core.set_engine("walker")
+        self.assertEqual(show("[x, 2] @ [[1, 0], [0, 1]]", {"x": 3}), "[3, 2]")
+
+    def test_user_functions_take_vectors(self):
+        calc = Calculator()
+        calc.execute("norm2(v) = dot(v, v)")
+        self.assertEqual(calc.evaluate("norm2([3, 4])"), 25)
+        self.assertEqual(calc.evaluate("norm2([3, 4])"), 25)
+
+    def test_large_vectors_are_elided(self):
+        values = {"v": arrays.np.arange(5000)}
+        self.assertEqual(show("v * 2", values), "[0, 2, 4, ..., 9994, 9996, 9998]")
+        self.assertEqual(evaluate_expression("sum(v)", values), 5000 * 4999 // 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import collections
+import contextlib
+import io
+import threading
+import time
+import unittest
+from lemma_calc import core
+from lemma_calc.background import BackgroundEvaluator
+from lemma_calc.core import evaluate_expression
+from lemma_calc.guards import check_cancelled
+from lemma_calc.sandbox import SandboxWorker
+from lemma_calc.table import table
+
+
+def spin(started):
+    started.set()
+    while True:
+        check_cancelled()
+
+
+class BackgroundEvaluatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.evaluator = BackgroundEvaluator()
+        self.out = io.StringIO()
+        redirect = contextlib.redirect_stdout(self.out)
+        redirect.__enter__()
+        self.addCleanup(redirect.__exit__, None, None, None)
+
+    def tearDown(self):
+        self.evaluator.close()
+
+    def test_jobs_run_in_order(self):
+        done = []
+        for i in range(20):
+            self.evaluator.submit(str(i), done.append, i)
+        self.assertTrue(self.evaluator.wait(5))
+        self.assertEqual(done, list(range(20)))
+        self.assertFalse(self.evaluator.busy())
+        self.assertEqual(self.evaluator.status(), "")
+
+    def test_cancel_stops_the_running_job(self):
+        started = threading.Event()
+        self.evaluator.submit("spin", spin, started)
+        done = []
+        self.evaluator.submit("queued", done.append, 1)
+        self.assertTrue(started.wait(5))
+        self.assertRegex(self.evaluator.status(), r"evaluating spin .*\(\+1 queued\)")
+        self.assertEqual(self.evaluator.cancel(), "spin")
+        self.assertTrue(self.evaluator.wait(5))
+        self.assertIn("Cancelled: spin", self.out.getvalue())
+        # Queued jobs are dropped, later ones run
+        self.assertEqual(done, [])
+        self.evaluator.submit("later", done.append, 2)
+        self.assertTrue(self.evaluator.wait(5))
+        self.assertEqual(done, [2])
+
+    def test_cancel_stops_an_evaluation(self):
+        rows = table("x^2", "x", 0, 10**9)
+        self.evaluator.submit("table", collections.deque, rows, 0)
+        time.sleep(0.2)
+        self.assertEqual(self.evaluator.cancel(), "table")
+        self.assertTrue(self.evaluator.wait(5))
+        self.assertIn("Cancelled: table", self.out.getvalue())
+
+    def test_cancel_when_idle(self):
+        self.assertIsNone(self.evaluator.cancel())
+
+    def test_cancel_kills_the_sandbox(self):
+        worker = SandboxWorker(timeout=60)
+        core.set_sandbox(worker)
+        self.addCleanup(worker.close)
+        self.addCleanup(core.set_sandbox, None)
+        results = []
+
+        def job(expr):
+            results.append(evaluate_expression(expr, {}))
+
+        slow = " + ".join(f"factorial(200000 + {i}) % 7" for i in range(10))
+        self.evaluator.submit("slow", job, slow)
+        time.sleep(0.3)
+        start = time.perf_counter()
+        self.assertEqual(self.evaluator.cancel(), "slow")
+        self.assertTrue(self.evaluator.wait(5))
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertIn("Cancelled: slow", self.out.getvalue())
+        # A fresh worker takes the next evaluation
+        self.evaluator.submit("next", job, "2 + 3")
+        self.assertTrue(self.evaluator.wait(10))
+        self.assertEqual(results, [5], self.out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
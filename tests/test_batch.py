@@ -0,0 +1,52 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import unittest
+from lemma_calc.batch import run_batch
+
+
+class BatchModeTestCase(unittest.TestCase):
+
+    def test_text_output_one_line_per_statement(self):
+        out = io.StringIO()
+        errors = run_batch(["2 + 2; x = 3\n", "x^2\n", "\n"], out)
+        self.assertEqual(errors, 0)
+        self.assertEqual(out.getvalue(), "4\nx = 3\n9\n")
+
+    def test_jsonl_output(self):
+        out = io.StringIO()
+        errors = run_batch(["1000 * 1000\n", "1/0\n"], out, fmt="jsonl")
+        self.assertEqual(errors, 1)
+        first, second = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(first, {"expr": "1000 * 1000", "result": "1,000,000", "value": 1000000})
+        self.assertIn("division by zero", second["error"])
+
+    def test_jsonl_vectors_are_lists(self):
+        out = io.StringIO()
+        run_batch(["m = [[1, 2], [3, 4]]\n", "m @ [1, 0.5]\n"], out, fmt="jsonl")
+        record = json.loads(out.getvalue().splitlines()[1])
+        self.assertEqual(record, {"expr": "m @ [1, 0.5]", "result": "[2, 5]", "value": [2.0, 5.0]})
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            run_batch([], io.StringIO(), fmt="xml")
+
+    def test_startup_leaves_optional_modules_unloaded(self):
+        # Batch and one-shot runs import these only for the flags and
+        # values that need them
+        code = (
+            "import sys, lemma_calc.core_utils; "
+            "print([m for m in ('numpy', 'sqlite3', 'multiprocessing', 'pydoc') "
+            "if m in sys.modules])"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=root, capture_output=True, text=True
+        ).stdout
+        self.assertEqual(output.strip(), "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
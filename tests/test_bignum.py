@@ -0,0 +1,67 @@
+import io
+import math
+import random
+import sys
+import unittest
+from lemma_calc.batch import run_batch
+from lemma_calc.bignum import format_big_int, int_to_str, leading_digits
+from lemma_calc.core import format_result
+
+
+class BigIntConversionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        limit = sys.get_int_max_str_digits()
+        sys.set_int_max_str_digits(0)
+        self.addCleanup(sys.set_int_max_str_digits, limit)
+
+    def test_int_to_str_matches_str(self):
+        rng = random.Random(14)
+        for bits in (10, 1000, 5000, 33_333, 100_000):
+            n = rng.getrandbits(bits)
+            self.assertEqual(int_to_str(n), str(n))
+            self.assertEqual(int_to_str(-n), str(-n))
+
+    def test_leading_digits_near_powers_of_ten(self):
+        for k in (120, 1000, 5001):
+            for n in (10**k - 1, 10**k, 10**k + 1, 7 * 10**k - 1):
+                expected = str(n)
+                self.assertEqual(leading_digits(n, 20), (expected[:20], len(expected)))
+
+
+class BigIntDisplayTestCase(unittest.TestCase):
+
+    def test_modes(self):
+        n = math.factorial(5000)
+        self.assertEqual(
+            format_big_int(n, "sci"), "4.2285779266055435222e+16325 (16,326 digits)"
+        )
+        self.assertEqual(
+            format_big_int(n, "trunc"),
+            "42285779266055435222…00000000000000000000 (16,326 digits)",
+        )
+        full = format_big_int(n, "full")
+        self.assertEqual(full.replace(",", "")[:20], "42285779266055435222")
+        self.assertEqual(len(full.replace(",", "")), 16326)
+
+    def test_small_integers_unchanged(self):
+        self.assertEqual(format_result(2**300), f"{2**300:,}")
+        self.assertEqual(format_result(-1234567), "-1,234,567")
+        self.assertEqual(format_result(3.0), "3")
+        self.assertEqual(format_result(1e300), "1e+300")
+
+    def test_format_result_mode(self):
+        n = -(10**150)
+        self.assertEqual(format_result(n), "-1.0e+150 (151 digits)")
+        self.assertEqual(format_result(n, "full"), f"{n:,}")
+
+    def test_batch_prints_huge_results(self):
+        out = io.StringIO()
+        run_batch(["factorial(2000)\n", "2^20000\n"], out=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "3.3162750924506332411e+5735 (5,736 digits)")
+        self.assertTrue(lines[1].endswith("(6,021 digits)"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from lemma_calc.cache import LRUCache
+from lemma_calc.core import (
+    evaluate_expression,
+    compile_cache_info,
+    clear_compile_cache,
+)
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_eviction_order(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertNotIn("b", cache)
+        self.assertIn("a", cache)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_counters(self):
+        cache = LRUCache(maxsize=4)
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("missing")
+        info = cache.info()
+        self.assertEqual((info["hits"], info["misses"]), (1, 1))
+
+
+class CompiledExpressionCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        clear_compile_cache()
+
+    def test_one_entry_serves_every_binding(self):
+        for x in range(10):
+            self.assertEqual(evaluate_expression("x^2 + 1", {"x": x}), x * x + 1)
+        info = compile_cache_info()
+        self.assertEqual(info["size"], 1)
+        self.assertEqual(info["misses"], 1)
+        self.assertEqual(info["hits"], 9)
+
+    def test_negative_variables_are_not_pasted_as_text(self):
+        self.assertEqual(evaluate_expression("x^2", {"x": -3}), 9)
+
+    def test_variable_implicit_multiplication(self):
+        self.assertEqual(evaluate_expression("x(2+1)", {"x": 4}), 12)
+
+    def test_variables_shadow_constants(self):
+        self.assertEqual(evaluate_expression("e + 1", {"e": 5}), 6)
+        self.assertAlmostEqual(evaluate_expression("e", {}), 2.718281828, places=6)
+
+
+if __name__ == "__main__":
+    unittest.main()
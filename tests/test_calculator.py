@@ -0,0 +1,181 @@
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from lemma_calc import core, userfuncs
+from lemma_calc.cache import LRUCache
+from lemma_calc.calculator import Calculator
+from lemma_calc.constants import allowed_names, user_functions
+from lemma_calc.history import HistoryLog
+from lemma_calc.result_cache import ResultCache
+
+
+class CalculatorTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        core.set_engine("closure")
+
+    def test_statements(self):
+        calc = Calculator()
+        self.assertEqual(calc.execute("x = 3"), {"expr": "x = 3", "result": "x = 3"})
+        self.assertEqual(calc.execute("x^2 + 1")["value"], 10)
+        self.assertEqual(calc.evaluate("ans * 2"), 20)
+        self.assertIn("error", calc.execute("1/0"))
+        self.assertEqual(calc.variables["ans"], 10)
+
+    def test_sessions_are_independent(self):
+        a, b = Calculator(), Calculator()
+        a.execute("x = 1")
+        a.execute("f(t) = t + x")
+        self.assertEqual(a.evaluate("f(1)"), 2)
+        self.assertNotIn("x", b.variables)
+        self.assertRegex(b.execute("f(1)")["error"], "unknown function 'f'")
+        b.execute("f(t) = 10t")
+        self.assertEqual((a.evaluate("f(1)"), b.evaluate("f(1)")), (2, 10))
+        # The REPL's functions are untouched
+        self.assertNotIn("f", allowed_names)
+        self.assertEqual(user_functions, {})
+        self.assertEqual(set(a.functions), {"f"})
+
+    def test_repl_functions_are_not_visible(self):
+        variables = {}
+        core.process_assignment("g(x) = x + 1", variables)
+        try:
+            calc = Calculator()
+            self.assertIn("error", calc.execute("g(1)"))
+            calc.execute("g(x) = x + 2")
+            self.assertEqual(calc.evaluate("g(1)"), 3)
+            self.assertEqual(core.evaluate_expression("g(1)", variables), 2)
+        finally:
+            userfuncs.restore([])
+
+    def test_special_forms_and_walker_use_the_session_functions(self):
+        calc = Calculator()
+        calc.execute("f(t) = t^2")
+        self.assertAlmostEqual(calc.evaluate("integrate(f(t), t, 0, 3)"), 9.0)
+        self.assertAlmostEqual(calc.evaluate("solve(f(t) = 4, t, 1)"), 2.0)
+        core.set_engine("walker")
+        self.assertEqual(calc.evaluate("f(3) + f(1)"), 10)
+
+    def test_integrals_use_the_session_functions(self):
+        variables = {}
+        core.process_assignment("f(t) = t", variables)
+        try:
+            a, b = Calculator(), Calculator()
+            a.execute("f(t) = t^2")
+            b.execute("f(t) = t^3")
+            self.assertAlmostEqual(a.evaluate("integrate(f(t), t, 0, 3)"), 9.0)
+            self.assertAlmostEqual(b.evaluate("integrate(f(t), t, 0, 2)"), 4.0)
+            self.assertAlmostEqual(
+                core.evaluate_expression("integrate(f(t), t, 0, 3)", variables), 4.5
+            )
+        finally:
+            userfuncs.restore([])
+
+    def test_result_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResultCache(os.path.join(tmp, "results.sqlite"))
+            core.set_result_cache(cache)
+            try:
+                with mock.patch.object(core, "RESULT_CACHE_MIN_SECONDS", 0):
+                    a, b = Calculator(), Calculator()
+                    a.execute("f(t) = t^2")
+                    b.execute("f(t) = t^3")
+                    self.assertEqual(a.evaluate("2^10 + 1"), 1025)
+                    self.assertEqual(a.evaluate("f(2)"), 4)
+                    self.assertEqual(b.evaluate("f(2)"), 8)
+                    # Calls of session functions are never stored
+                    self.assertEqual(cache.info()["entries"], 1)
+                    self.assertEqual(b.evaluate("2^10 + 1"), 1025)
+            finally:
+                core.set_result_cache(None)
+                cache.close()
+
+    def test_redefinition_drops_compiled_expressions(self):
+        calc = Calculator()
+        calc.execute("f(t) = t + 1")
+        calc.execute("g(t) = 2f(t)")
+        self.assertEqual(calc.evaluate("g(1)"), 4)
+        calc.execute("f(t) = t + 10")
+        self.assertEqual(calc.evaluate("g(1)"), 22)
+
+    def test_history_sink(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = HistoryLog(os.path.join(tmp, "h.jsonl"), legacy_path=None)
+            calc = Calculator(history=log)
+            calc.execute("y = 2")
+            calc.execute("y +")
+            calc.execute("y * 4")
+            entries = [entry[1:] for entry in log.tail(10)]
+            log.close()
+        self.assertEqual(entries, [["y = 2", "y = 2"], ["y * 4", "8"]])
+
+    def test_completion(self):
+        calc = Calculator()
+        calc.execute("velocity = 3")
+        calc.execute("vol(r) = r^3")
+        words = dict(calc.complete("v"))
+        self.assertEqual(words["velocity"], "variable")
+        self.assertEqual(words["vol"], "function")
+        self.assertEqual(Calculator().complete("velo"), [])
+
+    def test_thread_pool(self):
+        def work(i):
+            calc = Calculator()
+            calc.execute(f"n = {i}")
+            calc.execute("f(x) = if(x <= 1, n, x * f(x - 1))")
+            calc.execute("g(x) = f(x) + sqrt(n)")
+            return calc.execute("g(5)")["value"]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(work, range(1000)))
+        self.assertEqual(results, [i * 120 + i**0.5 for i in range(1000)])
+
+    def test_concurrent_statements_on_one_calculator(self):
+        calc = Calculator({"count": 0})
+        barrier = threading.Barrier(8)
+
+        def work():
+            barrier.wait()
+            for _ in range(250):
+                calc.execute("count = count + 1")
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calc.variables["count"], 2000)
+
+    def test_many_sessions(self):
+        calcs = [Calculator() for _ in range(5000)]
+        for i, calc in enumerate(calcs):
+            calc.execute(f"x = {i}")
+        total = sum(calc.evaluate("x + 1") for calc in calcs)
+        self.assertEqual(total, 5000 * 5001 // 2)
+
+
+class LRUCacheThreadTestCase(unittest.TestCase):
+
+    def test_shared_between_threads(self):
+        cache = LRUCache(64)
+
+        def work(offset):
+            for i in range(5000):
+                cache.put((offset, i % 100), i)
+                cache.get((offset, (i * 7) % 100))
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        info = cache.info()
+        self.assertEqual(info["size"], 64)
+        self.assertEqual(info["hits"] + info["misses"], 8 * 5000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+import gc
+import os
+import pickle
+import tempfile
+import tracemalloc
+import unittest
+from unittest import mock
+from lemma_calc import arrays, columns, core
+from lemma_calc.columns import load_column, parse_load_command, run_load_command
+from lemma_calc.core import evaluate_expression
+from lemma_calc.sandbox import SandboxWorker
+
+np = arrays.np
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class LoadColumnTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_csv_column_with_header(self):
+        path = self.write("prices.csv", "day,qty,price\n1,3,2.5\n2,4,3.5\n\n3,5,-1\n")
+        values = load_column(path, 3)
+        self.assertIsInstance(values, np.memmap)
+        self.assertEqual(values.tolist(), [2.5, 3.5, -1.0])
+        self.assertEqual(load_column(path, 2).tolist(), [3.0, 4.0, 5.0])
+
+    def test_whitespace_and_tab_separated(self):
+        path = self.write("data.txt", "1 10\n2   20\n")
+        self.assertEqual(load_column(path, 2).tolist(), [10.0, 20.0])
+        path = self.write("data.tsv", "1\t10\n2\t20\n")
+        self.assertEqual(load_column(path, 2).tolist(), [10.0, 20.0])
+
+    def test_bad_text(self):
+        path = self.write("bad.csv", "1,2\n3,x\n")
+        with self.assertRaisesRegex(ValueError, "line 2 .*'x' is not a number"):
+            load_column(path, 2)
+        with self.assertRaisesRegex(ValueError, "no column 3"):
+            load_column(path, 3)
+        with self.assertRaisesRegex(ValueError, "empty"):
+            load_column(self.write("empty.csv", ""))
+        with self.assertRaisesRegex(ValueError, "No such file"):
+            load_column(os.path.join(self.dir, "missing.csv"))
+
+    def test_binary_files(self):
+        path = os.path.join(self.dir, "m.npy")
+        np.save(path, np.arange(12).reshape(4, 3))
+        self.assertEqual(load_column(path, 2).tolist(), [1, 4, 7, 10])
+        with self.assertRaisesRegex(ValueError, "no column 4"):
+            load_column(path, 4)
+        path = os.path.join(self.dir, "v.f64")
+        np.arange(5, dtype="<f8").tofile(path)
+        values = load_column(path)
+        self.assertIsInstance(values, np.memmap)
+        self.assertEqual(values.tolist(), [0, 1, 2, 3, 4])
+
+    def test_load_command(self):
+        self.assertEqual(
+            parse_load_command("load prices.csv col 3 as p"), ("prices.csv", 3, "p")
+        )
+        self.assertEqual(
+            parse_load_command("LOAD 'my data.csv' as x"), ("my data.csv", 1, "x")
+        )
+        with self.assertRaisesRegex(ValueError, "Usage"):
+            parse_load_command("load prices.csv")
+        with self.assertRaisesRegex(ValueError, "function"):
+            parse_load_command("load prices.csv as sqrt")
+        variables = {}
+        path = self.write("p.csv", "4\n6\n")
+        self.assertEqual(run_load_command(f"load {path} as p", variables), "p")
+        result = evaluate_expression("mean(p) + 2p", variables)
+        self.assertEqual(result.tolist(), [13, 17])
+
+    def test_text_columns_are_deleted_with_the_column(self):
+        values = load_column(self.write("t.csv", "1\n2\n"))
+        path = values.filename
+        self.assertTrue(os.path.exists(path))
+        del values
+        gc.collect()
+        self.assertFalse(os.path.exists(path))
+
+    def test_sandbox_maps_columns_again(self):
+        matrix = np.arange(3000, dtype=np.float64).reshape(1000, 3)
+        np.save(os.path.join(self.dir, "m.npy"), matrix)
+        matrix[:, 0].tofile(os.path.join(self.dir, "v.f64"))
+        text = "".join(f"{a},{b}\n" for a, b in matrix[:, :2].tolist())
+        variables = {
+            "a": load_column(os.path.join(self.dir, "m.npy"), 2),
+            "b": load_column(os.path.join(self.dir, "v.f64")),
+            "c": load_column(self.write("m.csv", text), 2),
+        }
+        for name, values in variables.items():
+            with self.subTest(name=name):
+                reference = columns.column_reference(values)
+                self.assertLess(len(pickle.dumps(reference)), 500)
+                self.assertEqual(reference.open().tolist(), values.tolist())
+        # The mappings count towards the worker's address-space limit, as
+        # does what it inherits from the test process
+        worker = SandboxWorker(timeout=10, memory_mb=4096)
+        self.addCleanup(worker.close)
+        self.assertEqual(
+            worker.evaluate("sum(a * b + c)", variables),
+            (matrix[:, 1] * matrix[:, 0] + matrix[:, 1]).sum(),
+        )
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class StreamingAggregateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.p = rng.normal(100, 15, 50_000)
+        self.q = rng.integers(0, 50, 50_000).astype(np.float64)
+        self.variables = {}
+        for name in ("p", "q"):
+            path = os.path.join(tmp.name, f"{name}.f64")
+            getattr(self, name).tofile(path)
+            self.variables[name] = load_column(path)
+        # Stream in many blocks, and select percentiles without sorting
+        limits = {"STREAM_CHUNK_ROWS": 4096, "PERCENTILE_MEMORY_VALUES": 1000}
+        for name, value in limits.items():
+            patcher = mock.patch.object(columns, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        core.set_engine("closure")
+
+    def evaluate(self, expr):
+        return evaluate_expression(expr, self.variables)
+
+    def test_match_numpy(self):
+        p, q = self.p, self.q
+        self.assertAlmostEqual(self.evaluate("sum(p*q)"), (p * q).sum(), delta=1e-6)
+        self.assertAlmostEqual(self.evaluate("mean(p)"), p.mean(), places=9)
+        self.assertAlmostEqual(self.evaluate("stdev(p)"), p.std(ddof=1), places=9)
+        self.assertAlmostEqual(
+            self.evaluate("sum((p - mean(p))^2)"), ((p - p.mean()) ** 2).sum(), places=3
+        )
+        self.assertAlmostEqual(self.evaluate("sum(dot(p, q))"), p @ q, delta=1e-6)
+
+    def test_percentiles_are_exact(self):
+        for q in (0, 1, 37.3, 50, 99, 100):
+            with self.subTest(q=q):
+                self.assertEqual(
+                    self.evaluate(f"percentile(p, {q})"), np.percentile(self.p, q)
+                )
+        # Many equal values
+        self.assertEqual(self.evaluate("percentile(q, 50)"), np.percentile(self.q, 50))
+        self.assertEqual(self.evaluate("percentile(-q, 10)"), np.percentile(-self.q, 10))
+
+    def test_small_inputs(self):
+        self.assertEqual(self.evaluate("sum(3)"), 3)
+        self.assertEqual(self.evaluate("percentile([1, 2, 3, 4], 50)"), 2.5)
+        self.assertEqual(self.evaluate("stdev([2, 4, 4, 4, 5, 5, 7, 9])"), 2.138089935299395)
+        with self.assertRaisesRegex(ValueError, "at least 2"):
+            self.evaluate("stdev([1])")
+        with self.assertRaisesRegex(ValueError, "between 0 and 100"):
+            self.evaluate("percentile(p, 101)")
+        with self.assertRaisesRegex(ValueError, "takes 2 argument"):
+            self.evaluate("percentile(p)")
+
+    def test_walker_engine(self):
+        core.set_engine("walker")
+        self.assertAlmostEqual(self.evaluate("mean(p*q)"), (self.p * self.q).mean())
+
+    def test_bounded_memory(self):
+        tracemalloc.start()
+        try:
+            self.evaluate("sum(p*q + p/2)")
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # A few blocks of 4096 float64s, not the 400 kB of a whole column
+        self.assertLess(peak, 200_000)
+
+
+if __name__ == "__main__":
+    unittest.main()
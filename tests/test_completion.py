@@ -0,0 +1,128 @@
+import math
+import os
+import random
+import tempfile
+import time
+import unittest
+from lemma_calc.completion import CompletionIndex, PrefixTrie
+from lemma_calc.history import HistoryLog
+from lemma_calc.history_index import HistoryIndex
+
+
+class PrefixTrieTestCase(unittest.TestCase):
+
+    def test_ranked_case_insensitive_prefixes(self):
+        trie = PrefixTrie(top_k=3)
+        words = {"sin": 1, "sqrt": 5, "Speed": 3, "sum": 2, "x": 9}
+        for word, score in words.items():
+            trie.set_score(word, score)
+        self.assertEqual(trie.complete("s"), ["sqrt", "Speed", "sum"])
+        self.assertEqual(trie.complete("SP"), ["Speed"])
+        self.assertEqual(trie.complete("q"), [])
+        self.assertEqual(trie.complete(""), [])
+
+    def test_raising_a_score_promotes_the_word(self):
+        trie = PrefixTrie(top_k=2)
+        for i, word in enumerate(["ab", "ac", "ad", "ae"]):
+            trie.set_score(word, i)
+        self.assertEqual(trie.complete("a"), ["ae", "ad"])
+        trie.set_score("ab", 10)
+        self.assertEqual(trie.complete("a"), ["ab", "ae"])
+
+    def test_lowering_and_removing_refill_from_the_subtree(self):
+        trie = PrefixTrie(top_k=2)
+        for i, word in enumerate(["ab", "ac", "ad", "ae"]):
+            trie.set_score(word, i)
+        trie.remove("ae")
+        self.assertEqual(trie.complete("a"), ["ad", "ac"])
+        trie.set_score("ad", -1)
+        self.assertEqual(trie.complete("a"), ["ac", "ab"])
+        self.assertNotIn("ae", trie)
+        trie.remove("missing")
+
+    def test_matches_a_full_scan(self):
+        rng = random.Random(7)
+        trie = PrefixTrie(top_k=5)
+        scores = {}
+        for _ in range(3000):
+            word = "".join(rng.choice("abc") for _ in range(rng.randint(1, 6)))
+            scores[word] = scores.get(word, 0) + rng.random()
+            trie.set_score(word, scores[word])
+        for prefix in ["a", "ab", "cab", "bbb"]:
+            expected = sorted(
+                (w for w in scores if w.startswith(prefix)), key=lambda w: -scores[w]
+            )[:5]
+            self.assertEqual(trie.complete(prefix), expected)
+
+    def test_lookup_does_not_depend_on_size(self):
+        trie = PrefixTrie()
+        for i in range(50_000):
+            trie.set_score(f"var_{i}", i)
+        start = time.perf_counter()
+        for _ in range(1000):
+            result = trie.complete("var_4")
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(result[0], "var_49999")
+
+
+class CompletionIndexTestCase(unittest.TestCase):
+
+    def test_builtins_are_offered(self):
+        index = CompletionIndex()
+        self.assertIn(("integrate", "function"), index.complete("int"))
+        self.assertIn(("pi", "constant"), index.complete("p"))
+        self.assertIn(("spreadsheet", "command"), index.complete("spr"))
+
+    def test_recent_and_frequent_names_rank_first(self):
+        index = CompletionIndex()
+        index.note_variable("speed")
+        index.note_expression("speed * 2")
+        self.assertEqual(index.complete("s")[0], ("speed", "variable"))
+        for _ in range(3):
+            index.note_expression("sqrt(2)")
+        self.assertEqual(index.complete("s")[0], ("sqrt", "function"))
+        index.note_expression("stride + 1")
+        self.assertEqual(index.complete("st")[0], ("stride", "history"))
+
+    def test_scores_are_rescaled_without_changing_the_ranking(self):
+        index = CompletionIndex()
+        index.note_expression("alpha")
+        index.clock += 1_000_000
+        index.note_expression("alps")
+        self.assertEqual([w for w, _ in index.complete("al")][:2], ["alps", "alpha"])
+        self.assertTrue(all(map(math.isfinite, index.trie.scores.values())))
+
+    def test_seeded_from_history(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = HistoryLog(os.path.join(tmp, "history.jsonl"), legacy_path=None)
+            log.append("radius = 2", "radius = 2")
+            for _ in range(3):
+                log.append("rate * 2", "4")
+            log.close()
+            index = CompletionIndex()
+            index.load_history(HistoryIndex(log))
+            self.assertEqual(
+                index.complete("ra")[:2], [("rate", "history"), ("radius", "history")]
+            )
+            self.assertEqual(index.clock, 4)
+
+    def test_history_names_keep_their_case(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = HistoryLog(os.path.join(tmp, "history.jsonl"), legacy_path=None)
+            log.append("maxSpeed = 2", "maxSpeed = 2")
+            log.append("netGain(x) = 2x", "netGain(x) = 2 * x")
+            log.close()
+            index = CompletionIndex()
+            index.load_history(HistoryIndex(log))
+            words = [word for word, _ in index.complete("m")]
+            self.assertIn("maxSpeed", words)
+            self.assertNotIn("maxspeed", words)
+            self.assertEqual(index.complete("netg"), [("netGain", "history")])
+
+    def test_commands(self):
+        index = CompletionIndex()
+        self.assertIn(("cache", "command"), index.complete("cac"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import ast
+import unittest
+from lemma_calc import core
+from lemma_calc.compiler import compile_tree
+from lemma_calc.core import preprocess_expression, safe_eval
+
+# Expressions run through both engines; includes ones that must fail
+EXPRESSIONS = [
+    "2 + 3 * 4",
+    "(2 + 3) * 4 - 7 / 2",
+    "2 ** 10 % 7",
+    "-x + +y",
+    "x ^ 2 + y ^ 2",
+    "sqrt(16) + log10(1000) + floor(2.7) + ceil(2.1)",
+    "round(x / 3, 2)",
+    "abs(-y) + exp(0)",
+    "sin(pi / 2) + cos(0) + tan(0)",
+    "5! + (2+1)!",
+    "x(2 + 1)",
+    "factorial(x)",
+    "factorial(1.5)",
+    "factorial(-1)",
+    "factorial(2, 3)",
+    "1 / 0",
+    "x % 0",
+    "sqrt(-1)",
+    "unknown + 1",
+    "round(2.5, ndigits=1)",
+    "2 << 3",
+    "~x",
+    "'text'",
+    "None",
+    "{1, 2}",
+    "[1, 2]",
+    "[[x, 2], [3, y]] @ [1, -1] / 2",
+    "[[1, 2], [3]]",
+    "x.real",
+    "(lambda: 1)()",
+    "z(1, 2)",
+    "log(0)",
+    "exp(1000)",
+    "10 ** -2",
+    "+".join(["1"] * 2000),
+]
+
+ENV = {"x": 3, "y": 4.5}
+
+
+def outcome(func):
+    try:
+        value = func()
+        # Vectors compare element-wise; compare their contents instead
+        return ("ok", value.tolist() if hasattr(value, "tolist") else value)
+    except Exception as e:
+        return (type(e), str(e))
+
+
+class EngineDifferentialTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        core.set_engine("closure")
+
+    def test_closures_match_walker(self):
+        for expr in EXPRESSIONS:
+            with self.subTest(expr=expr):
+                tree = ast.parse(preprocess_expression(expr), mode="eval")
+                self.assertEqual(
+                    outcome(lambda: compile_tree(tree)(dict(ENV))),
+                    outcome(lambda: safe_eval(tree, dict(ENV))),
+                )
+
+    def test_evaluate_expression_matches_for_both_engines(self):
+        for expr in EXPRESSIONS:
+            with self.subTest(expr=expr):
+                core.set_engine("walker")
+                expected = outcome(lambda: core.evaluate_expression(expr, dict(ENV)))
+                core.set_engine("closure")
+                actual = outcome(lambda: core.evaluate_expression(expr, dict(ENV)))
+                self.assertEqual(actual, expected)
+
+    def test_deep_expressions_fail_cleanly(self):
+        expr = "+".join(["1"] * 2000)
+        for engine in core.EVAL_ENGINES:
+            with self.subTest(engine=engine):
+                core.set_engine(engine)
+                with self.assertRaisesRegex(ValueError, "Invalid expression"):
+                    core.evaluate_expression(expr, {})
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            core.set_engine("jit")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import threading
+import unittest
+from lemma_calc.core import evaluate_expression
+from lemma_calc.guards import (
+    MAX_RESULT_BITS,
+    estimate_factorial_bits,
+    guarded_factorial,
+    guarded_mul,
+    guarded_pow,
+)
+from lemma_calc.sandbox import SandboxWorker
+
+
+class GuardTestCase(unittest.TestCase):
+
+    def test_small_results_pass_through(self):
+        self.assertEqual(guarded_pow(2, 10), 1024)
+        self.assertEqual(guarded_mul(6, 7), 42)
+        self.assertEqual(guarded_factorial(5), 120)
+        self.assertEqual(guarded_pow(2.0, 0.5), 2.0**0.5)
+
+    def test_huge_power_is_refused(self):
+        with self.assertRaisesRegex(ValueError, "Resource error: this power"):
+            evaluate_expression("9^9^9", {})
+
+    def test_huge_factorial_is_refused(self):
+        with self.assertRaisesRegex(ValueError, "Resource error: this factorial"):
+            evaluate_expression("1000000!", {})
+        self.assertEqual(estimate_factorial_bits(10**13), float("inf"))
+
+    def test_huge_product_is_refused(self):
+        big = 1 << (MAX_RESULT_BITS // 2 + 1)
+        with self.assertRaisesRegex(ValueError, "Resource error: product"):
+            evaluate_expression("a * a", {"a": big})
+
+    def test_float_power_still_overflows_normally(self):
+        with self.assertRaises(ValueError):
+            evaluate_expression("10.0^400", {})
+
+
+class SandboxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.worker = SandboxWorker(timeout=1.0)
+        self.addCleanup(self.worker.close)
+
+    def test_evaluates_with_variables(self):
+        self.assertEqual(self.worker.evaluate("x^2 + 1", {"x": 3, "y": 1}), 10)
+
+    def test_errors_are_reported(self):
+        with self.assertRaisesRegex(ValueError, "division by zero"):
+            self.worker.evaluate("1/0", {})
+
+    def test_timeout_kills_and_restarts_worker(self):
+        self.worker.timeout = 0.001
+        with self.assertRaisesRegex(ValueError, "Resource error: evaluation took"):
+            self.worker.evaluate("factorial(240000) % 7", {})
+        self.worker.timeout = 1.0
+        self.assertEqual(self.worker.evaluate("1 + 1", {}), 2)
+
+    def test_not_forked_while_other_threads_run(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(stop.set)
+        self.assertNotEqual(self.worker._context().get_start_method(), "fork")
+        self.worker.timeout = 30.0  # a fresh interpreter imports the package
+        self.assertEqual(self.worker.evaluate("x^2 + 1", {"x": 3}), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
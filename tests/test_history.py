@@ -0,0 +1,141 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from lemma_calc.history import HistoryLog, load_history, migrate_legacy_history
+from lemma_calc.history_index import HistoryIndex
+from lemma_calc.main import show_history
+
+
+class HistoryLogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp.name, "history.jsonl")
+        self.legacy_path = os.path.join(self.tmp.name, "history.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_log(self, **kwargs):
+        return HistoryLog(self.log_path, legacy_path=self.legacy_path, **kwargs)
+
+    def test_append_and_tail(self):
+        log = self.make_log(fsync_every=10)
+        for i in range(100):
+            log.append(f"{i} + 1", str(i + 1))
+        log.close()
+        self.assertEqual([e[1] for e in log.tail(2)], ["98 + 1", "99 + 1"])
+        self.assertEqual(len(load_history(path=self.log_path)), 100)
+        self.assertEqual(len(load_history(limit=5, path=self.log_path)), 5)
+
+    def test_torn_last_line_is_skipped_and_terminated(self):
+        log = self.make_log()
+        log.append("1 + 1", "2")
+        log.close()
+        with open(self.log_path, "a") as f:
+            f.write('["2025-01-01 00:00:00", "2 +')
+        log = self.make_log()
+        self.assertEqual(len(list(log)), 1)
+        log.append("3 + 3", "6")
+        log.close()
+        self.assertEqual([e[1] for e in log], ["1 + 1", "3 + 3"])
+
+    def test_compaction_keeps_newest_entries(self):
+        log = self.make_log(fsync_every=0)
+        for i in range(10):
+            log.append(str(i), str(i))
+        self.assertTrue(log.compact(max_entries=3))
+        log.append("10", "10")
+        log.close()
+        self.assertEqual([e[1] for e in log], ["7", "8", "9", "10"])
+        self.assertFalse(log.compact(max_entries=10))
+
+    def test_legacy_migration(self):
+        with open(self.legacy_path, "w") as f:
+            json.dump([["x = 1", "1"], ["2024-01-01 10:00:00", "2 + 2", "4"]], f)
+        self.assertEqual(migrate_legacy_history(self.legacy_path, self.log_path), 2)
+        self.assertFalse(os.path.exists(self.legacy_path))
+        entries = list(self.make_log())
+        self.assertEqual(entries[1], ["2024-01-01 10:00:00", "2 + 2", "4"])
+        self.assertEqual(entries[0][1:], ["x = 1", "1"])
+
+    def test_loading_another_log_leaves_the_legacy_file(self):
+        with open(self.legacy_path, "w") as f:
+            json.dump([["x = 1", "1"]], f)
+        cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        try:
+            other = os.path.join(self.tmp.name, "other.jsonl")
+            self.assertEqual(load_history(path=other), [])
+        finally:
+            os.chdir(cwd)
+        self.assertTrue(os.path.exists(self.legacy_path))
+        self.assertFalse(os.path.exists(self.log_path))
+
+
+class HistoryIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = HistoryLog(
+            os.path.join(self.tmp.name, "history.jsonl"), fsync_every=0, legacy_path=None
+        )
+        for i in range(50):
+            self.log.append(f"x{i % 5} * {i}", f"{i * 1000:,}")
+
+    def tearDown(self):
+        self.log.close()
+        self.tmp.cleanup()
+
+    def test_search_is_newest_first_and_matches_all_terms(self):
+        index = HistoryIndex(self.log)
+        self.assertEqual(index.search("x3")[:2], [49, 44])
+        self.assertEqual(index.search("x3 43"), [44])
+        self.assertEqual(index.search("12000"), [13])
+        self.assertEqual(index.search("nothing"), [])
+
+    def test_paging(self):
+        index = HistoryIndex(self.log)
+        self.assertEqual(len(index), 50)
+        self.assertEqual([n for n, _ in index.page(3, page_size=20)], list(range(41, 51)))
+        self.assertEqual(index.last(1)[0][1][1:], ["x4 * 49", "49,000"])
+
+    def test_history_command_rejects_counts_below_one(self):
+        index = HistoryIndex(self.log)
+        for count in ("0", "-3", "x"):
+            out = io.StringIO()
+            with self.subTest(count=count), contextlib.redirect_stdout(out):
+                show_history(["last", count], index)
+                self.assertEqual(
+                    out.getvalue(), "Usage: history [page N | last N | search TERM]\n"
+                )
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            show_history(["last", "2"], index)
+        self.assertIn("x4 * 49", out.getvalue())
+
+    def test_persisted_index_is_extended_incrementally(self):
+        index = HistoryIndex(self.log)
+        index.update()
+        index.save()
+        self.log.append("sqrt(x9)", "3")
+        reloaded = HistoryIndex(self.log)
+        self.assertEqual(reloaded.search("sqrt"), [51])
+        reloaded.save()
+        with open(index.path) as f:
+            self.assertEqual(len(f.readlines()), 3)  # header + two segments
+        self.assertEqual(HistoryIndex(self.log).search("x9"), [51])
+
+    def test_rebuilt_after_compaction(self):
+        index = HistoryIndex(self.log)
+        index.update()
+        self.log.compact(max_entries=10)
+        self.assertEqual(len(index), 10)
+        self.assertEqual(index.search("x4")[0], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
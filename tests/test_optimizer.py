@@ -0,0 +1,114 @@
+import ast
+import math
+import unittest
+from lemma_calc.constants import allowed_names
+from lemma_calc.core import evaluate_expression, explain_expression, parse_expression
+from lemma_calc.core import safe_eval
+from lemma_calc.optimizer import optimize
+
+
+def optimized(expr):
+    return optimize(parse_expression(expr))
+
+
+class ConstantFoldingTestCase(unittest.TestCase):
+
+    def test_constant_subtrees_are_folded(self):
+        result = optimized("2pi r + sqrt(16) * x")
+        self.assertEqual(ast.unparse(result.tree), f"{2 * math.pi} * r + 4.0 * x")
+
+    def test_negative_results_keep_brackets(self):
+        self.assertEqual(ast.unparse(optimized("(0-3)^x").tree), "(-3) ** x")
+
+    def test_failing_subtrees_are_left_for_evaluation(self):
+        self.assertEqual(ast.unparse(optimized("1/0 + x").tree), "1 / 0 + x")
+        with self.assertRaisesRegex(ValueError, "division by zero"):
+            evaluate_expression("1/0 + x", {"x": 1})
+
+    def test_fully_constant_expression(self):
+        result = optimized("factorial(5) - 2^3")
+        self.assertEqual(ast.unparse(result.tree), "112")
+        self.assertEqual(result.bindings, [])
+
+
+class CommonSubexpressionTestCase(unittest.TestCase):
+
+    def test_repeated_call_is_shared(self):
+        result = optimized("sin(x)*sin(x) + cos(x)*sin(x)")
+        self.assertEqual(ast.unparse(result.tree), "$1 * $1 + cos(x) * $1")
+        self.assertEqual(
+            [(name, ast.unparse(node)) for name, node in result.bindings],
+            [("$1", "sin(x)")],
+        )
+
+    def test_outermost_repeat_is_shared(self):
+        result = optimized("(x*y + 1) * (x*y + 1)")
+        self.assertEqual(len(result.bindings), 1)
+        self.assertEqual(ast.unparse(result.bindings[0][1]), "x * y + 1")
+
+    def test_shared_subexpression_runs_once(self):
+        calls = []
+
+        def counted_sin(value):
+            calls.append(value)
+            return math.sin(value)
+
+        functions = dict(allowed_names, sin=counted_sin)
+        tree = parse_expression("sin(x)^2 + sin(x) + sin(x)*3")
+        run = optimize(tree, functions).compile(functions)
+        run({"x": 0.5})
+        self.assertEqual(calls, [0.5])
+        run({"x": 0.25})
+        self.assertEqual(calls, [0.5, 0.25])
+
+    def test_recursive_calls_share_nothing(self):
+        def g(value):
+            # Re-enters the same compiled expression, like a recursive
+            # user function
+            return 1 if value == 0 else run({"x": value - 1}) + value
+
+        functions = dict(allowed_names, g=g)
+        tree = parse_expression("g(x) + g(x)")
+        run = optimize(tree, functions).compile(functions)
+        self.assertEqual(run({"x": 2}), 16)
+
+    def test_variables_are_not_modified(self):
+        variables = {"x": 2}
+        evaluate_expression("sin(x) + sin(x)", variables)
+        self.assertEqual(variables, {"x": 2})
+
+    def test_matches_tree_walker(self):
+        variables = {"x": 1.5, "y": -2, "n": 4}
+        for expr in [
+            "sin(x)*sin(x) + cos(x)*sin(x)",
+            "(x*y + 1)^2 + (x*y + 1) / (x*y)",
+            "factorial(n) + factorial(n)! - 2pi",
+            "abs(y) * abs(y) - round(x, 1) + round(x, 1)",
+            "x(2+1) + x(2+1)",
+        ]:
+            with self.subTest(expr=expr):
+                expected = safe_eval(parse_expression(expr), variables)
+                self.assertEqual(evaluate_expression(expr, variables), expected)
+
+
+class ExplainTestCase(unittest.TestCase):
+
+    def test_explain_shows_both_forms(self):
+        text = explain_expression("sin(x) + sin(x) + 2*3", {})
+        self.assertEqual(
+            text,
+            "Parsed:    sin(x) + sin(x) + 2 * 3\n"
+            "Optimized: $1 + $1 + 6\n"
+            "  where $1 = sin(x)",
+        )
+
+    def test_explain_abbreviates_huge_folded_integers(self):
+        text = explain_expression("2^100000 + x", {})
+        self.assertIn("Parsed:    2 ** 100000 + x", text)
+        self.assertIn("(30,103 digits)> + x", text)
+        text = explain_expression("factorial(3000)*x", {})
+        self.assertIn("(9,131 digits)> * x", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
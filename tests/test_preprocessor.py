@@ -0,0 +1,50 @@
+import unittest
+from lemma_calc.preprocessor import preprocess_expression, tokenize, NUMBER, NAME
+
+
+class PreprocessorTestCase(unittest.TestCase):
+
+    def test_factorials(self):
+        self.assertEqual(preprocess_expression("5!"), "factorial(5)")
+        self.assertEqual(preprocess_expression("(2+3)!"), "factorial((2+3))")
+        self.assertEqual(preprocess_expression("sqrt(4)!"), "factorial(sqrt(4))")
+        self.assertEqual(preprocess_expression("3!!"), "factorial(factorial(3))")
+        self.assertEqual(preprocess_expression("2^3!"), "2**factorial(3)")
+
+    def test_implicit_multiplication(self):
+        self.assertEqual(preprocess_expression("3(2+1)"), "3*(2+1)")
+        self.assertEqual(preprocess_expression("(2+3)4"), "(2+3)*4")
+        self.assertEqual(preprocess_expression("5!(22)"), "factorial(5)*(22)")
+        self.assertEqual(preprocess_expression("2x^2"), "2*x**2")
+        self.assertEqual(preprocess_expression("3sin(2)"), "3*sin(2)")
+
+    def test_vector_literals(self):
+        self.assertEqual(preprocess_expression("[1, 2]^2"), "[1,2]**2")
+        self.assertEqual(preprocess_expression("2[1, 2]"), "2*[1,2]")
+        self.assertEqual(preprocess_expression("x[1, 2]"), "x*[1,2]")
+        self.assertEqual(preprocess_expression("[1, 2](3)"), "[1,2]*(3)")
+        self.assertEqual(preprocess_expression("m @ [1, 2]"), "m@[1,2]")
+
+    def test_function_names_with_digits_are_calls(self):
+        self.assertEqual(preprocess_expression("log10(1000)"), "log10(1000)")
+
+    def test_constants(self):
+        self.assertEqual(preprocess_expression("2pi"), "2*(3.141592653589793)")
+        self.assertEqual(preprocess_expression("2π"), "2*(3.141592653589793)")
+        self.assertEqual(preprocess_expression("pi + e", shadowed=("e",)), "(3.141592653589793)+e")
+
+    def test_scientific_notation(self):
+        self.assertEqual(tokenize("1e5"), [(NUMBER, "1e5")])
+        self.assertEqual(tokenize("2e"), [(NUMBER, "2"), (NAME, "e")])
+
+    def test_trailing_equals(self):
+        self.assertEqual(preprocess_expression("2 + 2 ="), "2+2")
+
+    def test_long_input(self):
+        expr = "(1+2)! + 3! + " * 10_000 + "1"
+        result = preprocess_expression(expr)
+        self.assertEqual(result.count("factorial("), 20_000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import math
+import unittest
+from lemma_calc import quadrature
+from lemma_calc.compiler import free_names
+from lemma_calc.core import evaluate_expression, explain_expression, parse_expression
+from lemma_calc.quadrature import quad
+from lemma_calc.reactive import DependencyGraph
+
+
+def scalar(func):
+    return lambda points: [func(x) for x in points]
+
+
+class QuadTestCase(unittest.TestCase):
+
+    def test_smooth_integrands_converge_quickly(self):
+        result = quad(scalar(math.sin), 0, math.pi)
+        self.assertTrue(result.converged)
+        self.assertAlmostEqual(result.value, 2.0, places=13)
+        self.assertEqual(result.evaluations, 15)
+        self.assertLess(result.error, 1e-12)
+
+    def test_adapts_to_kinks_and_endpoint_singularities(self):
+        result = quad(scalar(lambda x: abs(x - 1 / 3)), 0, 1)
+        self.assertAlmostEqual(result.value, 5 / 18, places=9)
+        self.assertGreater(result.evaluations, 15)
+        result = quad(scalar(lambda x: 1 / math.sqrt(x)), 0, 1)
+        self.assertAlmostEqual(result.value, 2.0, places=8)
+        self.assertLessEqual(abs(result.value - 2.0), 10 * result.error)
+
+    def test_points_are_sampled_in_batches(self):
+        batches = []
+
+        def sample(points):
+            batches.append(len(points))
+            return [math.sqrt(x) for x in points]
+
+        result = quad(sample, 0, 1)
+        self.assertEqual(sum(batches), result.evaluations)
+        self.assertLess(len(batches), result.evaluations // 15)
+
+    def test_reversed_and_empty_ranges(self):
+        self.assertAlmostEqual(quad(scalar(lambda x: x), 1, 0).value, -0.5)
+        self.assertEqual(quad(scalar(lambda x: x), 2, 2).value, 0.0)
+
+    def test_budget(self):
+        result = quad(scalar(lambda x: math.sin(1 / x)), 1e-6, 1, max_evals=300)
+        self.assertFalse(result.converged)
+        self.assertLessEqual(result.evaluations, 300)
+        with self.assertRaises(ValueError):
+            quad(scalar(lambda x: x), 0, math.inf)
+
+
+class IntegrateFunctionTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        quadrature.take_reports()
+
+    def test_integrate(self):
+        self.assertAlmostEqual(evaluate_expression("integrate(x^2, x, 0, 3)", {}), 9)
+        self.assertAlmostEqual(
+            evaluate_expression("integrate(exp(-t^2), t, -10, 10)^2", {}), math.pi
+        )
+
+    def test_variable_is_bound_inside_the_integrand_only(self):
+        variables = {"x": 100, "k": 2}
+        self.assertAlmostEqual(
+            evaluate_expression("x + integrate(k*x, x, 0, 1)", variables), 101
+        )
+        tree = parse_expression("integrate(k*x^2, x, 0, b) + x")
+        self.assertEqual(free_names(tree), {"k", "b", "x"})
+        tree = parse_expression("integrate(k*x^2, x, 0, b)")
+        self.assertEqual(free_names(tree), {"k", "b"})
+
+    def test_nested_integrals(self):
+        self.assertAlmostEqual(
+            evaluate_expression("integrate(integrate(x*y, x, 0, y), y, 0, 1)", {}),
+            0.125,
+        )
+
+    def test_error_estimate_and_report(self):
+        quadrature.take_reports()
+        error = evaluate_expression("integrate_error(sqrt(x), x, 0, 1, 1e-6)", {})
+        self.assertLess(error, 1e-6)
+        (report,) = quadrature.take_reports()
+        self.assertEqual(report.error, error)
+        self.assertTrue(report.converged)
+
+    def test_errors(self):
+        for expr in (
+            "integrate(x, x, 0)",
+            "integrate(x, 2, 0, 1)",
+            "integrate(log(x), x, -1, 1)",
+            "integrate(1/x, x, -1, 1)",
+            "integrate(x, x, 0, 1, 0)",
+            "integrate(sin(1/x), x, 1e-9, 1, 1e-15)",
+        ):
+            with self.subTest(expr=expr), self.assertRaises(ValueError):
+                evaluate_expression(expr, {})
+
+    def test_walker_engine_agrees(self):
+        from lemma_calc import core
+
+        core.set_engine("walker")
+        try:
+            self.assertAlmostEqual(
+                evaluate_expression("integrate(x^3, x, 0, 2) + x", {"x": 1}), 5
+            )
+        finally:
+            core.set_engine("closure")
+
+    def test_not_shared_across_the_bound_variable(self):
+        text = explain_expression("x*y + integrate(x*y, x, 0, 1)", {"x": 1, "y": 2})
+        self.assertNotIn("$", text)
+
+    def test_spreadsheet_tracks_the_bounds(self):
+        graph = DependencyGraph()
+        variables = {}
+        graph.define("b", "1", variables)
+        graph.define("area", "integrate(x, x, 0, b)", variables)
+        self.assertAlmostEqual(variables["area"], 0.5)
+        graph.define("b", "2", variables)
+        self.assertAlmostEqual(variables["area"], 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import threading
+import unittest
+from lemma_calc.core import process_assignment
+from lemma_calc.guards import cancellable
+from lemma_calc.reactive import DependencyGraph
+
+
+class DependencyGraphTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = DependencyGraph()
+        self.variables = {}
+
+    def assign(self, expr):
+        return process_assignment(expr, self.variables, self.graph)
+
+    def test_downstream_variables_are_recomputed(self):
+        self.assign("x = 2")
+        self.assign("y = x^2")
+        self.assign("z = y + x")
+        self.assertEqual(self.assign("x = 3"), "x = 3 (updated: y, z)")
+        self.assertEqual(self.variables, {"x": 3, "y": 9, "z": 12})
+
+    def test_only_affected_variables_are_recomputed(self):
+        self.assign("a = 1")
+        self.assign("b = 2")
+        self.assign("c = a + 1")
+        self.assign("d = b + 1")
+        _, updated, _ = self.graph.define("a", "10", self.variables)
+        self.assertEqual(updated, ["c"])
+
+    def test_diamond_is_topologically_ordered(self):
+        self.assign("a = 1")
+        self.assign("b = a + 1")
+        self.assign("c = a * 2")
+        self.assign("d = b + c")
+        _, updated, _ = self.graph.define("a", "5", self.variables)
+        self.assertEqual(updated[-1], "d")
+        self.assertEqual(self.variables["d"], 16)
+
+    def test_cycles_are_rejected(self):
+        self.assign("x = 1")
+        self.assign("y = x + 1")
+        with self.assertRaises(ValueError):
+            self.assign("x = y + 1")
+        with self.assertRaises(ValueError):
+            self.assign("z = z + 1")
+        self.assertEqual(self.variables, {"x": 1, "y": 2})
+
+    def test_failed_recomputation_is_reported(self):
+        self.assign("x = 2")
+        self.assign("y = 1 / (x - 3)")
+        result = self.assign("x = 3")
+        self.assertIn("y: Math error", result)
+        self.assertNotIn("y", self.variables)
+
+    def test_cancelled_recomputation_changes_nothing(self):
+        self.assign("x = 1")
+        self.assign("y = x + 1")
+        self.assign("z = integrate(t, t, 0, y)")
+        cancelled = threading.Event()
+        cancelled.set()
+        with cancellable(cancelled), self.assertRaises(KeyboardInterrupt):
+            self.assign("x = 5")
+        self.assertEqual(self.variables, {"x": 1, "y": 2, "z": 2.0})
+        self.assertEqual(self.graph.sources()["x"], "1")
+        self.assertEqual(self.assign("x = 2"), "x = 2 (updated: y, z)")
+        self.assertEqual(self.variables["z"], 4.5)
+
+    def test_long_chain(self):
+        self.assign("a0 = 1")
+        for i in range(1, 2000):
+            self.assign(f"a{i} = a{i - 1} + 1")
+        self.assign("a0 = 10")
+        self.assertEqual(self.variables["a1999"], 2009)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+from lemma_calc import core, userfuncs
+from lemma_calc.batch import run_batch
+from lemma_calc.core import evaluate_expression, parse_expression
+from lemma_calc.result_cache import ResultCache, result_key
+
+
+class ResultKeyTestCase(unittest.TestCase):
+
+    def test_spellings_are_normalized(self):
+        keys = {
+            result_key(parse_expression(expr))
+            for expr in ("2^10 * 3(4)", "2 ** 10*3*(4)", "  2**10 * 3 * (4) =")
+        }
+        self.assertEqual(len(keys), 1)
+        self.assertNotEqual(
+            result_key(parse_expression("2^10")), result_key(parse_expression("10^2"))
+        )
+
+
+class ResultCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "results.sqlite")
+
+    def tearDown(self):
+        core.set_result_cache(None)
+        self.tmp.cleanup()
+
+    def test_values_round_trip_across_instances(self):
+        cache = ResultCache(self.path)
+        values = {"big": 3**100_000, "neg": -(2**70), "zero": 0, "float": -1.5e-300}
+        for key, value in values.items():
+            cache.put(key, value)
+        cache.close()
+        cache = ResultCache(self.path)
+        for key, value in values.items():
+            self.assertEqual(cache.get(key), value)
+            self.assertIs(type(cache.get(key)), type(value))
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual(cache.info()["entries"], 4)
+
+    def test_least_recently_used_are_evicted(self):
+        cache = ResultCache(self.path, max_bytes=3000)
+        for i in range(3):
+            cache.put(f"k{i}", 2 ** (8 * 900) + i)  # about 900 bytes each
+        cache.get("k0")
+        cache.put("k3", 2 ** (8 * 900))
+        self.assertIsNotNone(cache.get("k0"))
+        self.assertIsNone(cache.get("k1"))
+        self.assertLessEqual(cache.info()["bytes"], 3000)
+
+    def test_expensive_pure_results_are_reused_across_sessions(self):
+        core.set_result_cache(ResultCache(self.path))
+        expr = "factorial(30000) % 1000003"
+        value = evaluate_expression(expr, {})
+        core.set_result_cache(ResultCache(self.path))
+        self.assertEqual(evaluate_expression("factorial( 30000 )%1000003", {}), value)
+        self.assertEqual(core.result_cache().info()["hits"], 1)
+
+    def test_expressions_with_variables_are_not_stored(self):
+        cache = ResultCache(self.path)
+        core.set_result_cache(cache)
+        evaluate_expression("integrate(x^2, x, 0, k)", {"k": 3})
+        evaluate_expression("sqrt(k)", {"k": 3})
+        self.assertEqual(cache.info()["entries"], 0)
+
+    def test_lookups_do_not_parse_again(self):
+        core.set_result_cache(ResultCache(self.path))
+        expr = "factorial(3000) % 1000003"
+        value = evaluate_expression(expr, {})
+        with mock.patch.object(core, "parse_expression") as parse:
+            self.assertEqual(evaluate_expression(expr, {}), value)
+        parse.assert_not_called()
+
+    def test_user_functions_defined_later_are_not_stored(self):
+        cache = ResultCache(self.path)
+        core.set_result_cache(cache)
+        self.addCleanup(userfuncs.restore, [])
+        with mock.patch.object(core, "RESULT_CACHE_MIN_SECONDS", 0):
+            with self.assertRaises(ValueError):
+                evaluate_expression("f(2)", {})
+            core.process_assignment("f(x) = x + 1", {})
+            self.assertEqual(evaluate_expression("f(2)", {}), 3)
+            core.process_assignment("f(x) = x + 2", {})
+            self.assertEqual(evaluate_expression("f(2)", {}), 4)
+        self.assertEqual(cache.info()["entries"], 0)
+
+
+class AnswerTestCase(unittest.TestCase):
+
+    def test_ans_and_underscore(self):
+        out = io.StringIO()
+        run_batch(["6 * 7\n", "ans + 1; _ * 2\n", "x = 5\n", "ans^2\n"], out)
+        self.assertEqual(out.getvalue(), "42\n43\n86\nx = 5\n25\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import unittest
+from lemma_calc import core
+from lemma_calc.client import CalcClient
+from lemma_calc.sandbox import SandboxWorker
+from lemma_calc.server import CalcServer
+
+
+class ServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = CalcServer()
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            listener = self.loop.run_until_complete(self.server.start("127.0.0.1:0"))
+            self.port = listener.sockets[0].getsockname()[1]
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait(5)
+        self.client = CalcClient(f"127.0.0.1:{self.port}", session=True)
+
+    def tearDown(self):
+        self.client.close()
+
+        async def shutdown():
+            self.server.close()
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+    def test_session_keeps_variables(self):
+        self.assertEqual(self.client.eval("x = 3")["result"], "x = 3")
+        self.assertEqual(self.client.eval("x^2")["value"], 9)
+        status, body = self.client.request("GET", f"/sessions/{self.client.session}")
+        self.assertEqual((status, body["variables"]), (200, {"x": "3"}))
+
+    def test_sessions_are_separate(self):
+        self.client.eval("x = 3")
+        with CalcClient(f"127.0.0.1:{self.port}", session=True) as other:
+            self.assertIn("Unknown variable", other.eval("x")["error"])
+
+    def test_batch(self):
+        exprs = ["y = 2"] + [f"y * {i}" for i in range(1000)] + ["1/0"]
+        response = self.client.batch(exprs)
+        self.assertEqual(response["errors"], 1)
+        self.assertEqual(len(response["results"]), 1002)
+        self.assertEqual(response["results"][500]["value"], 998)
+        self.assertIn("division by zero", response["results"][-1]["error"])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.request("GET", "/nope")[0], 404)
+        self.assertEqual(self.client.request("GET", "/eval")[0], 405)
+        self.assertEqual(self.client.request("POST", "/eval", {"expr": 1})[0], 400)
+        status, _ = self.client.request("POST", "/eval", {"expr": "1", "session": "x"})
+        self.assertEqual(status, 404)
+        # The connection is still usable after errors
+        self.assertEqual(self.client.eval("1 + 1")["value"], 2)
+
+    def test_busy_server_answers_503(self):
+        self.server.max_pending = 0
+        status, body = self.client.request("POST", "/eval", {"expr": "1"})
+        self.assertEqual(status, 503)
+        self.assertIn("busy", body["error"])
+
+    def test_sandbox_stops_runaway_expressions(self):
+        worker = SandboxWorker(timeout=0.001)
+        core.set_sandbox(worker)
+        self.addCleanup(core.set_sandbox, None)
+        self.addCleanup(worker.close)
+        record = self.client.eval("factorial(240000) % 7")
+        self.assertIn("Resource error: evaluation took", record["error"])
+        # The session and its functions carry on in a fresh worker
+        worker.timeout = 5.0
+        self.client.eval("f(x) = x^2")
+        self.assertEqual(self.client.eval("f(3)")["value"], 9)
+        with CalcClient(f"127.0.0.1:{self.port}", session=True) as other:
+            other.eval("f(x) = x + 1")
+            self.assertEqual(other.eval("f(3)")["value"], 4)
+        self.assertEqual(self.client.eval("f(3)")["value"], 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import io
+import os
+import tempfile
+import time
+import unittest
+from lemma_calc import core
+from lemma_calc.batch import run_batch
+from lemma_calc.core import evaluate_expression, process_assignment
+from lemma_calc.reactive import DependencyGraph
+from lemma_calc.snapshot import (
+    LazyVariables,
+    load_snapshot,
+    save_snapshot,
+    session_path,
+)
+from lemma_calc.table import table
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "session.lcs")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def round_trip(self, variables, graph=None):
+        save_snapshot(self.path, variables, graph)
+        return load_snapshot(self.path)
+
+    def test_values_round_trip(self):
+        variables = {
+            "a": 5,
+            "neg": -(2**63),
+            "b": 2.5,
+            "tiny": -1e-300,
+            "big": 3**10_000,
+            "negbig": -(2**64),
+        }
+        restored = self.round_trip(variables).variables
+        restored.load_all()
+        self.assertEqual(dict(restored), variables)
+        self.assertIsInstance(restored["a"], int)
+        self.assertIsInstance(restored["b"], float)
+
+    def test_big_values_load_on_first_use(self):
+        restored = self.round_trip({"x": 2, "big": 7**5000}).variables
+        self.assertEqual(set(restored.pending), {"big"})
+        self.assertNotIn("big", dict(restored))
+        self.assertIn("big", restored)
+        self.assertEqual(
+            evaluate_expression("big % 1000 + x", restored), 7**5000 % 1000 + 2
+        )
+        self.assertEqual(restored.pending, {})
+
+    def test_copies_see_lazy_values(self):
+        restored = self.round_trip({"big": 10**30, "n": 3}).variables
+        self.assertEqual(
+            evaluate_expression("integrate(big / 10^30, t, 0, n)", restored), 3.0
+        )
+        restored = self.round_trip({"big": 10**30}).variables
+        rows = list(table("big + x", "x", 0, 1, 1, restored))
+        self.assertEqual([value for _, value, _ in rows], [10**30, 10**30 + 1])
+
+    def test_assignment_replaces_pending_value(self):
+        restored = self.round_trip({"big": 10**40}).variables
+        process_assignment("big = 1", restored)
+        self.assertEqual(restored["big"], 1)
+        del restored["big"]
+        self.assertNotIn("big", restored)
+        self.assertIsNone(restored.get("big"))
+
+    def test_other_types_are_skipped(self):
+        saved, skipped = save_snapshot(self.path, {"a": 1, "flag": True, "z": 1j})
+        self.assertEqual((saved, skipped), (2, 1))
+        self.assertEqual(
+            dict(load_snapshot(self.path).variables), {"a": 1, "flag": 1}
+        )
+
+    def test_formulas_are_restored(self):
+        variables = {}
+        graph = DependencyGraph()
+        process_assignment("a = 2", variables, graph)
+        process_assignment("b = a * 10", variables, graph)
+        snapshot = self.round_trip(variables, graph)
+        self.assertEqual(snapshot.graph.sources(), {"a": "2", "b": "a * 10"})
+        variables = snapshot.variables
+        process_assignment("a = 3", variables, snapshot.graph)
+        self.assertEqual(variables["b"], 30)
+
+    def test_compiled_expressions_are_warmed(self):
+        core.clear_compile_cache()
+        evaluate_expression("sqrt(2) + 40", {})
+        save_snapshot(self.path, {})
+        core.clear_compile_cache()
+        self.assertEqual(load_snapshot(self.path).compiled, 1)
+        self.assertIn(("sqrt(2) + 40", ()), core.compile_cache_keys())
+
+    def test_damaged_files_are_refused(self):
+        save_snapshot(self.path, {"a": 1, "big": 10**50})
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for damaged in (b"", b"not a snapshot" * 10, data[:-3], b"X" + data[1:]):
+            with open(self.path, "wb") as f:
+                f.write(damaged)
+            with self.assertRaisesRegex(ValueError, "Snapshot error"):
+                load_snapshot(self.path)
+        # An unknown version
+        with open(self.path, "wb") as f:
+            f.write(data[:8] + b"\x63\x00" + data[10:])
+        with self.assertRaisesRegex(ValueError, "version 99"):
+            load_snapshot(self.path)
+
+    def test_session_names(self):
+        self.assertTrue(session_path("work-1").endswith("work-1.lcs"))
+        for name in ("../etc", "", "a/b", ".hidden"):
+            with self.assertRaises(ValueError):
+                session_path(name)
+
+    def test_large_sessions_restore_quickly(self):
+        variables = {f"v{i}": i for i in range(100_000)}
+        variables.update({f"f{i}": i / 7 for i in range(100_000)})
+        variables.update({f"b{i}": 3**2000 + i for i in range(1_000)})
+        save_snapshot(self.path, variables)
+        start = time.perf_counter()
+        restored = load_snapshot(self.path).variables
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(restored) + len(restored.pending), len(variables))
+        self.assertEqual(restored["b999"], 3**2000 + 999)
+        self.assertLess(elapsed, 1.0)
+
+    def test_lazy_variables_without_pending_values(self):
+        variables = LazyVariables({"a": 1})
+        self.assertEqual(variables.load(["a", "b"]), {})
+        self.assertEqual(core.load_lazy(variables, ["a"]), {})
+        self.assertEqual(core.load_lazy({"a": 1}, ["a"]), {})
+
+    def test_batch_continues_from_variables(self):
+        variables = self.round_trip({"big": 10**20}).variables
+        out = io.StringIO()
+        run_batch(["big + 1\n", "c = 2\n"], out, variables=variables)
+        self.assertEqual(out.getvalue().splitlines()[0], "100,000,000,000,000,000,001")
+        self.assertEqual(variables["c"], 2)
+
+    def test_batch_updates_the_session_formulas(self):
+        variables = {}
+        graph = DependencyGraph()
+        process_assignment("a = 2", variables, graph)
+        process_assignment("b = a * 10", variables, graph)
+        snapshot = self.round_trip(variables, graph)
+        out = io.StringIO()
+        variables, graph = snapshot.variables, snapshot.graph
+        run_batch(["a = 3\n", "b\n"], out, variables=variables, graph=graph)
+        self.assertEqual(out.getvalue().splitlines(), ["a = 3 (updated: b)", "30"])
+        self.assertEqual(self.round_trip(variables, graph).variables["b"], 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from lemma_calc import stats
+from lemma_calc.constants import allowed_names
+from lemma_calc.core import evaluate_expression, format_result, process_assignment
+
+
+class StatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stats.reset()
+        self.addCleanup(stats.reset)
+        self.addCleanup(stats.disable)
+
+    def test_disabled_collects_nothing(self):
+        evaluate_expression("sqrt(16) + 1", {})
+        self.assertEqual(stats.stage_times, {})
+        self.assertEqual(stats.function_calls, {})
+        self.assertFalse(hasattr(allowed_names["sqrt"], "__wrapped__"))
+
+    def test_stages_are_timed(self):
+        stats.enable()
+        variables = {}
+        process_assignment("x = 2", variables)
+        format_result(evaluate_expression("x^3 + 1", variables))
+        for stage in ("preprocess", "parse", "optimize", "compile", "evaluate"):
+            self.assertIn(stage, stats.stage_times)
+        self.assertEqual(stats.stage_times["assignment"][0], 1)
+        self.assertEqual(stats.stage_times["format"][0], 2)
+
+    def test_function_calls_are_counted(self):
+        stats.enable()
+        variables = {"x": 0.5}
+        for _ in range(3):
+            evaluate_expression("sin(x) + sqrt(x)", variables)
+        self.assertEqual(stats.function_calls, {"sin": 3, "sqrt": 3})
+
+    def test_disable_restores_functions(self):
+        sin = allowed_names["sin"]
+        stats.enable()
+        self.assertIsNot(allowed_names["sin"], sin)
+        stats.disable()
+        self.assertIs(allowed_names["sin"], sin)
+        evaluate_expression("sin(1)", {})
+        self.assertEqual(stats.function_calls, {})
+
+    def test_report(self):
+        self.assertIn("No statistics", stats.report())
+        stats.enable()
+        evaluate_expression("sqrt(9)*y", {"y": 2})
+        text = stats.report()
+        self.assertIn("evaluate", text)
+        self.assertIn("function calls: sqrt 1", text)
+        self.assertIn("compile cache:", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
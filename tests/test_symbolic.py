@@ -0,0 +1,153 @@
+import ast
+import math
+import unittest
+from lemma_calc import symbolic
+from lemma_calc.core import evaluate_expression, parse_expression
+from lemma_calc.preprocessor import preprocess_expression
+from lemma_calc.symbolic import derivative, find_root
+
+
+def slope(expr, x, var="x"):
+    tree = derivative(parse_expression(expr), var)
+    return evaluate_expression(ast.unparse(tree), {var: x})
+
+
+class DerivativeTestCase(unittest.TestCase):
+
+    def test_matches_finite_differences(self):
+        exprs = [
+            "x^3 - 2x",
+            "sin(x) * cos(x)",
+            "exp(-x^2 / 2) / sqrt(2pi)",
+            "log(x, 2) + log10(x) + log(x)",
+            "x^x",
+            "2^x",
+            "atan(x) + asin(x / 4) + acos(x / 4) + tan(x)",
+            "abs(1 - x) / (1 + x^2)",
+            "degrees(x) + radians(x)",
+        ]
+        h = 1e-6
+        for expr in exprs:
+            with self.subTest(expr=expr):
+                x = 1.3
+                numeric = (
+                    evaluate_expression(expr, {"x": x + h})
+                    - evaluate_expression(expr, {"x": x - h})
+                ) / (2 * h)
+                self.assertAlmostEqual(slope(expr, x), numeric, places=5)
+
+    def test_simplifies_constants_away(self):
+        tree = derivative(parse_expression("3x^2 + k"), "x")
+        self.assertEqual(ast.unparse(tree), "3 * (2 * x)")
+        self.assertEqual(ast.unparse(derivative(parse_expression("k * y"), "x")), "0")
+
+    def test_cached_per_expression(self):
+        tree = parse_expression("x^5 + x")
+        self.assertIs(derivative(tree, "x"), derivative(parse_expression("x^5 + x"), "x"))
+        self.assertIsNot(derivative(tree, "x"), derivative(tree, "y"))
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            derivative(parse_expression("factorial(x)"), "x")
+        with self.assertRaises(ValueError):
+            derivative(parse_expression("integrate(t, t, 0, x)"), "x")
+
+    def test_calls_follow_the_function_table(self):
+        tree = parse_expression("k(x) + x")
+        # Not a function: implicit multiplication k*x
+        self.assertEqual(ast.unparse(derivative(tree, "x")), "k + 1")
+        with self.assertRaises(ValueError):
+            derivative(tree, "x", dict(symbolic.allowed_names, k=abs))
+
+
+class FindRootTestCase(unittest.TestCase):
+
+    def test_newton_with_derivative(self):
+        calls = []
+
+        def f(x):
+            calls.append(x)
+            return x * x - 2
+
+        root = find_root(f, lambda x: 2 * x, 1.0)
+        self.assertAlmostEqual(root, math.sqrt(2), places=15)
+        self.assertLess(len(calls), 10)
+
+    def test_brent_without_derivative(self):
+        self.assertAlmostEqual(find_root(math.cos, None, 1.0), math.pi / 2, places=14)
+        self.assertAlmostEqual(
+            find_root(lambda x: x**3 - 8, None, bracket=(0, 5)), 2, places=14
+        )
+
+    def test_no_root(self):
+        with self.assertRaises(ValueError):
+            find_root(lambda x: x * x + 1, lambda x: 2 * x, 1.0)
+        with self.assertRaises(ValueError):
+            find_root(lambda x: x * x + 1, None, bracket=(-1, 1))
+        # A pole is not a root (and the iteration may land right on it)
+        with self.assertRaises((ValueError, ZeroDivisionError)):
+            find_root(lambda x: 1 / x, None, bracket=(-1, 2))
+        with self.assertRaises(ValueError):
+            find_root(lambda x: 1 / (x - 0.3), None, bracket=(-1, 2))
+        with self.assertRaises(ValueError):
+            find_root(lambda x: math.floor(x) - 0.5, None, bracket=(0.3, 1.7))
+
+    def test_underflow_is_not_a_root(self):
+        # exp(x) reaches 0.0 only by underflowing, left of about -745
+        with self.assertRaises(ValueError):
+            find_root(math.exp, None, 1.0)
+        with self.assertRaises(ValueError):
+            find_root(math.exp, math.exp, -720.0)
+        # Zeros reached without underflow still count
+        self.assertEqual(find_root(lambda x: max(x, 0), None, 1.0), -0.28)
+        self.assertLess(abs(find_root(lambda x: x * x, lambda x: 2 * x, 1.0)), 1e-15)
+
+
+class SolveTestCase(unittest.TestCase):
+
+    def test_equations_inside_calls(self):
+        self.assertEqual(preprocess_expression("solve(x^2 = 2, x)"), "solve(x**2==2,x)")
+        self.assertEqual(preprocess_expression("x = 2"), "x=2")
+        self.assertEqual(preprocess_expression("f(x == 2)"), "f(x==2)")
+
+    def test_solve_and_root(self):
+        cases = {
+            "solve(x^2 = 2, x)": math.sqrt(2),
+            "solve(exp(x) = 10, x, 0)": math.log(10),
+            "solve(x^3 - 2x = 5, x)": 2.0945514815423265,
+            "root(cos(x) - x, x, 1)": 0.7390851332151607,
+            "root(x^2 - 4, x, 0, 5)": 2,
+            "solve(abs(x) = 3, x, -1)": -3,
+        }
+        for expr, expected in cases.items():
+            with self.subTest(expr=expr):
+                self.assertAlmostEqual(evaluate_expression(expr, {}), expected, places=12)
+
+    def test_parameters_and_scope(self):
+        for a in (2, 9, 16):
+            self.assertAlmostEqual(
+                evaluate_expression("solve(x^2 = a, x) + x", {"a": a, "x": 100}),
+                math.sqrt(a) + 100,
+            )
+
+    def test_errors(self):
+        for expr in (
+            "solve(x^2 = -1, x)",
+            "solve(x < 2, x)",
+            "solve(x = y, x)",
+            "solve(x = 2, 3)",
+            "root(x, x, 1, 2, 3)",
+            "solve(exp(x) = 0, x)",
+        ):
+            with self.subTest(expr=expr), self.assertRaises(ValueError):
+                evaluate_expression(expr, {})
+
+    def test_without_a_derivative(self):
+        self.assertEqual(evaluate_expression("solve(factorial(n) = 120, n, 5)", {}), 5)
+        self.assertAlmostEqual(
+            evaluate_expression("solve(integrate(t, t, 0, x) = 2, x)", {}), 2
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
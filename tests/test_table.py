@@ -0,0 +1,83 @@
+import io
+import os
+import tempfile
+import tracemalloc
+import unittest
+from lemma_calc.table import grid, parse_table_command, run_table_command, table
+
+
+class GridTestCase(unittest.TestCase):
+
+    def test_integer_grid(self):
+        self.assertEqual(list(grid(1, 5)), [1, 2, 3, 4, 5])
+        self.assertEqual(list(grid(5, 1, -2)), [5, 3, 1])
+
+    def test_float_grid_includes_end(self):
+        points = list(grid(0, 1, 0.1))
+        self.assertEqual(len(points), 11)
+        self.assertAlmostEqual(points[-1], 1.0)
+        self.assertEqual(points[3], 3 * 0.1)
+
+    def test_bad_steps(self):
+        with self.assertRaises(ValueError):
+            grid(0, 1, 0)
+        with self.assertRaises(ValueError):
+            grid(0, 1, -1)
+
+
+class TableTestCase(unittest.TestCase):
+
+    def test_rows_use_variables_and_report_errors(self):
+        rows = list(table("a / x", "x", -1, 1, variables={"a": 2}))
+        self.assertEqual(rows[0], (-1, -2.0, None))
+        self.assertEqual(rows[1][:2], (0, None))
+        self.assertIn("division by zero", rows[1][2])
+        self.assertEqual(rows[2], (1, 2.0, None))
+
+    def test_rows_are_streamed(self):
+        rows = table("x^2", "x", 1, 10**12)
+        self.assertEqual(next(rows), (1, 1, None))
+        self.assertEqual(next(rows), (2, 4, None))
+
+    def test_constant_memory(self):
+        tracemalloc.start()
+        try:
+            rows = table("x^2 + 1", "x", 0, 50_000)
+            for _ in rows:
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 100_000)
+
+    def test_shadowing_a_constant(self):
+        rows = list(table("e + 1", "e", 1, 2))
+        self.assertEqual([value for _, value, _ in rows], [2, 3])
+
+    def test_parse_command(self):
+        parsed = parse_table_command("table sin(x) for x in 0..2pi step pi/2", {})
+        self.assertEqual(parsed[:2], ("sin(x)", "x"))
+        self.assertEqual(parsed[2], 0)
+        self.assertAlmostEqual(parsed[4], 1.5707963267948966)
+        with self.assertRaises(ValueError):
+            parse_table_command("table sin(x)", {})
+
+    def test_text_output(self):
+        out = io.StringIO()
+        self.assertEqual(run_table_command("table x! for x in 3..5", {}, out), 3)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ["x", "x!"])
+        self.assertEqual(lines[3].split(), ["5", "120"])
+
+    def test_csv_output(self):
+        path = os.path.join(tempfile.mkdtemp(), "out.csv")
+        self.assertEqual(run_table_command(f"table 1/x for x in 0..2 > {path}", {}), 3)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], "x,1/x,error")
+        self.assertEqual(lines[1], "0,,Math error: division by zero is undefined.")
+        self.assertEqual(lines[3], "2,0.5,")
+
+
+if __name__ == "__main__":
+    unittest.main()
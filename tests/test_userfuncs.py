@@ -0,0 +1,196 @@
+import os
+import tempfile
+import unittest
+from lemma_calc import core, stats, userfuncs
+from lemma_calc.batch import evaluate_statement
+from lemma_calc.constants import allowed_names, user_functions
+from lemma_calc.core import evaluate_expression, process_assignment, split_definition
+from lemma_calc.result_cache import ResultCache
+from lemma_calc.sandbox import SandboxWorker
+from lemma_calc.snapshot import load_snapshot, save_snapshot
+from lemma_calc.vectorized import evaluate_many
+
+MEMO_SIZE = userfuncs.MEMO_SIZE
+
+
+class UserFunctionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = {}
+
+    def tearDown(self):
+        userfuncs.restore([])
+        userfuncs.set_memo_size(MEMO_SIZE)
+        core.set_engine("closure")
+
+    def define(self, expr):
+        return process_assignment(expr, self.variables)
+
+    def evaluate(self, expr):
+        return evaluate_expression(expr, self.variables)
+
+    def test_split_definition(self):
+        self.assertEqual(split_definition("f(x) = x^2"), ("f", ["x"], "x^2"))
+        self.assertEqual(
+            split_definition(" g ( a , b )= a + b"), ("g", ["a", "b"], "a + b")
+        )
+        for expr in ("f(x) == 3", "f(2) = 3", "x = 3", "solve(x^2 = 2, x)"):
+            self.assertIsNone(split_definition(expr))
+
+    def test_define_and_call(self):
+        self.assertEqual(self.define("f(x) = x^2 + 3x"), "f(x) = x^2 + 3x")
+        self.assertIs(allowed_names["f"], user_functions["f"])
+        self.assertEqual(self.evaluate("f(2)"), 10)
+        self.assertEqual(self.evaluate("f(f(1)) + 1"), 29)
+        self.define("g(a, b) = a * b - 1")
+        self.assertEqual(self.evaluate("g(3, 4)"), 11)
+
+    def test_recursion_is_memoized(self):
+        self.define("fib(n) = if(n < 2, n, fib(n - 1) + fib(n - 2))")
+        self.assertEqual(self.evaluate("fib(90)"), 2880067194370816120)
+        info = userfuncs.memo_info()["fib"]
+        self.assertEqual(info["misses"], 91)
+        self.evaluate("fib(90)")
+        self.assertEqual(userfuncs.memo_info()["fib"]["misses"], 91)
+
+    def test_memoization_can_be_turned_off(self):
+        userfuncs.set_memo_size(0)
+        self.define("fib(n) = if(n < 2, n, fib(n - 1) + fib(n - 2))")
+        self.assertEqual(self.evaluate("fib(15)"), 610)
+        self.assertEqual(userfuncs.memo_info(), {})
+
+    def test_integer_and_float_arguments_are_memoized_apart(self):
+        self.define("h(x) = x / 1")
+        self.assertEqual(self.evaluate("h(2)"), 2.0)
+        self.define("k(x) = x * 1")
+        self.assertIsInstance(self.evaluate("k(2)"), int)
+        self.assertIsInstance(self.evaluate("k(2.0)"), float)
+
+    def test_variables_are_captured_when_defined(self):
+        self.define("a = 5")
+        self.define("f(x) = a * x")
+        self.define("a = 100")
+        self.assertEqual(self.evaluate("f(2)"), 10)
+        with self.assertRaisesRegex(ValueError, "Unknown variable or identifier b"):
+            self.define("g(x) = b * x")
+        self.assertNotIn("g", allowed_names)
+
+    def test_redefinition_reaches_callers_and_cached_expressions(self):
+        self.define("f(x) = x + 1")
+        self.define("g(x) = 2f(x)")
+        self.assertEqual(self.evaluate("g(1) + f(0)"), 5)
+        self.define("f(x) = x + 10")
+        self.assertEqual(self.evaluate("g(1) + f(0)"), 32)
+
+    def test_parameters_shadow_constants(self):
+        self.define("f(e) = e + 1")
+        self.assertEqual(self.evaluate("f(1)"), 2)
+
+    def test_invalid_definitions(self):
+        for expr, message in (
+            ("sin(x) = x", "built in"),
+            ("integrate(x) = x", "built in"),
+            ("pi(x) = x", "built in"),
+            ("f(x, x) = x", "repeated parameter"),
+            ("f(x) = x +", "Syntax error"),
+        ):
+            with self.assertRaisesRegex(ValueError, message):
+                self.define(expr)
+        self.assertEqual(user_functions, {})
+
+    def test_call_depth_is_limited(self):
+        userfuncs.set_memo_size(0)
+        self.define("s(n) = if(n == 0, 0, 1 + s(n - 1))")
+        self.assertEqual(self.evaluate(f"s({userfuncs.MAX_CALL_DEPTH - 1})"), 99)
+        with self.assertRaisesRegex(ValueError, "Function error: more than"):
+            self.evaluate(f"s({userfuncs.MAX_CALL_DEPTH})")
+        # The depth is reset after the error
+        self.assertEqual(self.evaluate("s(3)"), 3)
+
+    def test_wrong_argument_count(self):
+        self.define("f(x) = x")
+        with self.assertRaisesRegex(ValueError, r"f\(\) takes 1 argument"):
+            self.evaluate("f(1, 2)")
+
+    def test_comparisons_and_if(self):
+        self.assertEqual(self.evaluate("1 < 2 < 3"), True)
+        self.assertEqual(self.evaluate("3 > 2 > 2"), False)
+        self.assertIsNone(process_assignment("x == 3", self.variables))
+        self.assertEqual(self.evaluate("if(2 >= 1, 10, 1/0)"), 10)
+        with self.assertRaisesRegex(ValueError, "takes 3 arguments"):
+            self.evaluate("if(1, 2)")
+
+    def test_walker_engine(self):
+        core.set_engine("walker")
+        self.define("fact(n) = if(n <= 1, 1, n * fact(n - 1))")
+        self.assertEqual(self.evaluate("fact(20)"), 2432902008176640000)
+        self.assertEqual(self.evaluate("1 <= 1 != 2"), True)
+
+    def test_stats_report_memo_counters(self):
+        self.define("f(x) = x + 1")
+        stats.enable()
+        try:
+            self.evaluate("f(1)")
+            self.evaluate("f(1)")
+            report = stats.report()
+        finally:
+            stats.disable()
+            stats.reset()
+        self.assertIn("function memo: f 1 hits, 1 misses", report)
+        self.assertIn("f 2", report)  # call counts
+        self.assertIs(allowed_names["f"], user_functions["f"])
+
+    def test_batch_definitions(self):
+        record = evaluate_statement("sq(x) = x^2", self.variables)
+        self.assertEqual(record, {"expr": "sq(x) = x^2", "result": "sq(x) = x^2"})
+        self.assertEqual(evaluate_statement("sq(4)", self.variables)["value"], 16)
+
+    def test_vectorized(self):
+        self.define("f(x) = x^2 + 1")
+        self.assertEqual(list(evaluate_many("f(x)", {"x": [1, 2, 3]})), [2, 5, 10])
+        self.define("f(x) = x")
+        self.assertEqual(list(evaluate_many("f(x)", {"x": [1, 2, 3]})), [1, 2, 3])
+        self.assertAlmostEqual(self.evaluate("integrate(f(t), t, 0, 1)"), 0.5)
+
+    def test_results_are_not_cached_across_definitions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResultCache(os.path.join(tmp, "results.sqlite"))
+            core.set_result_cache(cache)
+            try:
+                self.define("f(x) = x + 1")
+                self.assertEqual(self.evaluate("f(1)"), 2)
+                self.define("f(x) = x + 2")
+                self.assertEqual(self.evaluate("f(1)"), 3)
+            finally:
+                core.set_result_cache(None)
+                cache.close()
+
+    def test_snapshot_round_trip(self):
+        self.define("a = 2")
+        self.define("h(x) = x")
+        self.define("f(x) = a * h(x) + 1")
+        self.define("g(x) = x + 1")
+        # h now calls a function defined after it
+        self.define("h(x) = g(x)")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "s.lcs")
+            save_snapshot(path, self.variables)
+            userfuncs.restore([])
+            self.assertNotIn("f", allowed_names)
+            variables = load_snapshot(path).variables
+        self.assertEqual(evaluate_expression("f(1)", variables), 5)
+        self.assertEqual(list(user_functions), ["h", "f", "g"])
+
+    def test_sandbox_receives_definitions(self):
+        worker = SandboxWorker(timeout=10)
+        try:
+            self.define("f(x) = x * 3")
+            self.assertEqual(worker.evaluate("f(2)", self.variables), 6)
+            self.define("f(x) = x * 4")
+            self.assertEqual(worker.evaluate("f(2)", self.variables), 8)
+        finally:
+            worker.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from lemma_calc import vectorized
+from lemma_calc.core import evaluate_expression
+from lemma_calc.vectorized import evaluate_many
+
+
+class PurePythonFallbackTestCase(unittest.TestCase):
+
+    def test_matches_scalar_evaluation(self):
+        xs = [0, 1, 2, 3, 4]
+        expected = [evaluate_expression("x^2 + factorial(x)", {"x": x}) for x in xs]
+        self.assertEqual(
+            evaluate_many("x^2 + factorial(x)", {"x": xs}, use_numpy=False), expected
+        )
+
+    def test_scalars_are_broadcast(self):
+        self.assertEqual(
+            evaluate_many("x * k", {"x": [1, 2, 3], "k": 10}, use_numpy=False),
+            [10, 20, 30],
+        )
+
+    def test_mismatched_lengths(self):
+        with self.assertRaises(ValueError):
+            evaluate_many("x + y", {"x": [1, 2], "y": [1, 2, 3]}, use_numpy=False)
+
+
+@unittest.skipIf(vectorized.np is None, "NumPy is not installed")
+class NumpyEvaluationTestCase(unittest.TestCase):
+
+    def test_ufuncs_match_scalar_evaluation(self):
+        np = vectorized.np
+        xs = np.linspace(0.1, 3.0, 50)
+        expr = "sqrt(x) + sin(x)^2 + log(x, 2) + exp(-x) + floor(x) + abs(1 - x)"
+        result = evaluate_many(expr, {"x": xs})
+        for x, value in zip(xs, result):
+            self.assertAlmostEqual(value, evaluate_expression(expr, {"x": float(x)}))
+
+    def test_factorial_falls_back_per_element(self):
+        np = vectorized.np
+        result = evaluate_many("factorial(n) + n^2", {"n": np.arange(5)})
+        self.assertEqual(list(result), [1, 2, 6, 15, 40])
+        with self.assertRaises(ValueError):
+            evaluate_many("factorial(n - 2)", {"n": np.arange(5)})
+
+    def test_division_by_zero(self):
+        np = vectorized.np
+        with self.assertRaises(ValueError):
+            evaluate_many("1 / x", {"x": np.arange(3)})
+
+
+if __name__ == "__main__":
+    unittest.main()